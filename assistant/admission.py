@@ -0,0 +1,98 @@
+"""Controle de admissão das execuções do agente no orquestrador."""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from assistant.latency import percentile
+
+
+class AdmissionRejected(Exception):
+    """O job não pôde ser admitido (fila cheia ou prazo de espera esgotado)."""
+
+
+class AdmissionController:
+    """
+    Limita quantas execuções do grafo rodam ao mesmo tempo.
+
+    Jobs acima do limite esperam numa fila limitada. Um job é rejeitado na hora
+    se a fila estiver cheia, ou quando seu prazo de espera expira antes de
+    conseguir uma vaga, para que o cliente receba "ocupado" rapidamente em vez
+    de esperar uma resposta que chegaria tarde demais.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait_seconds: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Tempos de espera recentes (s), para os percentis expostos em stats()
+        self._wait_times: deque[float] = deque(maxlen=1000)
+
+    @asynccontextmanager
+    async def slot(self, deadline: float | None = None) -> AsyncIterator[None]:
+        """
+        Aguarda uma vaga para executar o agente. ``deadline`` é um instante de
+        ``time.monotonic()``; sem ele, vale ``max_wait_seconds`` a partir de agora.
+        """
+        enqueued_at = time.monotonic()
+        if deadline is None:
+            deadline = enqueued_at + self.max_wait_seconds
+
+        if self._semaphore.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected("Fila de espera cheia.")
+
+        self.waiting += 1
+        # O acquire roda numa task própria: no Python 3.11, wait_for pode expirar
+        # (ou ser cancelado) depois de o acquire já ter pegado a vaga, que nunca
+        # seria devolvida. Aqui a vaga é conferida e devolvida explicitamente.
+        acquire = asyncio.ensure_future(self._semaphore.acquire())
+        admitted = False
+        try:
+            await asyncio.wait({acquire}, timeout=max(0.0, deadline - enqueued_at))
+            admitted = acquire.done()
+        finally:
+            self.waiting -= 1
+            if not admitted:
+                self._give_back(acquire)
+        if not admitted:
+            self.rejected += 1
+            raise AdmissionRejected("Prazo de espera por uma vaga esgotado.")
+
+        self._wait_times.append(time.monotonic() - enqueued_at)
+        self.admitted += 1
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    def _give_back(self, acquire: asyncio.Future) -> None:
+        """Desiste de um acquire: cancela se ainda espera, devolve a vaga se já a pegou."""
+        if not acquire.done():
+            # O Semaphore devolve sozinho a vaga que chegou junto com o cancelamento
+            acquire.cancel()
+        elif not acquire.cancelled() and acquire.exception() is None:
+            self._semaphore.release()
+
+    def stats(self) -> dict[str, float | int]:
+        waits = sorted(self._wait_times)
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_p50_seconds": round(percentile(waits, 0.50), 4),
+            "wait_p95_seconds": round(percentile(waits, 0.95), 4),
+            "wait_max_seconds": round(waits[-1], 4) if waits else 0.0,
+        }
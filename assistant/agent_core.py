@@ -8,6 +8,7 @@ from langchain.chat_models.base import BaseChatModel
 from langchain.memory import ConversationBufferMemory
 from langchain.prompts import MessagesPlaceholder
 from langchain_community.chat_models import ChatOllama
+from langchain_community.embeddings import OllamaEmbeddings
 
 from config.settings import settings
 from tools.__all_tools__ import get_all_tools
@@ -27,6 +28,10 @@ def get_llm() -> BaseChatModel:
         temperature=settings.llm.temperature,
     )
 
+def get_embeddings(model: str = "") -> OllamaEmbeddings:
+    """Embeddings servidos pelo Ollama; ``model`` vazio usa o modelo do LLM."""
+    return OllamaEmbeddings(model=model or settings.llm.model, base_url=str(settings.llm.base_url))
+
 def get_agent_graph():
     """Retorna o grafo de agente compilado."""
     # O grafo já é compilado na importação, então apenas o retornamos.
@@ -1,32 +1,115 @@
 from __future__ import annotations
 
+import asyncio
 import operator
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from typing import Annotated, TypedDict, Union, Optional
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_core.agents import AgentAction, AgentFinish
-from langchain_core.messages import BaseMessage
+from langchain_core.messages import AIMessage, BaseMessage, message_chunk_to_message
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import END, StateGraph
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from loguru import logger
 
 from assistant.agent_core import get_llm
-from tools.__all_tools__ import get_all_tools, call_tool
-from database.models import Tool, ToolUsageLog
+from assistant.tool_usage import ToolUsageWriter
+from config.settings import settings
+from database.connection import AsyncSessionLocal
+from tools.__all_tools__ import get_all_tools, get_tool, acall_tool
 
 
 class AgentState(TypedDict):
     """Define o estado do nosso agente. Este estado é passado entre os nós do grafo."""
     messages: Annotated[list[BaseMessage], operator.add]
     sender: str
-    db_session: Optional[Session] = None
+    db_session: Optional[AsyncSession] = None
     message_db_id: Optional[int] = None
 
 
-def create_graph_workflow() -> StateGraph:
-    """Cria e configura o grafo de estados para o agente."""
+class DeadlineExceeded(Exception):
+    """O prazo do job acabou antes de o agente terminar."""
+
+
+def remaining_seconds(config: RunnableConfig) -> float | None:
+    """Tempo que resta até o prazo do job (``deadline`` em ``time.monotonic()``), ou None sem prazo."""
+    deadline = config.get("configurable", {}).get("deadline")
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(config: RunnableConfig, node: str) -> float | None:
+    """Interrompe o grafo se o prazo já acabou; senão retorna o tempo restante."""
+    remaining = remaining_seconds(config)
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded(f"Prazo do job esgotado antes do nó '{node}'.")
+    return remaining
+
+
+# Dito depois da resposta parcial quando o prazo do job acaba
+DEADLINE_REPLY = "Desculpe, não consegui terminar a resposta a tempo."
+
+
+async def ainvoke_until_deadline(
+    graph,
+    graph_input: dict,
+    configurable: dict,
+    deadline: float | None = None,
+    on_token=None,
+) -> tuple[dict, bool]:
+    """
+    Executa o grafo sob o prazo do job (``deadline`` em ``time.monotonic()``).
+
+    Ao expirar, o LLM e as ferramentas em andamento são cancelados e o estado
+    final traz o texto gerado até ali seguido de ``DEADLINE_REPLY``, que
+    também é repassado a ``on_token``. Retorna o estado final e se o prazo
+    esgotou.
+    """
+    # Texto já gerado, para a resposta parcial caso o prazo acabe
+    partial: list[str] = []
+
+    async def collect_token(token: str):
+        partial.append(token)
+        if on_token:
+            await on_token(token)
+
+    configurable = {**configurable, "on_token": collect_token, "deadline": deadline}
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    try:
+        final_state = await asyncio.wait_for(
+            graph.ainvoke(graph_input, {"recursion_limit": 10, "configurable": configurable}), timeout
+        )
+        return final_state, False
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        partial_text = "".join(partial).strip()
+        if on_token:
+            await on_token(f" {DEADLINE_REPLY}" if partial_text else DEADLINE_REPLY)
+        reply = AIMessage(content=f"{partial_text} {DEADLINE_REPLY}".strip())
+        return {"messages": graph_input["messages"] + [reply]}, True
+
+
+def trace_span(config: RunnableConfig, stage: str):
+    """Mede o bloco como uma etapa do job, se o chamador passou ``trace`` no config."""
+    trace = config.get("configurable", {}).get("trace")
+    return trace.span(stage) if trace else nullcontext()
+
+
+# Pool limitado para as ferramentas síncronas, compartilhado por todas as execuções
+tool_executor = ThreadPoolExecutor(
+    max_workers=settings.orchestrator.tool_max_workers, thread_name_prefix="tool"
+)
+
+
+def create_graph_workflow(tools: list | None = None) -> StateGraph:
+    """
+    Cria e configura o grafo de estados para o agente. ``tools`` limita as
+    ferramentas vinculadas ao LLM (padrão: todas).
+    """
     
     llm = get_llm()
-    tools = get_all_tools()
+    tools = get_all_tools() if tools is None else tools
     # Vincula as ferramentas ao LLM para que ele saiba quando e como chamá-las
     tools_as_openai = [convert_to_openai_tool(t) for t in tools]
 
@@ -34,15 +117,30 @@ def create_graph_workflow() -> StateGraph:
     llm_with_tools = llm.bind(tools=tools_as_openai)
     # --- Nós do Grafo ---
 
-    def agent_node(state: AgentState):
-        """Nó principal: invoca o LLM para decidir o próximo passo."""
-        response = llm_with_tools.invoke(state["messages"])
+    async def agent_node(state: AgentState, config: RunnableConfig):
+        """
+        Nó principal: invoca o LLM para decidir o próximo passo.
+
+        A resposta é lida em streaming, sem bloquear o event loop. Se o chamador
+        passar ``on_token`` em ``config["configurable"]``, o texto do turno é
+        repassado a ele quando o turno termina sem chamar ferramentas: o texto
+        que o modelo escreve antes de uma tool_call (preâmbulo, raciocínio) não
+        é a resposta e não deve ser falado.
+        """
+        check_deadline(config, "agent")
+        on_token = config.get("configurable", {}).get("on_token")
+        response = None
+        with trace_span(config, "llm"):
+            async for chunk in llm_with_tools.astream(state["messages"], config):
+                response = chunk if response is None else response + chunk
+        response = message_chunk_to_message(response) if response is not None else AIMessage(content="")
+        if on_token and response.content and not response.tool_calls:
+            await on_token(response.content)
         return {"messages": [response], "sender": "agent"}
 
-    def tool_node(state: AgentState):
-        """Nó de ferramentas: executa a ferramenta e REGISTRA o uso."""
-        tool_outputs = []
-        db = state.get("db_session")
+    async def tool_node(state: AgentState, config: RunnableConfig):
+        """Nó de ferramentas: executa as ferramentas (em paralelo) e REGISTRA o uso."""
+        remaining = check_deadline(config, "tool")
         message_id = state.get("message_db_id")
         last_agent_message = state["messages"][-1]
         tool_calls = last_agent_message.tool_calls
@@ -57,36 +155,30 @@ def create_graph_workflow() -> StateGraph:
                 break # Apenas um feedback é necessário
         # --- FIM DA MODIFICAÇÃO ---
 
-        for tool_call in tool_calls:
-            tool_output = call_tool(tool_call)
-            tool_outputs.append(tool_output)
-
-            # --- LÓGICA DE LOGGING ADICIONADA ---
-            if db and message_id:
-                try:
-                    tool_name = tool_call.get("name")
-                    # Busca o ID da ferramenta no banco de dados
-                    tool_db_entry = db.query(Tool).filter(Tool.name == tool_name).first()
-
-                    if tool_db_entry:
-                        log_entry = ToolUsageLog(
-                            message_id=message_id,
-                            tool_id=tool_db_entry.tool_id,
-                            call_parameters=tool_call.get("args"),
-                            output=str(tool_output.content),
-                            status="success" # Adicionar tratamento de erro para status "error"
-                        )
-                        db.add(log_entry)
-                        db.commit()
-                except Exception as e:
-                    logger.opt(exception=True).error(f"Falha ao registrar uso da ferramenta: {e}")
-                    db.rollback()
-            # --- FIM DA LÓGICA DE LOGGING ---
+        async def run_tool(tool_call: dict):
+            timeout = settings.orchestrator.tool_timeouts.get(
+                tool_call.get("name"), settings.orchestrator.tool_timeout_seconds
+            )
+            # Nenhuma ferramenta pode passar do prazo do job
+            if remaining is not None:
+                timeout = min(timeout, remaining)
+            with trace_span(config, f"tool.{tool_call.get('name')}"):
+                return await acall_tool(tool_call, executor=tool_executor, timeout=timeout)
+
+        # As chamadas são independentes: rodam ao mesmo tempo, cada uma com seu
+        # timeout. gather() devolve os resultados na ordem das tool_calls.
+        with trace_span(config, "tools"):
+            tool_outputs = await asyncio.gather(*(run_tool(tool_call) for tool_call in tool_calls))
+
+        # O registro de uso só é enfileirado; a gravação em lote acontece em segundo plano
+        if message_id:
+            for tool_call, tool_output in zip(tool_calls, tool_outputs):
+                tool_usage_writer.record(message_id, tool_call, tool_output)
         
         # O estado pode ser aumentado para incluir a mensagem de feedback
         # return {"messages": tool_outputs, "sender": "tool", "feedback": feedback_message}
         # Por simplicidade, vamos manter a lógica de TTS apenas no orchestrator por enquanto.
-        return {"messages": tool_outputs, "sender": "tool"}
+        return {"messages": list(tool_outputs), "sender": "tool"}
 
     # --- Arestas Condicionais ---
 
@@ -112,5 +204,31 @@ def create_graph_workflow() -> StateGraph:
 
     return workflow.compile()
 
+# Registros de uso das ferramentas, gravados em lote por uma task iniciada no orquestrador
+tool_usage_writer = ToolUsageWriter(
+    AsyncSessionLocal,
+    batch_size=settings.orchestrator.tool_usage_batch_size,
+    flush_interval_seconds=settings.orchestrator.tool_usage_flush_interval_seconds,
+)
+
 # Compila o grafo na inicialização para ser reutilizado
 app_graph = create_graph_workflow()
+
+# Grafos compilados por conjunto de ferramentas vinculadas (ver ToolRouter)
+_graph_variants: OrderedDict[tuple[str, ...], object] = OrderedDict()
+
+
+def graph_for_tools(tool_names: tuple[str, ...] | None):
+    """Retorna o grafo que vincula só essas ferramentas (None = todas), compilando uma vez por conjunto."""
+    if tool_names is None:
+        return app_graph
+    graph = _graph_variants.get(tool_names)
+    if graph is None:
+        tools = [tool for tool in map(get_tool, tool_names) if tool is not None]
+        graph = _graph_variants[tool_names] = create_graph_workflow(tools)
+        logger.info(f"Grafo do agente compilado para as ferramentas: {', '.join(tool_names) or '(nenhuma)'}")
+        while len(_graph_variants) > settings.orchestrator.tool_graph_variants_max:
+            _graph_variants.popitem(last=False)
+    else:
+        _graph_variants.move_to_end(tool_names)
+    return graph
@@ -4,6 +4,7 @@ import time
 import wave
 from collections import deque
 from pathlib import Path
+from typing import Iterator
 
 import pyaudio
 from loguru import logger
@@ -43,23 +44,22 @@ class AudioManager:
                 logger.success("Wake word detectada!")
                 return
 
-    def record_command(self, output_path: Path, timeout: int = 10, silence_duration_ms: int = 1500) -> None:
-        """Grava o áudio após a wake word até detectar silêncio usando VAD."""
-        logger.info("Gravando comando...")
-        frames = []
-        
+    def capture_command_frames(self, timeout: int = 10, silence_duration_ms: int = 1500) -> Iterator[bytes]:
+        """
+        Lê frames de PCM do microfone após a wake word, entregando cada um assim
+        que é capturado, até o VAD detectar silêncio (ou o timeout).
+        """
         num_silence_frames_needed = int(silence_duration_ms / self.VAD_FRAME_MS)
         consecutive_silent_frames = 0
         
         start_time = time.time()
         
         # Grava um chunk inicial para não perder o início da fala
-        initial_chunk = self.stream.read(self.detector.frame_length)
-        frames.append(initial_chunk)
+        yield self.stream.read(self.detector.frame_length)
         
         while time.time() - start_time < timeout:
             pcm_chunk = self.stream.read(self.detector.frame_length)
-            frames.append(pcm_chunk)
+            yield pcm_chunk
             
             # A lógica agora usa a biblioteca VAD
             is_speech = self.vad.is_speech(pcm_chunk, self.detector.sample_rate)
@@ -71,9 +71,13 @@ class AudioManager:
             
             if consecutive_silent_frames > num_silence_frames_needed:
                 logger.info("Silêncio detectado pelo VAD, finalizando gravação.")
-                break
-        else:
-            logger.warning("Timeout de gravação atingido.")
+                return
+        logger.warning("Timeout de gravação atingido.")
+
+    def record_command(self, output_path: Path, timeout: int = 10, silence_duration_ms: int = 1500) -> None:
+        """Grava o áudio após a wake word até detectar silêncio usando VAD."""
+        logger.info("Gravando comando...")
+        frames = list(self.capture_command_frames(timeout, silence_duration_ms))
 
         logger.success(f"Gravação finalizada. Salvando em {output_path}")
         with wave.open(str(output_path), "wb") as wf:
@@ -0,0 +1,92 @@
+"""Janela de contexto da conversa com orçamento de tokens e resumo incremental."""
+from __future__ import annotations
+
+from typing import Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, SystemMessage
+from loguru import logger
+
+from config.prompts import ROLLING_SUMMARY_PROMPT
+
+# Custo fixo aproximado de cada mensagem no template de chat (papel, delimitadores)
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class ContextWindow:
+    """
+    Decide quais mensagens do histórico cabem no prompt.
+
+    A contagem de tokens é uma estimativa por número de caracteres: não temos o
+    tokenizer do modelo no orquestrador, e a janela só precisa ser aproximada
+    para manter o tamanho do prompt estável.
+    """
+
+    def __init__(self, max_tokens: int, chars_per_token: float = 4.0):
+        self.max_tokens = max_tokens
+        self.chars_per_token = chars_per_token
+
+    def count_text(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + 1
+
+    def count_message(self, message: BaseMessage) -> int:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        return self.count_text(content) + _MESSAGE_OVERHEAD_TOKENS
+
+    def split(
+        self, messages: Sequence[BaseMessage], reserved_tokens: int = 0
+    ) -> tuple[list[BaseMessage], list[BaseMessage]]:
+        """
+        Separa o histórico em (antigas, recentes). As recentes cabem no orçamento
+        (descontados ``reserved_tokens``, ex: system prompt e resumo) e começam
+        sempre numa mensagem do usuário. A última mensagem é sempre mantida.
+        """
+        budget = self.max_tokens - reserved_tokens
+        start = len(messages)
+        used = 0
+        for index in range(len(messages) - 1, -1, -1):
+            tokens = self.count_message(messages[index])
+            if used + tokens > budget and start < len(messages):
+                break
+            used += tokens
+            start = index
+
+        # Não corta um turno ao meio: a janela começa numa mensagem do usuário
+        while start < len(messages) - 1 and messages[start].type != "human":
+            start += 1
+        return list(messages[:start]), list(messages[start:])
+
+
+def turn_context(
+    window: ContextWindow, system_prompt: str, summary: str | None, history: Sequence[BaseMessage]
+) -> tuple[list[BaseMessage], list[BaseMessage]]:
+    """
+    Monta as mensagens de um turno: system prompt, resumo da conversa e o
+    histórico recente que cabe na janela. Retorna (mensagens do turno,
+    mensagens antigas que devem ser incorporadas ao resumo).
+    """
+    messages: list[BaseMessage] = [SystemMessage(content=system_prompt)]
+    if summary:
+        # Mensagem separada: o system prompt continua idêntico entre turnos
+        messages.append(SystemMessage(content=f"Resumo da conversa até aqui:\n{summary}"))
+    reserved_tokens = sum(window.count_message(m) for m in messages)
+    older, recent = window.split(history, reserved_tokens)
+    return messages + recent, older
+
+
+def format_messages(messages: Sequence[BaseMessage]) -> str:
+    """Formata mensagens como diálogo em texto, para o prompt de resumo."""
+    roles = {"human": "Usuário", "ai": "Jarvis"}
+    return "\n".join(f"{roles.get(m.type, m.type)}: {m.content}" for m in messages)
+
+
+async def fold_into_summary(llm: BaseChatModel, previous_summary: str | None, messages: Sequence[BaseMessage]) -> str:
+    """Incorpora mensagens que saíram da janela ao resumo acumulado da sessão."""
+    prompt = ROLLING_SUMMARY_PROMPT.format(
+        previous_summary=previous_summary or "(nenhum)",
+        new_lines=format_messages(messages),
+    )
+    response = await llm.ainvoke(prompt)
+    summary = response.content.strip()
+    logger.debug(f"Resumo da sessão atualizado ({len(summary)} caracteres).")
+    return summary
@@ -0,0 +1,149 @@
+"""Registro de jobs do orquestrador: entrega orientada a eventos para os WebSockets."""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from loguru import logger
+
+
+@dataclass
+class JobEvent:
+    """Um evento destinado ao cliente de um job (chunk de áudio ou mensagem JSON)."""
+    audio: bytes | None = None
+    message: dict[str, Any] | None = None
+    # Último evento do job: o WebSocket é fechado após entregá-lo
+    final: bool = False
+    # Quando o evento foi gerado (para medir a espera até a entrega ao cliente)
+    created_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def size(self) -> int:
+        return len(self.audio) if self.audio else 0
+
+
+@dataclass
+class _JobEntry:
+    queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+    created_at: float = field(default_factory=time.monotonic)
+    attached: bool = False
+    buffered_bytes: int = 0
+    # Dados do job definidos na abertura (ex: a conversa do usuário)
+    context: Any = None
+
+
+class JobRegistry:
+    """
+    Mantém uma fila de eventos por job.
+
+    Resultados que chegam antes do cliente abrir o WebSocket ficam guardados na
+    fila do job até que ele se conecte, limitados por um TTL e por um teto de
+    memória. O handler do WebSocket apenas aguarda a fila, sem polling.
+
+    Só são guardados eventos de jobs abertos neste processo. Eventos atrasados
+    de jobs já liberados (ex: chunks de TTS depois de o cliente desconectar)
+    são descartados; os jobs liberados são lembrados por ``ttl_seconds`` só
+    para distinguir esse caso de um job desconhecido nos logs.
+    """
+
+    def __init__(self, ttl_seconds: float, max_buffered_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_buffered_bytes = max_buffered_bytes
+        self._jobs: dict[str, _JobEntry] = {}
+        self._buffered_bytes = 0
+        # Jobs liberados recentemente -> quando foram liberados
+        self._released: OrderedDict[str, float] = OrderedDict()
+
+    def open(self, job_id: str, context: Any = None) -> None:
+        """Registra um job recém-criado (antes do cliente conectar)."""
+        self._jobs.setdefault(job_id, _JobEntry(context=context))
+
+    def context(self, job_id: str) -> Any:
+        """Os dados passados em ``open`` (None se o job não está registrado)."""
+        entry = self._jobs.get(job_id)
+        return entry.context if entry else None
+
+    def publish(self, job_id: str, event: JobEvent) -> bool:
+        """
+        Entrega um evento ao job, guardando-o se o cliente ainda não conectou.
+        Retorna False (e descarta o evento) se o job não está aberto.
+        """
+        entry = self._jobs.get(job_id)
+        if entry is None:
+            if job_id in self._released:
+                logger.debug(f"[{job_id}] Evento de um job já encerrado descartado.")
+            else:
+                logger.warning(f"[{job_id}] Evento de um job desconhecido descartado.")
+            return False
+        if not entry.attached:
+            entry.buffered_bytes += event.size
+            self._buffered_bytes += event.size
+        entry.queue.put_nowait(event)
+        if self._buffered_bytes > self.max_buffered_bytes:
+            self._evict_oldest()
+        return True
+
+    def attach(self, job_id: str) -> asyncio.Queue:
+        """Associa um WebSocket ao job e retorna a fila com os eventos (inclusive os já recebidos)."""
+        entry = self._jobs.setdefault(job_id, _JobEntry())
+        entry.attached = True
+        self._buffered_bytes -= entry.buffered_bytes
+        entry.buffered_bytes = 0
+        return entry.queue
+
+    def has(self, job_id: str) -> bool:
+        """Se o job está registrado (aberto e com o WebSocket ainda não encerrado)."""
+        return job_id in self._jobs
+
+    def release(self, job_id: str) -> None:
+        """Remove o job do registro (o WebSocket foi fechado)."""
+        entry = self._jobs.pop(job_id, None)
+        if entry is None:
+            return
+        if not entry.attached:
+            self._buffered_bytes -= entry.buffered_bytes
+        self._released[job_id] = time.monotonic()
+        self._released.move_to_end(job_id)
+
+    def purge_expired(self) -> int:
+        """Descarta jobs sem cliente conectado cujo TTL expirou."""
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, entry in self._jobs.items()
+            if not entry.attached and now - entry.created_at > self.ttl_seconds
+        ]
+        for job_id in expired:
+            logger.warning(f"[{job_id}] Cliente não conectou dentro do TTL. Resultados descartados.")
+            self.release(job_id)
+        # Os jobs liberados só são lembrados por um TTL (a lista fica em ordem de liberação)
+        while self._released and now - next(iter(self._released.values())) > self.ttl_seconds:
+            self._released.popitem(last=False)
+        return len(expired)
+
+    async def run_janitor(self, interval_seconds: float = 10.0) -> None:
+        """Loop de limpeza periódica dos jobs expirados."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            self.purge_expired()
+
+    def stats(self) -> dict[str, int]:
+        attached = sum(1 for entry in self._jobs.values() if entry.attached)
+        return {
+            "jobs": len(self._jobs),
+            "attached": attached,
+            "buffered_bytes": self._buffered_bytes,
+        }
+
+    def _evict_oldest(self) -> None:
+        """Descarta os jobs sem cliente mais antigos até voltar ao teto de memória."""
+        pending = sorted(
+            (entry.created_at, job_id) for job_id, entry in self._jobs.items() if not entry.attached
+        )
+        for _, job_id in pending:
+            if self._buffered_bytes <= self.max_buffered_bytes:
+                break
+            logger.warning(f"[{job_id}] Limite de memória do buffer atingido. Resultados descartados.")
+            self.release(job_id)
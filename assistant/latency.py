@@ -0,0 +1,116 @@
+"""Latência por etapa dos jobs de voz: spans por job e histogramas por etapa."""
+from __future__ import annotations
+
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+# Limites superiores (ms) dos buckets do histograma de cada etapa
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class StageStats:
+    """Histograma e amostras recentes (para percentis) de uma etapa."""
+
+    def __init__(self, max_samples: int):
+        self.count = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._queue: deque[float] = deque(maxlen=max_samples)
+        self._service: deque[float] = deque(maxlen=max_samples)
+
+    def observe(self, queue_ms: float, service_ms: float) -> None:
+        self.count += 1
+        total = queue_ms + service_ms
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if total <= bound), len(LATENCY_BUCKETS_MS))
+        self.buckets[index] += 1
+        self._queue.append(queue_ms)
+        self._service.append(service_ms)
+
+    def snapshot(self) -> dict[str, Any]:
+        result: dict[str, Any] = {"count": self.count}
+        for name, samples in (("queue", self._queue), ("service", self._service)):
+            values = sorted(samples)
+            for label, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+                result[f"{name}_{label}_ms"] = round(percentile(values, fraction), 1)
+        bounds = [str(bound) for bound in LATENCY_BUCKETS_MS] + ["+Inf"]
+        result["histogram_ms"] = dict(zip(bounds, self.buckets))
+        return result
+
+
+class JobTrace:
+    """Spans de um job, na ordem em que as etapas terminaram."""
+
+    def __init__(self, tracker: LatencyTracker, job_id: str):
+        self.tracker = tracker
+        self.job_id = job_id
+        self.started_at = time.monotonic()
+        self.spans: list[dict[str, Any]] = []
+
+    def add(self, stage: str, service_ms: float, queue_ms: float = 0.0) -> None:
+        self.tracker.record(self.job_id, stage, service_ms, queue_ms)
+
+    @contextmanager
+    def span(self, stage: str, queue_ms: float = 0.0) -> Iterator[None]:
+        """Mede o tempo de serviço do bloco como uma etapa do job."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - start) * 1000, queue_ms)
+
+    def breakdown(self) -> dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "elapsed_ms": round((time.monotonic() - self.started_at) * 1000, 1),
+            "stages": list(self.spans),
+        }
+
+
+class LatencyTracker:
+    """
+    Registra a latência de cada etapa dos jobs.
+
+    Cada etapa tem tempo de espera na fila e tempo de serviço. Os spans
+    alimentam os histogramas por etapa e, enquanto o job está ativo, o
+    detalhamento por job (limitado a ``max_jobs`` jobs recentes).
+    """
+
+    def __init__(self, max_jobs: int = 1000, samples_per_stage: int = 1000):
+        self.max_jobs = max_jobs
+        self.samples_per_stage = samples_per_stage
+        self._jobs: OrderedDict[str, JobTrace] = OrderedDict()
+        self._stages: dict[str, StageStats] = {}
+
+    def start(self, job_id: str) -> JobTrace:
+        trace = self._jobs[job_id] = JobTrace(self, job_id)
+        while len(self._jobs) > self.max_jobs:
+            self._jobs.popitem(last=False)
+        return trace
+
+    def get(self, job_id: str) -> JobTrace | None:
+        return self._jobs.get(job_id)
+
+    def record(self, job_id: str | None, stage: str, service_ms: float, queue_ms: float = 0.0) -> None:
+        stats = self._stages.get(stage)
+        if stats is None:
+            stats = self._stages[stage] = StageStats(self.samples_per_stage)
+        stats.observe(queue_ms, service_ms)
+        trace = self._jobs.get(job_id) if job_id else None
+        if trace is not None:
+            trace.spans.append({"stage": stage, "queue_ms": round(queue_ms, 1), "service_ms": round(service_ms, 1)})
+
+    def finish(self, job_id: str) -> dict[str, Any] | None:
+        """Encerra o rastreamento do job e retorna seu detalhamento."""
+        trace = self._jobs.pop(job_id, None)
+        return trace.breakdown() if trace else None
+
+    def stats(self) -> dict[str, Any]:
+        return {stage: stats.snapshot() for stage, stats in sorted(self._stages.items())}
@@ -1,31 +1,127 @@
 # jarvis_mark2/assistant/main.py
 
 import asyncio
-import base64
 import json
 import os
+import socket
+import time
+from typing import Awaitable, Callable
 from uuid import uuid4
 
 import aio_pika
-from fastapi import FastAPI, File, UploadFile, WebSocket, WebSocketDisconnect
-from langchain_core.messages import HumanMessage, SystemMessage, messages_to_dict
+from fastapi import FastAPI, File, HTTPException, UploadFile, WebSocket, WebSocketDisconnect
+from langchain_core.messages import AIMessage, HumanMessage, messages_to_dict
 from loguru import logger
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from assistant.agent_graph import app_graph
-from assistant.persistent_memory import PGConversationMemory
-from config.prompts import SYSTEM_PROMPT
-from database.connection import engine, init_db_if_needed
-from database.models import User
+from assistant.admission import AdmissionController, AdmissionRejected
+from assistant.agent_core import get_embeddings, get_llm
+from assistant.agent_graph import ainvoke_until_deadline, graph_for_tools, tool_usage_writer
+from assistant.context_window import ContextWindow, fold_into_summary, turn_context
+from assistant.job_registry import JobEvent, JobRegistry
+from assistant.latency import LatencyTracker
+from assistant.persistent_memory import Conversation, PGConversationMemory, resolve_conversation
+from assistant.prompt_cache import SystemPromptCache, render_system_prompt
+from assistant.semantic_cache import SemanticResponseCache, tools_used_in_turn
+from assistant.streaming import ChunkSequencer, PartialSequencer, SentenceSegmenter
+from assistant.tool_router import ToolRouter
+from config.settings import settings
+from database.connection import AsyncSessionLocal, async_engine, init_db_if_needed
+from database.models import Tool, User
 from scripts.sync_tools import sync_tools_to_db
+from services.common.audio_message import (
+    AUDIO_CONTENT_TYPE,
+    CODEC_PCM_S16LE,
+    CODEC_WAV,
+    build_audio_headers,
+    wav_sample_rate,
+)
+from services.common.tracing import read_spans, stamp
+from tools.__all_tools__ import ACTION_TOOLS, tool_result_cache
 
 app = FastAPI(title="Jarvis Orchestrator", version="1.0")
 
 # --- Gerenciamento de Conexões ---
-active_websockets: dict[str, WebSocket] = {}
+# Identidade desta réplica: conclusões de STT/TTS dos jobs criados aqui voltam para cá.
+# O '.' é separador de palavras nas routing keys, então não pode aparecer no id.
+REPLICA_ID = (settings.orchestrator.replica_id or f"{socket.gethostname()}-{os.getpid()}").replace(".", "_")
+# Cada job tem uma fila de eventos; resultados que chegam antes do WebSocket ficam guardados
+job_registry = JobRegistry(
+    ttl_seconds=settings.orchestrator.job_result_ttl_seconds,
+    max_buffered_bytes=settings.orchestrator.job_buffer_max_bytes,
+)
+# Latência por etapa de cada job (espera na fila + tempo de serviço)
+latency = LatencyTracker(
+    max_jobs=settings.orchestrator.latency_max_traced_jobs,
+    samples_per_stage=settings.orchestrator.latency_samples_per_stage,
+)
+# Jobs com resposta em streaming: reordenam os chunks de áudio vindos do TTS
+tts_streams: dict[str, ChunkSequencer] = {}
+# WebSockets de jobs ao vivo que ainda estão recebendo áudio: as transcrições
+# parciais vão direto para eles, sem esperar o fim da fala
+live_websockets: dict[str, WebSocket] = {}
+# Último seq de transcrição parcial encaminhado por job; as que chegam fora de
+# ordem ou depois do texto final são descartadas
+stt_partials = PartialSequencer()
+# Jobs ao vivo -> fila da instância do STT que assumiu o reconhecimento. Só o
+# primeiro pedaço vai para a fila compartilhada; os demais aguardam o aviso
+# stt.live_claimed e vão direto para a instância dona da sessão.
+live_routes: dict[str, asyncio.Future] = {}
 mq_connection = None
 mq_channel = None
 
+# System prompt por usuário; invalidado pelo memory_summarizer via evento
+system_prompt_cache = SystemPromptCache(ttl_seconds=settings.orchestrator.system_prompt_cache_ttl_seconds)
+USER_PREFERENCES_UPDATED = "user.preferences.updated"
+
+# Janela de contexto: histórico recente limitado por tokens, o resto vira resumo
+context_window = ContextWindow(
+    max_tokens=settings.orchestrator.context_max_tokens,
+    chars_per_token=settings.orchestrator.context_chars_per_token,
+)
+summary_llm = get_llm()
+# Cache semântico de respostas (opcional): perguntas repetidas não passam pelo LLM
+semantic_cache = None
+if settings.orchestrator.semantic_cache_enabled:
+    semantic_cache = SemanticResponseCache(
+        embed=get_embeddings(settings.orchestrator.semantic_cache_embedding_model).aembed_query,
+        threshold=settings.orchestrator.semantic_cache_threshold,
+        ttl_seconds=settings.orchestrator.semantic_cache_ttl_seconds,
+        max_entries=settings.orchestrator.semantic_cache_max_entries,
+        max_bytes=settings.orchestrator.semantic_cache_max_bytes,
+        uncacheable_tools=settings.orchestrator.semantic_cache_uncacheable_tools,
+        tool_ttls=settings.orchestrator.semantic_cache_tool_ttl_seconds,
+        volatile_terms=settings.orchestrator.semantic_cache_volatile_terms,
+        volatile_ttl_seconds=settings.orchestrator.semantic_cache_volatile_ttl_seconds,
+    )
+# Roteador de ferramentas: cada turno vincula ao LLM só as ferramentas relevantes
+tool_router = None
+if settings.orchestrator.tool_routing_enabled and not settings.orchestrator.tool_router_embedding_model:
+    logger.warning("Roteamento de ferramentas desligado: defina tool_router_embedding_model.")
+elif settings.orchestrator.tool_routing_enabled:
+    router_embeddings = get_embeddings(settings.orchestrator.tool_router_embedding_model)
+    tool_router = ToolRouter(
+        embed_documents=router_embeddings.aembed_documents,
+        embed_query=router_embeddings.aembed_query,
+        top_k=settings.orchestrator.tool_router_top_k,
+        pinned=ACTION_TOOLS | set(settings.orchestrator.tool_router_pinned),
+    )
+# Tasks de fundo sem dono específico (mantém a referência até terminarem)
+background_tasks: set[asyncio.Task] = set()
+
+# Atualizações de resumo em andamento, por sessão (também mantém a referência da task)
+summary_tasks: dict[int, asyncio.Task] = {}
+
+FALLBACK_REPLY = "Desculpe, encontrei um problema ao processar sua solicitação."
+BUSY_DETAIL = "O assistente está ocupado no momento. Tente novamente em instantes."
+
+admission = AdmissionController(
+    max_concurrent=settings.orchestrator.max_concurrent_agent_runs,
+    max_queue=settings.orchestrator.admission_queue_size,
+    max_wait_seconds=settings.orchestrator.admission_max_wait_seconds,
+)
+
 # --- Ciclo de Vida da Aplicação (Startup/Shutdown) ---
 
 @app.on_event("startup")
@@ -33,59 +129,241 @@ async def startup_event():
     """Inicializa o banco de dados, sincroniza ferramentas e inicia o consumidor de eventos."""
     init_db_if_needed()
     logger.info("Sincronizando ferramentas com o banco de dados...")
-    sync_tools_to_db()
+    tool_usage_writer.set_tool_ids(sync_tools_to_db())
+    background_tasks.add(asyncio.create_task(tool_usage_writer.run()))
+    if tool_router is not None:
+        background_tasks.add(asyncio.create_task(index_tool_router()))
     
     # Inicia o consumidor de RabbitMQ como uma task de background
     asyncio.create_task(start_event_consumer())
+    asyncio.create_task(job_registry.run_janitor())
     logger.info("Orquestrador iniciado e consumidor de eventos agendado.")
 
+async def index_tool_router():
+    """Indexa as descrições das ferramentas habilitadas na tabela 'tools' (sincronizada com o código)."""
+    try:
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(Tool.name, Tool.description).where(Tool.is_enabled.is_not(False)).order_by(Tool.tool_id)
+            )).all()
+        await tool_router.index({name: description for name, description in rows})
+    except Exception:
+        # Sem índice, o roteador devolve todas as ferramentas
+        logger.exception("Falha ao indexar as ferramentas; o agente usará todas elas.")
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Fecha a conexão com o RabbitMQ de forma limpa."""
+    """Fecha a conexão com o RabbitMQ e o pool do banco de forma limpa."""
     global mq_connection
     if mq_connection:
         await mq_connection.close()
     logger.info("Conexão com RabbitMQ fechada.")
+    for task in background_tasks:
+        task.cancel()
+    await tool_usage_writer.flush()
+    await async_engine.dispose()
 
 # --- Endpoints da API ---
 
+async def open_conversation(username: str | None, conversation_id: int | None) -> Conversation:
+    """Resolve a conversa do job: a informada, a em andamento do usuário ou uma nova."""
+    async with AsyncSessionLocal() as db:
+        return await resolve_conversation(
+            db,
+            username or settings.orchestrator.default_username,
+            settings.orchestrator.conversation_idle_timeout_seconds,
+            conversation_id,
+        )
+
 @app.post("/v2/interact/start")
-async def start_interaction(audio_file: UploadFile = File(...)):
-    """Recebe o áudio, cria um job e publica o evento inicial."""
+async def start_interaction(
+    audio_file: UploadFile = File(...), user: str | None = None, conversation_id: int | None = None
+):
+    """
+    Recebe o áudio, cria um job e publica o evento inicial. O turno entra na
+    conversa ``conversation_id`` ou na conversa em andamento do usuário.
+    """
     global mq_channel
     if not mq_channel:
         raise HTTPException(status_code=503, detail="Serviço de mensageria indisponível.")
+    try:
+        conversation = await open_conversation(user, conversation_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
     job_id = str(uuid4())
-    audio_bytes = await audio_file.read()
+    trace = latency.start(job_id)
+    with trace.span("upload"):
+        audio_bytes = await audio_file.read()
+        job_registry.open(job_id, context=conversation)
+
+        # Publica o evento para o STT processar: áudio cru no body, metadados nos headers
+        await mq_channel.default_exchange.publish(
+            aio_pika.Message(
+                body=audio_bytes,
+                content_type=AUDIO_CONTENT_TYPE,
+                headers=stamp(build_audio_headers(job_id, CODEC_WAV, wav_sample_rate(audio_bytes))),
+                reply_to=REPLICA_ID,
+            ),
+            routing_key="stt.requested"
+        )
+    logger.info(f"[{job_id}] Job de interação iniciado e evento 'stt.requested' publicado.")
+    return {"job_id": job_id, "conversation_id": conversation.session_id}
+
+@app.websocket("/v2/interact/ws/{job_id}")
+async def ws_interaction(websocket: WebSocket, job_id: str, trace: bool = False):
+    """
+    Gerencia a conexão WebSocket para um job, aguardando por eventos. Com
+    ``?trace=true``, o detalhamento de latência do job é enviado antes do fechamento.
+    """
+    await websocket.accept()
+    await deliver_job_events(websocket, job_id, include_trace=trace)
+
+@app.websocket("/v2/interact/stream")
+async def ws_live_interaction(
+    websocket: WebSocket,
+    sample_rate: int = 16000,
+    trace: bool = False,
+    user: str | None = None,
+    conversation_id: int | None = None,
+):
+    """
+    Recebe o áudio do comando ao vivo (PCM 16-bit mono) enquanto o usuário fala.
+
+    Protocolo: o servidor envia ``{"job_id": ..., "conversation_id": ...}``; o cliente envia frames
+    binários de PCM e, ao detectar o fim da fala, ``{"event": "end"}``.
+    Enquanto o áudio chega, o servidor envia as transcrições parciais
+    (``{"partial": {"seq", "text"}}``). Os resultados do job são entregues
+    pelo mesmo WebSocket.
+    """
+    await websocket.accept()
+    if not mq_channel:
+        await websocket.send_json({"error": "unavailable", "detail": "Serviço de mensageria indisponível."})
+        await websocket.close()
+        return
+    try:
+        conversation = await open_conversation(user, conversation_id)
+    except ValueError as e:
+        await websocket.send_json({"error": "conversation", "detail": str(e)})
+        await websocket.close()
+        return
+
+    job_id = str(uuid4())
+    job_registry.open(job_id, context=conversation)
+    latency.start(job_id)
+    await websocket.send_json({"job_id": job_id, "conversation_id": conversation.session_id})
+    logger.info(f"[{job_id}] Stream de áudio ao vivo iniciado ({sample_rate} Hz).")
+
+    chunk_bytes = settings.orchestrator.live_audio_chunk_bytes
+    buffer = bytearray()
+    seq = 0
+    live_websockets[job_id] = websocket
+    live_routes[job_id] = asyncio.get_running_loop().create_future()
+    # Até o fim da fala ser repassado ao STT, o job é deste handler; depois,
+    # deliver_job_events passa a ser responsável por liberá-lo
+    handed_off = False
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                logger.warning(f"[{job_id}] Cliente desconectou durante o envio do áudio.")
+                return
+            if frame.get("bytes"):
+                buffer.extend(frame["bytes"])
+                if len(buffer) >= chunk_bytes:
+                    await publish_live_audio(job_id, seq, bytes(buffer), sample_rate)
+                    seq += 1
+                    buffer.clear()
+            elif frame.get("text"):
+                try:
+                    control = json.loads(frame["text"])
+                except json.JSONDecodeError:
+                    logger.warning(f"[{job_id}] Mensagem de controle inválida ignorada.")
+                    continue
+                if isinstance(control, dict) and control.get("event") == "end":
+                    break
 
-    # Publica o evento para o STT processar
+        await publish_live_audio(job_id, seq, bytes(buffer), sample_rate, end=True)
+        logger.info(f"[{job_id}] Fim da fala: {seq + 1} bloco(s) de áudio enviados ao STT.")
+        handed_off = True
+    except asyncio.TimeoutError:
+        logger.error(f"[{job_id}] Nenhuma instância do STT assumiu o stream de áudio.")
+        await websocket.send_json({"error": "stt.failed", "detail": "Reconhecimento de voz indisponível."})
+        await websocket.close()
+        return
+    finally:
+        live_websockets.pop(job_id, None)
+        live_routes.pop(job_id, None)
+        if not handed_off:
+            job_registry.release(job_id)
+            stt_partials.forget(job_id)
+            latency.finish(job_id)
+    await deliver_job_events(websocket, job_id, include_trace=trace)
+
+async def publish_live_audio(job_id: str, seq: int, pcm: bytes, sample_rate: int, end: bool = False):
+    """
+    Publica um bloco de áudio ao vivo para o reconhecimento incremental no STT.
+    O primeiro bloco vai para a fila compartilhada; os seguintes, para a
+    instância que o recebeu (o reconhecimento guarda estado entre os blocos).
+    """
+    routing_key = "stt.requested"
+    if seq > 0:
+        routing_key = await asyncio.wait_for(
+            asyncio.shield(live_routes[job_id]), settings.orchestrator.live_claim_timeout_seconds
+        )
     await mq_channel.default_exchange.publish(
         aio_pika.Message(
-            body=json.dumps({
-                "job_id": job_id,
-                "audio_bytes": base64.b64encode(audio_bytes).decode()
-            }).encode()
+            body=pcm,
+            content_type=AUDIO_CONTENT_TYPE,
+            headers=stamp(build_audio_headers(job_id, CODEC_PCM_S16LE, sample_rate, stream_seq=seq, stream_end=end)),
+            reply_to=REPLICA_ID,
         ),
-        routing_key="stt.requested"
+        routing_key=routing_key
     )
-    logger.info(f"[{job_id}] Job de interação iniciado e evento 'stt.requested' publicado.")
-    return {"job_id": job_id}
 
-@app.websocket("/v2/interact/ws/{job_id}")
-async def ws_interaction(websocket: WebSocket, job_id: str):
-    """Gerencia a conexão WebSocket para um job, aguardando por eventos."""
-    await websocket.accept()
-    active_websockets[job_id] = websocket
+async def deliver_job_events(websocket: WebSocket, job_id: str, include_trace: bool = False):
+    """
+    Entrega ao cliente os eventos do job assim que chegam, até o evento final.
+    Com ``include_trace``, envia também ``{"trace": ...}`` com a latência de cada etapa.
+    """
+    events = job_registry.attach(job_id)
     logger.info(f"[{job_id}] WebSocket conectado.")
+    # O cliente não envia mensagens neste endpoint: qualquer retorno de receive()
+    # indica que a conexão foi encerrada enquanto aguardávamos eventos do job
+    disconnected = asyncio.ensure_future(websocket.receive())
     try:
-        # Mantém a conexão aberta para recebermos os eventos do consumidor
         while True:
-            await asyncio.sleep(60)
+            next_event = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event not in done:
+                next_event.cancel()
+                logger.warning(f"[{job_id}] WebSocket desconectado.")
+                return
+            event: JobEvent = next_event.result()
+            sending_at = time.monotonic()
+            if event.audio is not None:
+                await websocket.send_bytes(event.audio)
+            if event.message is not None:
+                await websocket.send_json(event.message)
+            latency.record(
+                job_id, "delivery",
+                service_ms=(time.monotonic() - sending_at) * 1000,
+                queue_ms=(sending_at - event.created_at) * 1000,
+            )
+            if event.final:
+                logger.info(f"[{job_id}] Resultado final entregue ao cliente.")
+                trace = latency.get(job_id)
+                if include_trace and trace:
+                    await websocket.send_json({"trace": trace.breakdown()})
+                await websocket.close()
+                return
     except WebSocketDisconnect:
         logger.warning(f"[{job_id}] WebSocket desconectado.")
     finally:
-        active_websockets.pop(job_id, None)
+        disconnected.cancel()
+        job_registry.release(job_id)
+        stt_partials.forget(job_id)
+        latency.finish(job_id)
 
 # --- Lógica do Consumidor de Eventos (Totalmente Assíncrono) ---
 
@@ -101,15 +379,49 @@ async def start_event_consumer():
         # Garante que a topologia (exchange e filas) existe
         await mq_channel.declare_exchange(name="jarvis_events", type="topic", durable=True)
         queue = await mq_channel.declare_queue("orchestrator_events_queue", durable=True)
-        
-        # Binds para os eventos que o orquestrador precisa ouvir
-        await queue.bind("jarvis_events", routing_key="stt.completed")
-        await queue.bind("jarvis_events", routing_key="stt.failed")
-        await queue.bind("jarvis_events", routing_key="tts.completed")
-        await queue.bind("jarvis_events", routing_key="tts.failed")
 
-        logger.info("[Event Consumer] Conectado ao RabbitMQ e pronto para consumir eventos.")
+        # Transcrições (que disparam o agente) têm fila e canal próprios, com
+        # prefetch casado com o controle de admissão: o broker só entrega o que
+        # cabe nas vagas + fila de espera, e o resto aguarda no RabbitMQ sem
+        # atrasar os eventos de TTS dos jobs que já estão rodando. O limite é do
+        # canal (global_): a fila compartilhada e a da réplica consomem por ele
+        # e, juntas, não podem passar da capacidade de admissão.
+        agent_channel = await mq_connection.channel()
+        await agent_channel.set_qos(prefetch_count=admission.max_concurrent + admission.max_queue, global_=True)
+        agent_queue = await agent_channel.declare_queue("orchestrator_agent_queue", durable=True)
+        await queue.unbind("jarvis_events", routing_key="stt.completed")
+
+        # Cada réplica também tem suas próprias filas. Os jobs saem daqui com
+        # reply_to=REPLICA_ID e o STT/TTS publicam as conclusões em
+        # '<evento>.<réplica>', então a resposta volta para a réplica que detém
+        # o WebSocket. As filas de réplicas que morreram expiram sozinhas.
+        replica_args = {"x-expires": settings.orchestrator.replica_queue_expires_ms}
+        replica_agent_queue = await agent_channel.declare_queue(
+            f"orchestrator_agent_queue.{REPLICA_ID}", durable=True, arguments=replica_args
+        )
+        replica_queue = await mq_channel.declare_queue(
+            f"orchestrator_events_queue.{REPLICA_ID}", durable=True, arguments=replica_args
+        )
+
+        # Binds para os eventos que o orquestrador precisa ouvir. As filas
+        # compartilhadas recebem os eventos sem réplica (clientes/serviços antigos).
+        await agent_queue.bind("jarvis_events", routing_key="stt.completed")
+        await replica_agent_queue.bind("jarvis_events", routing_key=f"stt.completed.{REPLICA_ID}")
+        for event in ("stt.live_claimed", "stt.partial", "stt.failed", "tts.completed", "tts.failed"):
+            await queue.bind("jarvis_events", routing_key=event)
+            await replica_queue.bind("jarvis_events", routing_key=f"{event}.{REPLICA_ID}")
+
+        # Eventos de invalidação de cache precisam chegar a todas as réplicas:
+        # cada processo tem sua própria fila exclusiva, descartada ao desconectar.
+        broadcast_queue = await mq_channel.declare_queue(exclusive=True, auto_delete=True)
+        await broadcast_queue.bind("jarvis_events", routing_key=USER_PREFERENCES_UPDATED)
+
+        logger.info(f"[Event Consumer] Réplica '{REPLICA_ID}' conectada ao RabbitMQ e pronta para consumir eventos.")
         await queue.consume(on_message)
+        await agent_queue.consume(on_message)
+        await replica_queue.consume(on_message)
+        await replica_agent_queue.consume(on_message)
+        await broadcast_queue.consume(on_broadcast_message)
 
     except Exception:
         logger.exception("[Event Consumer] Falha crítica ao conectar/consumir do RabbitMQ.")
@@ -120,15 +432,47 @@ async def on_message(message: aio_pika.IncomingMessage):
         routing_key = message.routing_key
         logger.info(f"Evento recebido com routing_key: {routing_key}")
         try:
-            if routing_key == "stt.completed":
+            event = event_name(routing_key)
+            if event == "stt.completed":
                 await handle_stt_completed(message)
-            elif routing_key == "tts.completed":
+            elif event == "stt.partial":
+                await handle_stt_partial(message)
+            elif event == "stt.live_claimed":
+                handle_stt_live_claimed(message)
+            elif event == "tts.completed":
                 await handle_tts_completed(message)
-            elif routing_key in ("stt.failed", "tts.failed"):
+            elif event in ("stt.failed", "tts.failed"):
                 await handle_task_failed(message)
         except Exception:
             logger.exception(f"Erro não tratado ao processar evento '{routing_key}'.")
 
+def event_name(routing_key: str) -> str:
+    """Remove o sufixo de réplica de uma routing key ('tts.completed.<réplica>' -> 'tts.completed')."""
+    suffix = f".{REPLICA_ID}"
+    return routing_key[: -len(suffix)] if routing_key.endswith(suffix) else routing_key
+
+async def on_broadcast_message(message: aio_pika.IncomingMessage):
+    """Processa eventos entregues a todas as réplicas (invalidação de caches)."""
+    async with message.process():
+        try:
+            payload = json.loads(message.body)
+            if message.routing_key == USER_PREFERENCES_UPDATED:
+                username = payload.get("username")
+                system_prompt_cache.invalidate(username)
+                logger.info(f"System prompt em cache invalidado para o usuário '{username}'.")
+        except Exception:
+            logger.exception(f"Erro ao processar evento de broadcast '{message.routing_key}'.")
+
+async def publish_tts_request(job_id: str, text: str, seq: int | None = None):
+    """Publica um pedido de síntese. Em modo streaming, ``seq`` numera o chunk."""
+    payload = {"job_id": job_id, "text": text}
+    if seq is not None:
+        payload["seq"] = seq
+    await mq_channel.default_exchange.publish(
+        aio_pika.Message(body=json.dumps(payload).encode(), headers=stamp(), reply_to=REPLICA_ID),
+        routing_key="tts.requested"
+    )
+
 async def handle_stt_completed(message: aio_pika.IncomingMessage):
     """Processa o resultado do STT e invoca o agente de IA."""
     payload = json.loads(message.body)
@@ -140,99 +484,365 @@ async def handle_stt_completed(message: aio_pika.IncomingMessage):
         return
 
     logger.info(f"[{job_id}] STT concluído. Texto: '{user_text}'")
+    record_remote_spans(job_id, message.headers)
+    # O texto final já chegou: parciais atrasadas deste job não são mais encaminhadas
+    conversation: Conversation | None = job_registry.context(job_id)
+    if conversation is None:
+        # Cliente já desconectou (ou job de outro processo): não há a quem responder
+        logger.warning(f"[{job_id}] Transcrição de um job encerrado ou desconhecido descartada.")
+        return
+    stt_partials.close(job_id)
+
+    # Perguntas repetidas são respondidas do cache semântico, sem passar pelo LLM
+    # (nem pelo controle de admissão)
+    cached_reply = await lookup_cached_reply(job_id, user_text, conversation.username)
+    if cached_reply is not None:
+        await answer_from_cache(job_id, user_text, cached_reply, conversation)
+        return
+
+    # Limita as execuções simultâneas do agente; acima disso o job espera numa
+    # fila limitada ou recebe "ocupado" na hora
+    enqueued_at = time.monotonic()
+    # Prazo do job: a espera por uma vaga e a execução do agente contam contra ele
+    deadline = enqueued_at + settings.orchestrator.agent_deadline_seconds
+    try:
+        async with admission.slot(deadline=min(deadline, enqueued_at + admission.max_wait_seconds)):
+            latency.record(job_id, "admission", service_ms=0.0, queue_ms=(time.monotonic() - enqueued_at) * 1000)
+            await run_agent_pipeline(job_id, user_text, conversation, deadline)
+    except AdmissionRejected as e:
+        logger.warning(f"[{job_id}] Job rejeitado pelo controle de admissão: {e}")
+        job_registry.publish(job_id, JobEvent(message={"error": "busy", "detail": BUSY_DETAIL}, final=True))
+
+async def lookup_cached_reply(job_id: str, user_text: str, username: str) -> str | None:
+    """Consulta o cache semântico do usuário (se habilitado). Falhas no cache não afetam o job."""
+    if semantic_cache is None:
+        return None
+    try:
+        reply = await semantic_cache.lookup(user_text, scope=username)
+    except Exception:
+        logger.exception(f"[{job_id}] Falha ao consultar o cache semântico.")
+        return None
+    if reply is not None:
+        logger.info(f"[{job_id}] Resposta servida pelo cache semântico.")
+    return reply
+
+async def answer_from_cache(job_id: str, user_text: str, reply: str, conversation: Conversation):
+    """Registra o turno no histórico da conversa e envia a resposta em cache ao TTS."""
+    try:
+        async with AsyncSessionLocal() as db:
+            memory = PGConversationMemory(session_id=conversation.session_id, db_session=db)
+            await memory.asave_context({"input": user_text}, {"output": reply})
+    except Exception:
+        logger.exception(f"[{job_id}] Falha ao salvar no histórico o turno respondido pelo cache.")
+
+    if settings.orchestrator.streaming_tts:
+        await stream_agent_reply_to_tts(job_id, user_text, conversation, cached_reply=reply)
+    else:
+        await publish_tts_request(job_id, reply)
+
+def remember_reply(user_text: str, final_state: dict, username: str, context_dependent: bool) -> None:
+    """
+    Guarda a resposta do agente no cache semântico do usuário, fora do caminho
+    crítico. ``context_dependent`` indica que o turno viu histórico da conversa
+    além do system prompt; a resposta então não vale para a pergunta isolada.
+    """
+    if semantic_cache is None:
+        return
+    reply = final_state["messages"][-1].content
+    tools_used = tools_used_in_turn(final_state["messages"])
+    ttl_seconds = semantic_cache.ttl_for(user_text, tools_used)
+
+    async def store():
+        try:
+            await semantic_cache.store(
+                user_text,
+                reply,
+                tools_used,
+                ttl_seconds=ttl_seconds,
+                scope=username,
+                context_dependent=context_dependent,
+            )
+        except Exception:
+            logger.exception("Falha ao guardar a resposta no cache semântico.")
+
+    task = asyncio.create_task(store())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def run_agent_pipeline(
+    job_id: str, user_text: str, conversation: Conversation, deadline: float | None = None
+):
+    """Executa o agente para o texto transcrito e envia a resposta ao TTS."""
+    if settings.orchestrator.streaming_tts:
+        await stream_agent_reply_to_tts(job_id, user_text, conversation, deadline=deadline)
+        return
 
     try:
         # Executa o grafo do agente de forma assíncrona, não bloqueando o consumidor
-        final_state = await invoke_agent_graph(job_id, user_text)
+        final_state = await invoke_agent_graph(job_id, user_text, conversation, deadline=deadline)
         assistant_reply = final_state["messages"][-1].content
         logger.info(f"[{job_id}] Resposta do Agente: '{assistant_reply}'")
 
         # Publica a resposta para o TTS sintetizar
-        await mq_channel.default_exchange.publish(
-            aio_pika.Message(
-                body=json.dumps({
-                    "job_id": job_id,
-                    "text": assistant_reply
-                }).encode()
-            ),
-            routing_key="tts.requested"
-        )
+        await publish_tts_request(job_id, assistant_reply)
     except Exception as e:
         logger.exception(f"[{job_id}] Falha no pipeline do agente. Gerando resposta de erro.")
         # Se o agente falhar, envia um texto de erro para o TTS
-        await mq_channel.default_exchange.publish(
-            aio_pika.Message(
-                body=json.dumps({
-                    "job_id": job_id,
-                    "text": "Desculpe, encontrei um problema ao processar sua solicitação."
-                }).encode()
-            ),
-            routing_key="tts.requested"
-        )
+        await publish_tts_request(job_id, FALLBACK_REPLY)
+
+async def stream_agent_reply_to_tts(
+    job_id: str,
+    user_text: str,
+    conversation: Conversation,
+    cached_reply: str | None = None,
+    deadline: float | None = None,
+):
+    """
+    Modo streaming: corta os tokens do agente em frases à medida que chegam e
+    publica cada frase como um chunk numerado para o TTS. Com ``cached_reply``,
+    o agente não é executado e a resposta pronta é enviada do mesmo jeito.
+    """
+    segmenter = SentenceSegmenter(min_chars=settings.orchestrator.stream_min_sentence_chars)
+    sequencer = ChunkSequencer()
+    tts_streams[job_id] = sequencer
+    published = 0
+
+    async def publish_sentence(sentence: str):
+        nonlocal published
+        await publish_tts_request(job_id, sentence, seq=published)
+        logger.debug(f"[{job_id}] Chunk {published} enviado ao TTS: '{sentence}'")
+        published += 1
+
+    async def on_token(token: str):
+        for sentence in segmenter.feed(token):
+            await publish_sentence(sentence)
+
+    try:
+        if cached_reply is not None:
+            await on_token(cached_reply)
+        else:
+            final_state = await invoke_agent_graph(
+                job_id, user_text, conversation, on_token=on_token, deadline=deadline
+            )
+            logger.info(f"[{job_id}] Resposta do Agente: '{final_state['messages'][-1].content}'")
+        remaining = segmenter.flush()
+        if remaining:
+            await publish_sentence(remaining)
+    except Exception:
+        logger.exception(f"[{job_id}] Falha no pipeline do agente. Gerando resposta de erro.")
+        # Frases já publicadas continuam válidas; o erro entra como o próximo chunk
+        await publish_sentence(FALLBACK_REPLY)
+
+    sequencer.close(published)
+    if sequencer.done:
+        await finish_tts_stream(job_id)
+
+async def finish_tts_stream(job_id: str):
+    """Sinaliza o fim do stream de áudio ao cliente."""
+    tts_streams.pop(job_id, None)
+    job_registry.publish(job_id, JobEvent(message={"status": "done"}, final=True))
+
+def handle_stt_live_claimed(message: aio_pika.IncomingMessage):
+    """Registra a instância do STT que assumiu um stream ao vivo (libera o envio dos próximos blocos)."""
+    payload = json.loads(message.body)
+    route = live_routes.get(payload.get("job_id"))
+    if route is not None and not route.done():
+        route.set_result(payload["queue"])
+
+async def handle_stt_partial(message: aio_pika.IncomingMessage):
+    """
+    Encaminha ao cliente a transcrição parcial (``{"partial": {"seq", "text"}}``)
+    enquanto o STT ainda decodifica. É também o ponto para adiantar etapas
+    que só dependem de um texto provisório.
+    """
+    payload = json.loads(message.body)
+    job_id = payload.get("job_id")
+    seq = int(payload.get("seq", 0))
+    if not job_id or not job_registry.has(job_id):
+        return
+    if not stt_partials.accept(job_id, seq):
+        return
+
+    event = {"partial": {"seq": seq, "text": payload.get("text", "")}}
+    websocket = live_websockets.get(job_id)
+    if websocket is None:
+        job_registry.publish(job_id, JobEvent(message=event))
+        return
+    try:
+        await websocket.send_json(event)
+    except Exception:
+        # O handler do WebSocket percebe a desconexão e encerra o job
+        logger.warning(f"[{job_id}] Falha ao enviar a transcrição parcial ao cliente.")
 
 async def handle_tts_completed(message: aio_pika.IncomingMessage):
     """Envia o áudio sintetizado para o cliente via WebSocket."""
     job_id = message.headers.get("job_id")
-    if job_id in active_websockets:
-        websocket = active_websockets[job_id]
-        try:
-            await websocket.send_bytes(message.body)
-            logger.info(f"[{job_id}] Áudio final enviado para o cliente via WebSocket.")
-        except WebSocketDisconnect:
-            logger.warning(f"[{job_id}] WebSocket já estava desconectado ao tentar enviar áudio.")
-        finally:
-            # Opcional: fechar a conexão após enviar a resposta final
-            await websocket.close()
-            active_websockets.pop(job_id, None)
+    seq = message.headers.get("seq")
+    record_remote_spans(job_id, message.headers)
+    if not job_registry.has(job_id):
+        # O cliente já desconectou: o áudio atrasado não tem para onde ir
+        tts_streams.pop(job_id, None)
+        logger.info(f"[{job_id}] Áudio de um job já encerrado descartado.")
+        return
+    if seq is not None and job_id in tts_streams:
+        await forward_tts_chunk(job_id, int(seq), message.body)
+        return
+
+    # O WebSocket é fechado após a entrega do áudio final
+    job_registry.publish(job_id, JobEvent(audio=message.body, final=True))
+    logger.info(f"[{job_id}] Áudio final encaminhado ao cliente.")
+
+async def forward_tts_chunk(job_id: str, seq: int, audio: bytes | None):
+    """Encaminha, em ordem, os chunks de áudio de um job em streaming."""
+    sequencer = tts_streams[job_id]
+    ready = sequencer.push(seq, audio)
+    for chunk in ready:
+        job_registry.publish(job_id, JobEvent(audio=chunk))
+    logger.info(f"[{job_id}] {len(ready)} chunk(s) de áudio encaminhados (próximo: {sequencer.next_seq}).")
+    if sequencer.done:
+        await finish_tts_stream(job_id)
 
 async def handle_task_failed(message: aio_pika.IncomingMessage):
     """Envia uma notificação de erro para o cliente via WebSocket."""
     payload = json.loads(message.body)
     job_id = payload.get("job_id")
     error_message = payload.get("error", "Erro desconhecido")
-    logger.error(f"[{job_id}] Falha recebida: {message.routing_key} - {error_message}")
+    event = event_name(message.routing_key)
+    logger.error(f"[{job_id}] Falha recebida: {event} - {error_message}")
+    if not job_registry.has(job_id):
+        tts_streams.pop(job_id, None)
+        return
 
-    if job_id in active_websockets:
-        websocket = active_websockets[job_id]
-        try:
-            await websocket.send_json({"error": message.routing_key, "detail": error_message})
-        finally:
-            await websocket.close()
-            active_websockets.pop(job_id, None)
+    # Um chunk com falha não derruba o stream: ele é pulado e os demais seguem
+    seq = payload.get("seq")
+    if seq is not None and job_id in tts_streams:
+        await forward_tts_chunk(job_id, int(seq), None)
+        return
+
+    tts_streams.pop(job_id, None)
+    if job_id:
+        job_registry.publish(
+            job_id, JobEvent(message={"error": event, "detail": error_message}, final=True)
+        )
 
 # --- Funções Auxiliares ---
 
-async def invoke_agent_graph(session_id: str, user_text: str) -> dict:
-    """Função auxiliar para invocar o LangGraph de forma assíncrona."""
-    SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
-    db = SessionLocal()
+def record_remote_spans(job_id: str | None, headers: dict | None) -> None:
+    """Registra as etapas medidas pelos serviços (STT/TTS) e devolvidas nos headers."""
     try:
-        memory = PGConversationMemory(session_id=session_id, db_session=db)
+        for span in read_spans(headers):
+            latency.record(job_id, span["stage"], span["service_ms"], span["queue_ms"])
+    except Exception:
+        logger.warning(f"[{job_id}] Headers de rastreamento inválidos: {headers}")
+
+async def invoke_agent_graph(
+    job_id: str,
+    user_text: str,
+    conversation: Conversation,
+    on_token: Callable[[str], Awaitable[None]] | None = None,
+    deadline: float | None = None,
+) -> dict:
+    """
+    Função auxiliar para invocar o LangGraph de forma assíncrona. O histórico,
+    o resumo e o system prompt são os da ``conversation`` do job.
+
+    Se ``on_token`` for informado, o texto de cada turno do LLM que termina
+    sem chamar ferramentas é repassado ao callback (ver ``agent_node``).
+
+    ``deadline`` (instante de ``time.monotonic()``) limita a execução: ao
+    expirar, o LLM e as ferramentas em andamento são cancelados e a resposta
+    é o texto gerado até ali seguido de ``DEADLINE_REPLY`` (ver
+    ``ainvoke_until_deadline``).
+    """
+    # Sessão assíncrona: nenhuma consulta ao Postgres bloqueia o event loop
+    async with AsyncSessionLocal() as db:
+        memory = await PGConversationMemory.load(session_id=conversation.session_id, db_session=db)
         human_message = HumanMessage(content=user_text)
-        message_db_id = memory.save_message_and_get_id(messages_to_dict([human_message])[0])
-        
-        history = memory.load_memory_variables({})
-        messages = history.get("memory", [])
+        # Salva a mensagem do usuário (que também entra no histórico em memória)
+        message_db_id = await memory.save_message_and_get_id(messages_to_dict([human_message])[0])
         
-        user = db.query(User).filter(User.username == "igor").first()
-        system_prompt_text = SYSTEM_PROMPT
-        if user and user.preferences:
-            facts = "\n".join(f"- {fact}" for fact in user.preferences)
-            system_prompt_text = f"{SYSTEM_PROMPT}\n\nFatos conhecidos sobre o usuário:\n{facts}"
-        
-        messages.insert(0, SystemMessage(content=system_prompt_text))
-        messages.append(human_message)
+        system_prompt_text = await get_system_prompt(db, conversation.username)
+        # Só as mensagens mais recentes que cabem no orçamento de tokens vão ao LLM
+        messages, older = turn_context(context_window, system_prompt_text, memory.summary, memory.messages)
+        # Além do system prompt, o LLM vê o resumo ou turnos anteriores da conversa?
+        context_dependent = bool(memory.summary) or len(memory.messages) > 1
         
         graph_input = {"messages": messages, "db_session": db, "message_db_id": message_db_id}
-        final_state = await app_graph.ainvoke(graph_input, {"recursion_limit": 10})
+        # Só as ferramentas relevantes para a mensagem entram no prompt
+        tool_names = await tool_router.select(user_text) if tool_router else None
+        graph = graph_for_tools(tool_names)
+
+        # O trace do job vai junto para que cada nó e ferramenta registre sua etapa
+        configurable = {"trace": latency.get(job_id)}
+        started_at = time.perf_counter()
+        final_state, deadline_exceeded = await ainvoke_until_deadline(
+            graph, graph_input, configurable, deadline, on_token
+        )
+        if deadline_exceeded:
+            logger.warning(f"[{job_id}] Prazo do job esgotado; enviando resposta parcial.")
+        latency.record(job_id, "agent", (time.perf_counter() - started_at) * 1000)
         
         assistant_reply = final_state["messages"][-1].content
-        memory.save_context({"input": user_text}, {"output": assistant_reply})
+        await memory.save_message_and_get_id(messages_to_dict([AIMessage(content=assistant_reply)])[0])
+        if not deadline_exceeded:
+            remember_reply(user_text, final_state, conversation.username, context_dependent)
+
+        if older:
+            # O resumo é atualizado fora do caminho crítico, depois da resposta
+            schedule_summary_update(
+                conversation.session_id, memory.summary, older, memory.message_ids[len(older) - 1]
+            )
         return final_state
-    finally:
-        db.close()
+
+def schedule_summary_update(
+    session_id: int, previous_summary: str | None, older: list, until_message_id: int
+) -> None:
+    """Agenda a incorporação das mensagens que saíram da janela ao resumo da sessão."""
+    if session_id in summary_tasks:
+        return
+    task = asyncio.create_task(update_rolling_summary(session_id, previous_summary, older, until_message_id))
+    summary_tasks[session_id] = task
+    task.add_done_callback(lambda _: summary_tasks.pop(session_id, None))
+
+async def update_rolling_summary(
+    session_id: int, previous_summary: str | None, older: list, until_message_id: int
+) -> None:
+    """Atualiza o resumo incremental da sessão com as mensagens antigas."""
+    try:
+        summary = await fold_into_summary(summary_llm, previous_summary, older)
+        async with AsyncSessionLocal() as db:
+            memory = PGConversationMemory(session_id=session_id, db_session=db)
+            await memory.update_summary(summary, until_message_id)
+        logger.info(f"[{session_id}] Resumo da sessão atualizado até a mensagem {until_message_id}.")
+    except Exception:
+        logger.exception(f"[{session_id}] Falha ao atualizar o resumo da sessão.")
+
+async def get_system_prompt(db: AsyncSession, username: str) -> str:
+    """Retorna o system prompt do usuário, consultando o banco só quando o cache não tem."""
+    prompt = system_prompt_cache.get(username)
+    if prompt is None:
+        # Uma invalidação durante a consulta descarta o prompt lido (ver SystemPromptCache)
+        generation = system_prompt_cache.generation(username)
+        user = (await db.execute(select(User).where(User.username == username))).scalars().first()
+        prompt = render_system_prompt(user.preferences if user else None)
+        system_prompt_cache.set(username, prompt, generation)
+    return prompt
 
 # Manter o endpoint de health check
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
\ No newline at end of file
+    return {
+        "status": "ok",
+        "replica": REPLICA_ID,
+        "jobs": job_registry.stats(),
+        "system_prompt_cache": system_prompt_cache.stats(),
+        "admission": admission.stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "tool_usage": tool_usage_writer.stats(),
+        "tool_cache": tool_result_cache.stats(),
+    }
+
+@app.get("/metrics/latency")
+async def latency_metrics():
+    """Histogramas e percentis (p50/p95/p99) de espera e serviço por etapa dos jobs."""
+    return latency.stats()
\ No newline at end of file
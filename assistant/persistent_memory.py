@@ -1,76 +1,156 @@
 from __future__ import annotations
-from typing import Any, Dict, List
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
 
 from langchain.memory import ConversationBufferMemory
-from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
-from sqlalchemy.orm import Session
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, messages_from_dict, messages_to_dict
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from loguru import logger # Adicionar import para logging
 
 from database.models import ConversationMessage as HistoryModel, ConversationSession as SessionModel, User
+
+
+@dataclass(frozen=True)
+class Conversation:
+    """A conversa de um job: de qual usuário é e qual sessão do banco guarda o histórico e o resumo."""
+    username: str
+    session_id: int
+
+
+async def resolve_conversation(
+    db_session: AsyncSession, username: str, idle_timeout_seconds: float, conversation_id: int | None = None
+) -> Conversation:
+    """
+    Encontra a conversa em andamento do usuário ou abre uma nova.
+
+    Com ``conversation_id``, continua essa conversa (se for do usuário). Sem
+    ele, continua a sessão mais recente do usuário se a última mensagem dela
+    tem menos de ``idle_timeout_seconds``; senão, cria uma sessão nova.
+    """
+    user = (await db_session.execute(select(User).filter_by(username=username))).scalars().first()
+    if not user:
+        raise ValueError(f"Usuário '{username}' não encontrado no banco de dados.")
+
+    if conversation_id is not None:
+        session = await db_session.get(SessionModel, conversation_id)
+        if session is None or session.user_id != user.user_id:
+            raise ValueError(f"Conversa {conversation_id} não encontrada para o usuário '{username}'.")
+        return Conversation(username, session.session_id)
+
+    last_activity = func.coalesce(func.max(HistoryModel.timestamp), SessionModel.start_time)
+    latest = (await db_session.execute(
+        select(SessionModel.session_id, last_activity)
+        .outerjoin(HistoryModel, HistoryModel.session_id == SessionModel.session_id)
+        .where(SessionModel.user_id == user.user_id)
+        .group_by(SessionModel.session_id)
+        .order_by(SessionModel.session_id.desc())
+        .limit(1)
+    )).first()
+    now = datetime.now(timezone.utc)
+    if latest and latest[1] is not None and (now - latest[1]).total_seconds() < idle_timeout_seconds:
+        return Conversation(username, latest[0])
+
+    session = SessionModel(user_id=user.user_id, start_time=now)
+    db_session.add(session)
+    await db_session.commit()
+    logger.info(f"Nova conversa {session.session_id} aberta para o usuário '{username}'.")
+    return Conversation(username, session.session_id)
+
+
 class PGConversationMemory(ConversationBufferMemory):
-    session_id: str
-    db_session: Session
-
-    def __init__(self, session_id: str, db_session: Session, **kwargs):
-        super().__init__(**kwargs)
-        self.session_id = session_id
-        self.db_session = db_session
-        self._load_messages()
-
-    def _load_messages(self):
-        """Carrega o histórico da sessão do banco de dados."""
-        session = self.db_session.query(SessionModel).filter(SessionModel.session_id == self.session_id).first()
-        if session and session.messages:
-            loaded_messages = [messages_from_dict([h.content])[0] for h in session.messages]
-            self.chat_memory.messages.extend(loaded_messages)
-
-    # --- NOVO MÉTODO PRIVADO PARA CENTRALIZAR A LÓGICA ---
-    def _get_or_create_session(self) -> SessionModel:
-        """Busca a sessão de conversa no DB ou cria uma nova se não existir."""
-        session = self.db_session.query(SessionModel).filter(SessionModel.session_id == self.session_id).first()
+    """
+    Memória de conversa persistida no PostgreSQL.
+
+    ``session_id`` é a chave inteira da sessão no banco, obtida com
+    ``resolve_conversation`` (que também cria a sessão). Todo o acesso ao banco é assíncrono (AsyncSession), para não bloquear o
+    event loop do orquestrador. Use ``PGConversationMemory.load`` para criar a
+    instância já com o histórico da sessão carregado.
+    """
+    session_id: int
+    db_session: AsyncSession
+    # Resumo acumulado das mensagens que já saíram da janela de contexto
+    summary: Optional[str] = None
+    summarized_until_message_id: Optional[int] = None
+    # IDs no banco das mensagens em ``chat_memory``, na mesma ordem
+    message_ids: List[int] = []
+
+    def __init__(self, session_id: int, db_session: AsyncSession, **kwargs):
+        super().__init__(session_id=session_id, db_session=db_session, **kwargs)
+
+    @classmethod
+    async def load(cls, session_id: int, db_session: AsyncSession, **kwargs) -> PGConversationMemory:
+        """Cria a memória e carrega o histórico da sessão do banco de dados."""
+        memory = cls(session_id=session_id, db_session=db_session, **kwargs)
+        await memory._load_messages()
+        return memory
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Mensagens da sessão carregadas em memória."""
+        return self.chat_memory.messages
+
+    async def _load_messages(self):
+        """
+        Carrega o resumo da sessão e as mensagens que ainda não entraram nele.
+        Mensagens já resumidas não são lidas do banco.
+        """
+        session = await self.db_session.get(SessionModel, self.session_id)
         if session:
-            return session
-
-        # A lógica de criação agora está em um único lugar.
-        logger.info(f"Sessão de conversa não encontrada para o id '{self.session_id}'. Criando uma nova.")
-        user = self.db_session.query(User).filter_by(username="igor").first()
-        if not user:
-            # Em um sistema real, isso deveria levantar um erro ou criar o usuário
-            raise ValueError("Usuário padrão 'igor' não encontrado no banco de dados.")
-        
-        new_session = SessionModel(session_id=self.session_id, user_id=user.user_id)
-        self.db_session.add(new_session)
-        self.db_session.flush() # Garante que a sessão tenha um ID antes do commit
-        return new_session
-
-    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
-        """Salva o contexto da interação no banco de dados, não apenas na memória."""
-        super().save_context(inputs, outputs)
-        messages_to_save = messages_to_dict(self.chat_memory.messages[-2:])
-        
-        # USA O MÉTODO CENTRALIZADO
-        session = self._get_or_create_session()
-
-        for msg_dict in messages_to_save:
-            history_entry = HistoryModel(
-                session_id=session.id,
-                role=msg_dict.get('type'),
-                content=msg_dict,
+            self.summary = session.summary
+            self.summarized_until_message_id = session.summarized_until_message_id
+
+        query = select(HistoryModel.message_id, HistoryModel.content).where(
+            HistoryModel.session_id == self.session_id
+        )
+        if self.summarized_until_message_id is not None:
+            query = query.where(HistoryModel.message_id > self.summarized_until_message_id)
+        result = await self.db_session.execute(query.order_by(HistoryModel.message_id))
+        for message_id, content in result:
+            self.chat_memory.messages.extend(messages_from_dict([json.loads(content)]))
+            self.message_ids.append(message_id)
+
+    async def update_summary(self, summary: str, until_message_id: int) -> None:
+        """Grava o novo resumo da sessão e até qual mensagem ele cobre."""
+        session = await self._get_session()
+        session.summary = summary
+        session.summarized_until_message_id = until_message_id
+        await self.db_session.commit()
+        self.summary = summary
+        self.summarized_until_message_id = until_message_id
+
+    async def _get_session(self) -> SessionModel:
+        """Busca a sessão de conversa no DB (criada por ``resolve_conversation``)."""
+        session = await self.db_session.get(SessionModel, self.session_id)
+        if session is None:
+            raise ValueError(f"Sessão de conversa {self.session_id} não encontrada.")
+        return session
+
+    async def _add_history_entries(self, message_dicts: List[dict]) -> List[HistoryModel]:
+        entries = [
+            HistoryModel(
+                session_id=self.session_id,
+                role=message_dict.get("type"),
+                content=json.dumps(message_dict, ensure_ascii=False),
             )
-            self.db_session.add(history_entry)
-        
-        self.db_session.commit()
+            for message_dict in message_dicts
+        ]
+        self.db_session.add_all(entries)
+        await self.db_session.commit()
+        self.message_ids.extend(entry.message_id for entry in entries)
+        return entries
 
-    def save_message_and_get_id(self, message_dict: dict) -> int | None:
-        """Salva uma única mensagem no histórico e retorna seu ID no banco de dados."""
-        # USA O MÉTODO CENTRALIZADO
-        session = self._get_or_create_session()
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """Salva o contexto da interação no banco de dados, não apenas na memória."""
+        input_str, output_str = self._get_input_output(inputs, outputs)
+        new_messages = [HumanMessage(content=input_str), AIMessage(content=output_str)]
+        self.chat_memory.messages.extend(new_messages)
+        await self._add_history_entries(messages_to_dict(new_messages))
 
-        history_entry = HistoryModel(
-            session_id=session.id,
-            role=message_dict.get("type"),
-            content=message_dict,
-        )
-        self.db_session.add(history_entry)
-        self.db_session.commit()
-        return history_entry.message_id
+    async def save_message_and_get_id(self, message_dict: dict) -> int | None:
+        """Salva uma única mensagem no histórico e retorna seu ID no banco de dados."""
+        self.chat_memory.messages.extend(messages_from_dict([message_dict]))
+        entries = await self._add_history_entries([message_dict])
+        return entries[0].message_id
@@ -0,0 +1,77 @@
+"""Cache em processo do system prompt renderizado por usuário."""
+from __future__ import annotations
+
+import time
+
+from config.prompts import SYSTEM_PROMPT
+
+
+def render_system_prompt(preferences: list[str] | None) -> str:
+    """
+    Monta o system prompt com os fatos conhecidos sobre o usuário.
+
+    Os fatos são ordenados para que o prompt seja byte a byte idêntico entre
+    turnos enquanto as preferências não mudam: o backend do LLM só reaproveita
+    o cache de prefixo se o início do prompt não mudar.
+    """
+    if not preferences:
+        return SYSTEM_PROMPT
+    facts = "\n".join(f"- {fact}" for fact in sorted(preferences))
+    return f"{SYSTEM_PROMPT}\n\nFatos conhecidos sobre o usuário:\n{facts}"
+
+
+class SystemPromptCache:
+    """
+    Guarda o system prompt de cada usuário.
+
+    As preferências só mudam quando o memory_summarizer roda, e ele publica um
+    evento que invalida a entrada. O TTL é só uma rede de segurança para o caso
+    de o evento se perder.
+
+    Cada invalidação avança a geração do usuário. Quem leu o banco numa falta
+    do cache passa a geração lida antes da consulta para ``set``: se uma
+    invalidação chegou no meio, o prompt lido já está velho e não é guardado.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: dict[str, tuple[float, str]] = {}
+        # Invalidações de todos os usuários e de cada um
+        self._generation = 0
+        self._user_generations: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str) -> str | None:
+        entry = self._entries.get(username)
+        if entry is None or time.monotonic() - entry[0] > self.ttl_seconds:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def generation(self, username: str) -> tuple[int, int]:
+        """Geração atual do usuário; muda a cada invalidação que o afeta."""
+        return self._generation, self._user_generations.get(username, 0)
+
+    def set(self, username: str, prompt: str, generation: tuple[int, int] | None = None) -> bool:
+        """
+        Guarda o prompt. Com ``generation`` (lida antes da consulta ao banco),
+        só guarda se nenhuma invalidação chegou desde então.
+        """
+        if generation is not None and generation != self.generation(username):
+            return False
+        self._entries[username] = (time.monotonic(), prompt)
+        return True
+
+    def invalidate(self, username: str | None = None) -> None:
+        """Invalida o prompt de um usuário (ou de todos, se ``username`` for None)."""
+        if username is None:
+            self._generation += 1
+            self._entries.clear()
+        else:
+            self._user_generations[username] = self._user_generations.get(username, 0) + 1
+            self._entries.pop(username, None)
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
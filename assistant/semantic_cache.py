@@ -0,0 +1,201 @@
+"""Cache semântico de respostas: atalho para perguntas repetidas, sem chamar o LLM."""
+from __future__ import annotations
+
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Mapping, Sequence
+
+import numpy as np
+from langchain_core.messages import BaseMessage
+from loguru import logger
+
+EmbedFn = Callable[[str], Awaitable[Sequence[float]]]
+
+
+def normalize_query(text: str) -> str:
+    """Normaliza a transcrição: minúsculas, sem acentos, sem pontuação, espaços únicos."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def tools_used_in_turn(messages: Sequence[BaseMessage]) -> set[str]:
+    """Nomes das ferramentas chamadas pelo agente depois da última mensagem do usuário."""
+    names: set[str] = set()
+    for message in reversed(messages):
+        if message.type == "human":
+            break
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            names.add(tool_call.get("name"))
+    return names
+
+
+@dataclass
+class _Entry:
+    vector: np.ndarray
+    reply: str
+    expires_at: float
+    size: int
+
+
+class SemanticResponseCache:
+    """
+    Guarda respostas do agente indexadas pelo embedding da pergunta normalizada.
+
+    Uma pergunta nova é respondida do cache se a similaridade de cosseno com
+    alguma pergunta já vista *do mesmo escopo* (o usuário) passar do limiar.
+    O cache é limitado por número de entradas e por bytes, com despejo LRU.
+
+    Cada entrada tem seu próprio TTL: o menor entre o padrão, o das
+    ferramentas usadas no turno (``tool_ttls``) e, se a pergunta citar um termo
+    que depende do momento ("hoje", "agora"...), ``volatile_ttl_seconds``.
+    TTL zero significa não guardar. Também não são guardados os turnos que
+    usaram ferramentas com efeito colateral (ex: ``open_application``), já que
+    repetir a resposta sem repetir a ação seria errado, nem os que dependeram
+    do histórico da conversa.
+    """
+
+    def __init__(
+        self,
+        embed: EmbedFn,
+        threshold: float,
+        ttl_seconds: float,
+        max_entries: int,
+        max_bytes: int,
+        uncacheable_tools: Iterable[str] = (),
+        tool_ttls: Mapping[str, float] | None = None,
+        volatile_terms: Iterable[str] = (),
+        volatile_ttl_seconds: float = 0.0,
+    ):
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.uncacheable_tools = set(uncacheable_tools)
+        self.tool_ttls = dict(tool_ttls or {})
+        self.volatile_terms = {normalize_query(term) for term in volatile_terms}
+        self.volatile_ttl_seconds = volatile_ttl_seconds
+        # Chave: (escopo, pergunta normalizada)
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        # Embeddings calculados em lookups que erraram, reaproveitados no store()
+        self._pending_vectors: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.skipped = 0
+
+    async def lookup(self, text: str, scope: str = "") -> str | None:
+        """Retorna a resposta guardada para uma pergunta equivalente do mesmo escopo, se houver."""
+        normalized = normalize_query(text)
+        key = (scope, normalized)
+        self._purge_expired()
+
+        entry = self._entries.get(key)
+        candidates = [(k, e) for k, e in self._entries.items() if k[0] == scope]
+        if entry is None and candidates:
+            vector = await self._vector(normalized)
+            self._remember_vector(normalized, vector)
+            best_score = self.threshold
+            for candidate_key, candidate in candidates:
+                score = float(np.dot(vector, candidate.vector))
+                if score >= best_score:
+                    best_score, entry, key = score, candidate, candidate_key
+
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        logger.debug(f"Cache semântico: acerto para '{text}' -> '{key[1]}'.")
+        return entry.reply
+
+    def ttl_for(self, text: str, tools_used: Iterable[str] = ()) -> float:
+        """TTL de uma resposta: o menor entre o padrão, o das ferramentas usadas e o de perguntas voláteis."""
+        ttls = [self.ttl_seconds]
+        ttls.extend(self.tool_ttls[name] for name in tools_used if name in self.tool_ttls)
+        if self.volatile_terms.intersection(normalize_query(text).split()):
+            ttls.append(self.volatile_ttl_seconds)
+        return min(ttls)
+
+    async def store(
+        self,
+        text: str,
+        reply: str,
+        tools_used: Iterable[str] = (),
+        ttl_seconds: float | None = None,
+        scope: str = "",
+        context_dependent: bool = False,
+    ) -> bool:
+        """
+        Guarda a resposta de um turno no escopo ``scope``, a menos que ele tenha
+        usado ferramentas com efeito colateral ou dependido do histórico da
+        conversa (``context_dependent``). ``ttl_seconds`` sobrepõe o TTL
+        calculado por ``ttl_for``; TTL zero ou negativo não guarda.
+        """
+        tools_used = set(tools_used)
+        ttl = self.ttl_for(text, tools_used) if ttl_seconds is None else ttl_seconds
+        blocked = self.uncacheable_tools.intersection(tools_used)
+        if blocked or context_dependent or ttl <= 0 or not reply:
+            self.skipped += 1
+            return False
+
+        normalized = normalize_query(text)
+        vector = self._pending_vectors.pop(normalized, None)
+        if vector is None:
+            vector = await self._vector(normalized)
+        size = vector.nbytes + len(reply.encode("utf-8"))
+        if size > self.max_bytes:
+            self.skipped += 1
+            return False
+
+        key = (scope, normalized)
+        self._remove(key)
+        self._entries[key] = _Entry(vector, reply, time.monotonic() + ttl, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+        return True
+
+    def stats(self) -> dict[str, float | int]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "skipped": self.skipped,
+        }
+
+    async def _vector(self, key: str) -> np.ndarray:
+        """Embedding normalizado (norma 1), para que o produto escalar seja o cosseno."""
+        vector = np.asarray(await self.embed(key), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remember_vector(self, key: str, vector: np.ndarray) -> None:
+        self._pending_vectors[key] = vector
+        while len(self._pending_vectors) > 64:
+            self._pending_vectors.popitem(last=False)
+
+    def _remove(self, key: tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry:
+            self.bytes -= entry.size
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if e.expires_at <= now]:
+            self._remove(key)
+            self.expirations += 1
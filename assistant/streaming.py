@@ -0,0 +1,108 @@
+"""Utilitários para o pipeline de voz em streaming (texto -> frases -> áudio)."""
+from __future__ import annotations
+
+import re
+
+# Fim de frase: pontuação terminal seguida de espaço, ou quebra de linha.
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+class SentenceSegmenter:
+    """
+    Corta um fluxo de tokens do LLM em frases completas.
+
+    Os tokens são acumulados até que um fim de frase seja encontrado. Frases
+    muito curtas (ex: "Sim.") são agrupadas com a seguinte para evitar chunks
+    de áudio minúsculos, que custam quase o mesmo tempo de síntese.
+    """
+
+    def __init__(self, min_chars: int = 20):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, token: str) -> list[str]:
+        """Adiciona um token e retorna as frases que ficaram completas."""
+        self._buffer += token
+        sentences: list[str] = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            candidate = self._buffer[start:match.start()].strip()
+            if len(candidate) < self.min_chars:
+                continue
+            sentences.append(candidate)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> str | None:
+        """Retorna o texto restante no buffer, se houver."""
+        remaining = self._buffer.strip()
+        self._buffer = ""
+        return remaining or None
+
+
+class ChunkSequencer:
+    """
+    Reordena os chunks de áudio de um job pelo número de sequência.
+
+    Com mais de um worker TTS os chunks podem chegar fora de ordem; este
+    buffer só libera um chunk quando todos os anteriores já foram entregues.
+    Chunks que falharam na síntese são registrados como ``None`` e pulados.
+    """
+
+    def __init__(self) -> None:
+        self.next_seq = 0
+        self.total: int | None = None
+        self._pending: dict[int, bytes | None] = {}
+
+    def push(self, seq: int, data: bytes | None) -> list[bytes]:
+        """Registra um chunk e retorna, em ordem, os chunks prontos para envio."""
+        if seq >= self.next_seq:
+            self._pending[seq] = data
+        ready: list[bytes] = []
+        while self.next_seq in self._pending:
+            chunk = self._pending.pop(self.next_seq)
+            self.next_seq += 1
+            if chunk:
+                ready.append(chunk)
+        return ready
+
+    def close(self, total: int) -> None:
+        """Informa quantos chunks foram publicados no total para o job."""
+        self.total = total
+
+    @property
+    def done(self) -> bool:
+        return self.total is not None and self.next_seq >= self.total
+
+
+class PartialSequencer:
+    """
+    Filtra as transcrições parciais de cada job pelo número de sequência.
+
+    Só passa a parcial mais nova que a última encaminhada: as repetidas, as
+    que chegam fora de ordem e as que chegam depois do texto final são
+    descartadas. O estado de um job é removido com ``forget`` quando ele
+    termina, sem varrer os demais.
+    """
+
+    def __init__(self) -> None:
+        self._last_seq: dict[str, float] = {}
+
+    def accept(self, job_id: str, seq: int) -> bool:
+        """Registra a parcial e diz se ela deve ser encaminhada ao cliente."""
+        if seq <= self._last_seq.get(job_id, 0):
+            return False
+        self._last_seq[job_id] = seq
+        return True
+
+    def close(self, job_id: str) -> None:
+        """O texto final do job chegou: nenhuma parcial passa a partir daqui."""
+        self._last_seq[job_id] = float("inf")
+
+    def forget(self, job_id: str) -> None:
+        """Descarta o estado do job (chamado quando o job é liberado)."""
+        self._last_seq.pop(job_id, None)
+
+    def __len__(self) -> int:
+        return len(self._last_seq)
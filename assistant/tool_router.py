@@ -0,0 +1,68 @@
+"""Seleção das ferramentas relevantes para cada turno, por similaridade de embeddings."""
+from __future__ import annotations
+
+from typing import Awaitable, Callable, Iterable, Sequence
+
+import numpy as np
+from loguru import logger
+
+EmbedDocumentsFn = Callable[[list[str]], Awaitable[list[Sequence[float]]]]
+EmbedQueryFn = Callable[[str], Awaitable[Sequence[float]]]
+
+
+def _unit_rows(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class ToolRouter:
+    """
+    Escolhe quais ferramentas vão para o prompt de cada turno.
+
+    As descrições das ferramentas (as mesmas gravadas na tabela ``tools``) são
+    embutidas uma única vez em ``index``. A cada turno, a mensagem do usuário é
+    comparada com elas e só as ``top_k`` mais próximas, mais as fixas
+    (``pinned``), são vinculadas ao LLM: o prompt não cresce junto com o
+    número de ferramentas. Sem índice, ou se o embedding falhar, todas são usadas.
+    """
+
+    def __init__(
+        self,
+        embed_documents: EmbedDocumentsFn,
+        embed_query: EmbedQueryFn,
+        top_k: int,
+        pinned: Iterable[str] = (),
+    ):
+        self.embed_documents = embed_documents
+        self.embed_query = embed_query
+        self.top_k = top_k
+        self.pinned = set(pinned)
+        self.names: list[str] = []
+        self._matrix: np.ndarray | None = None
+
+    async def index(self, descriptions: dict[str, str]) -> None:
+        """Calcula os embeddings das descrições (nome -> descrição), na ordem do mapa."""
+        names = list(descriptions)
+        vectors = await self.embed_documents([f"{name}: {descriptions[name]}" for name in names])
+        self.names = names
+        self._matrix = _unit_rows(vectors)
+        logger.info(f"Roteador de ferramentas indexou {len(names)} ferramentas.")
+
+    async def select(self, text: str) -> tuple[str, ...] | None:
+        """
+        Nomes das ferramentas para o turno, na ordem do índice (a mesma seleção
+        gera sempre a mesma tupla). Retorna None quando todas devem ser usadas.
+        """
+        if self._matrix is None or len(self.names) <= self.top_k:
+            return None
+        try:
+            query = _unit_rows([await self.embed_query(text)])[0]
+        except Exception:
+            logger.exception("Falha no embedding da mensagem; usando todas as ferramentas.")
+            return None
+
+        scores = self._matrix @ query
+        chosen = {self.names[i] for i in np.argsort(-scores)[: self.top_k]}
+        chosen |= self.pinned
+        return tuple(name for name in self.names if name in chosen)
@@ -0,0 +1,113 @@
+"""Registro assíncrono e em lote do uso das ferramentas do agente."""
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+from langchain_core.messages import ToolMessage
+from loguru import logger
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import ToolUsageLog
+
+
+class ToolUsageWriter:
+    """
+    Grava os ``ToolUsageLog`` fora do caminho crítico do agente.
+
+    O nó de ferramentas só enfileira a linha (sem I/O); uma task de fundo junta
+    até ``batch_size`` linhas, ou o que chegar em ``flush_interval_seconds``, e
+    faz um único INSERT em lote. O ``tool_id`` vem de um mapa nome -> id montado
+    na inicialização por ``sync_tools_to_db``, sem consulta por chamada.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], AsyncSession],
+        batch_size: int = 50,
+        flush_interval_seconds: float = 1.0,
+        max_pending: int = 10_000,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=max_pending)
+        self.tool_ids: dict[str, int] = {}
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def set_tool_ids(self, tool_ids: dict[str, int]) -> None:
+        self.tool_ids = dict(tool_ids)
+
+    def record(self, message_id: int, tool_call: dict, result: ToolMessage) -> None:
+        """Enfileira o registro de uma chamada de ferramenta. Nunca bloqueia."""
+        tool_name = tool_call.get("name")
+        tool_id = self.tool_ids.get(tool_name)
+        if tool_id is None:
+            # Ferramenta desconhecida ou fora da tabela 'tools': não há FK para gravar
+            logger.debug(f"Uso da ferramenta '{tool_name}' não registrado: ferramenta sem tool_id.")
+            self.dropped += 1
+            return
+
+        row = {
+            "message_id": message_id,
+            "tool_id": tool_id,
+            "call_parameters": tool_call.get("args"),
+            "output": str(result.content),
+            "status": getattr(result, "status", None) or "success",
+            # Momento da chamada, não o da gravação em lote
+            "timestamp": datetime.now(timezone.utc),
+        }
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            logger.warning(f"Fila de registros de ferramentas cheia; uso de '{tool_name}' descartado.")
+            self.dropped += 1
+
+    async def run(self) -> None:
+        """Loop da task de fundo: grava os registros em lotes."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval_seconds
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._write(batch)
+
+    async def flush(self) -> None:
+        """Grava o que ainda estiver na fila (usado no shutdown)."""
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+            if len(batch) >= self.batch_size:
+                await self._write(batch)
+                batch = []
+        if batch:
+            await self._write(batch)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "pending": self._queue.qsize(),
+            "written": self.written,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    async def _write(self, batch: list[dict[str, Any]]) -> None:
+        try:
+            async with self.session_factory() as db:
+                await db.execute(insert(ToolUsageLog), batch)
+                await db.commit()
+            self.written += len(batch)
+        except Exception:
+            logger.exception(f"Falha ao gravar {len(batch)} registros de uso de ferramentas.")
+            self.failed += len(batch)
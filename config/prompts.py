@@ -29,3 +29,18 @@ CONVERSA:
 
 FATOS E PREFERÊNCIAS EXTRAÍDOS:
 """
+
+ROLLING_SUMMARY_PROMPT = """
+Você mantém um resumo curto de uma conversa em andamento entre um usuário e seu assistente Jarvis.
+Atualize o resumo atual incorporando as novas mensagens. Preserve pedidos em aberto, decisões,
+nomes e dados concretos; descarte cumprimentos e detalhes irrelevantes.
+Responda apenas com o novo resumo, em no máximo um parágrafo.
+
+RESUMO ATUAL:
+{previous_summary}
+
+NOVAS MENSAGENS:
+{new_lines}
+
+NOVO RESUMO:
+"""
@@ -3,10 +3,11 @@ from __future__ import annotations
 
 from pathlib import Path
 import time
-from typing import Generator
+from typing import AsyncGenerator, Generator
 
 from loguru import logger
 from sqlalchemy import create_engine, text, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 
 from config.settings import settings, ROOT_DIR
@@ -21,6 +22,14 @@ SessionLocal = sessionmaker(
     autocommit=False, autoflush=False, bind=engine, future=True
 )
 
+# Engine e sessões assíncronas, usados no caminho crítico do orquestrador para
+# que consultas ao Postgres não bloqueiem o event loop.
+async_engine: AsyncEngine = create_async_engine(settings.db.async_dsn, echo=False, pool_pre_ping=True)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
 def get_db() -> Generator[Session, None, None]:
     """Dependência do FastAPI para obter uma sessão de banco de dados."""
     db = SessionLocal()
@@ -30,6 +39,18 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Dependência do FastAPI para obter uma sessão assíncrona de banco de dados."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Alterações idempotentes aplicadas a bancos que já têm o schema
+SCHEMA_MIGRATIONS = [
+    "ALTER TABLE conversation_sessions ADD COLUMN IF NOT EXISTS summarized_until_message_id INTEGER",
+]
+
+
 def init_db_if_needed() -> None:
     """Aplica o schema.sql se as tabelas ainda não existirem."""
     # A função agora usa o 'engine' global.
@@ -53,6 +74,10 @@ def init_db_if_needed() -> None:
         ).scalar()
 
         if exists:
+            # Migrações aditivas para bancos criados com versões anteriores do schema
+            for stmt in SCHEMA_MIGRATIONS:
+                conn.execute(text(stmt))
+            conn.commit()
             logger.info("Schema já existente. Nenhuma ação necessária.")
             return
 
@@ -68,4 +93,12 @@ def init_db_if_needed() -> None:
 
 
 # Exporta os objetos necessários para outros arquivos
-__all__ = ["engine", "get_db", "init_db_if_needed", "SessionLocal"]
\ No newline at end of file
+__all__ = [
+    "engine",
+    "get_db",
+    "init_db_if_needed",
+    "SessionLocal",
+    "async_engine",
+    "get_async_db",
+    "AsyncSessionLocal",
+]
\ No newline at end of file
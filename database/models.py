@@ -39,6 +39,7 @@ class ConversationSession(Base):
 	user_id: Mapped[int] = mapped_column(ForeignKey("users.user_id"), nullable=False)
 	start_time: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True))
 	summary: Mapped[Optional[str]] = mapped_column(Text)
+	summarized_until_message_id: Mapped[Optional[int]] = mapped_column(Integer)
 	is_summarized: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
 	
 	user: Mapped[User] = relationship("User", back_populates="sessions")
@@ -18,6 +18,9 @@ CREATE TABLE conversation_sessions (
     -- Um resumo gerado pelo LLM no final da sessão pode ser armazenado aqui
     -- para alimentar a memória de longo prazo de forma eficiente.
     summary TEXT,
+    -- Última mensagem já incorporada ao resumo acima. Mensagens posteriores
+    -- ainda são enviadas ao LLM na íntegra (janela de contexto).
+    summarized_until_message_id INTEGER,
     is_summarized BOOLEAN NOT NULL DEFAULT FALSE
 );
 
@@ -50,7 +50,12 @@ def main():
 
     try:
         while True:
-            if state == ClientState.PROCESSING:
+            if state == ClientState.PROCESSING and settings.api.live_audio_upload:
+                # Envia o áudio enquanto o usuário fala; o STT reconhece em paralelo
+                asyncio.run(stream_command_over_websocket(orchestrator_ws_url, audio_manager, audio_output))
+                state = ClientState.LISTENING
+                logger.info("Ouvindo novamente...")
+            elif state == ClientState.PROCESSING:
                 with tempfile.NamedTemporaryFile(suffix=".wav", delete=True) as tmp_file:
                     command_audio_path = Path(tmp_file.name)
                     audio_manager.record_command(command_audio_path)
@@ -86,34 +91,71 @@ def main():
         stop_event.set()
         listener_thread.join()
 
+async def stream_command_over_websocket(uri, audio_manager, audio_output):
+    """Transmite o comando ao vivo pelo WebSocket e recebe a resposta na mesma conexão."""
+    sample_rate = audio_manager.detector.sample_rate
+    ws_uri = f"{uri}/v2/interact/stream?sample_rate={sample_rate}"
+    logger.info(f"Conectando ao WebSocket: {ws_uri}")
+    try:
+        async with websockets.connect(ws_uri, timeout=120) as websocket:
+            handshake = json.loads(await websocket.recv())
+            if "error" in handshake:
+                logger.error(f"Recebido erro do orquestrador: {handshake}")
+                return
+            logger.info(f"Job iniciado com ID: {handshake['job_id']}. Gravando comando...")
+
+            # A leitura do microfone é bloqueante: cada frame é lido fora do event loop
+            frames = audio_manager.capture_command_frames()
+            while (frame := await asyncio.to_thread(next, frames, None)) is not None:
+                await websocket.send(frame)
+            await websocket.send(json.dumps({"event": "end"}))
+            logger.success("Gravação finalizada. Aguardando resposta...")
+
+            await receive_reply(websocket, audio_output)
+    except websockets.exceptions.ConnectionClosedOK:
+        logger.info("Conexão WebSocket encerrada pelo orquestrador.")
+    except websockets.exceptions.ConnectionClosed as e:
+        logger.warning(f"Conexão WebSocket fechada: {e}")
+    except Exception:
+        logger.exception("Erro na comunicação WebSocket:")
+
 async def handle_websocket_communication(uri, job_id, audio_output):
     """Gerencia a comunicação WebSocket para um job específico."""
     ws_uri = f"{uri}/v2/interact/ws/{job_id}"
     logger.info(f"Conectando ao WebSocket: {ws_uri}")
     try:
         async with websockets.connect(ws_uri, timeout=120) as websocket:
-            while True:
-                message = await websocket.recv()
-                if isinstance(message, str):
-                    # Mensagens de status ou erro em JSON
-                    data = json.loads(message)
-                    if "error" in data:
-                        logger.error(f"Recebido erro do orquestrador: {data}")
-                        # TODO: Reproduzir um som de erro genérico
-                        break
-                    else:
-                        logger.info(f"Status update: {data}")
-                elif isinstance(message, bytes):
-                    # Resposta de áudio final
-                    logger.info(f"Recebido stream de áudio de {len(message)} bytes. Reproduzindo...")
-                    audio_output.play_audio_stream(message)
-                    logger.info("Reprodução finalizada.")
-                    break  # Finaliza a conexão após receber o áudio
-
+            await receive_reply(websocket, audio_output)
+    except websockets.exceptions.ConnectionClosedOK:
+        logger.info("Conexão WebSocket encerrada pelo orquestrador.")
     except websockets.exceptions.ConnectionClosed as e:
         logger.warning(f"Conexão WebSocket fechada: {e}")
     except Exception:
         logger.exception("Erro na comunicação WebSocket:")
 
+async def receive_reply(websocket, audio_output):
+    """Recebe a resposta de um job (áudio e mensagens de status) até o fim."""
+    while True:
+        message = await websocket.recv()
+        if isinstance(message, str):
+            # Mensagens de status ou erro em JSON
+            data = json.loads(message)
+            if "error" in data:
+                logger.error(f"Recebido erro do orquestrador: {data}")
+                # TODO: Reproduzir um som de erro genérico
+                break
+            elif data.get("status") == "done":
+                # Fim do stream: todos os chunks de áudio já foram recebidos
+                break
+            else:
+                logger.info(f"Status update: {data}")
+        elif isinstance(message, bytes):
+            # Em modo streaming a resposta chega frase a frase; cada chunk
+            # é reproduzido assim que chega. Sem streaming, o servidor
+            # fecha a conexão após o único chunk.
+            logger.info(f"Recebido stream de áudio de {len(message)} bytes. Reproduzindo...")
+            audio_output.play_audio_stream(message)
+            logger.info("Reprodução finalizada.")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
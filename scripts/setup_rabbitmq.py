@@ -10,7 +10,7 @@ EXCHANGE = 'jarvis_events'
 QUEUES = [
     ('stt_jobs_queue', 'stt.requested'),
     ('tts_jobs_queue', 'tts.requested'),
-    ('orchestrator_events_queue', 'stt.completed'),
+    ('orchestrator_agent_queue', 'stt.completed'),
     ('orchestrator_events_queue', 'stt.failed'),
     ('orchestrator_events_queue', 'tts.completed'),
     ('orchestrator_events_queue', 'tts.failed'),
@@ -15,9 +15,12 @@ from database.connection import SessionLocal
 from database.models import Tool
 from tools.__all_tools__ import get_all_tools
 
-def sync_tools_to_db():
+def sync_tools_to_db() -> dict[str, int]:
     """
     Sincroniza as ferramentas definidas no código Python com a tabela 'tools' no banco de dados.
+
+    Retorna o mapa nome -> tool_id das ferramentas do código, usado pelo
+    orquestrador para registrar o uso sem consultar a tabela a cada chamada.
     """
     logger.info("Iniciando sincronização de ferramentas com o banco de dados...")
     
@@ -48,9 +51,14 @@ def sync_tools_to_db():
             
             db.commit()
             logger.success("Sincronização de ferramentas concluída com sucesso.")
+
+            tool_names = [t.name for t in tools_from_code]
+            rows = db.query(Tool.name, Tool.tool_id).filter(Tool.name.in_(tool_names)).all()
+            return {name: tool_id for name, tool_id in rows}
         except Exception as e:
             logger.opt(exception=True).error(f"Falha ao sincronizar ferramentas: {e}")
             db.rollback()
+            return {}
 
 if __name__ == "__main__":
     sync_tools_to_db()
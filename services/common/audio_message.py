@@ -0,0 +1,94 @@
+"""Formato das mensagens de áudio trafegadas pelo RabbitMQ.
+
+O áudio vai como bytes crus no body da mensagem AMQP, e os metadados
+(job_id, sample rate e codec) vão nos headers, como já é feito em
+``tts.completed``. O formato antigo (JSON com o áudio em base64) continua
+sendo aceito para compatibilidade.
+"""
+from __future__ import annotations
+
+import base64
+import io
+import json
+import wave
+from dataclasses import dataclass
+from typing import Any
+
+AUDIO_CONTENT_TYPE = "application/octet-stream"
+JSON_CONTENT_TYPE = "application/json"
+
+# Codecs suportados pelo STT
+CODEC_WAV = "wav"              # arquivo WAV completo (cabeçalho + PCM)
+CODEC_PCM_S16LE = "pcm_s16le"  # PCM cru, 16-bit little-endian, mono
+
+
+@dataclass
+class AudioMessage:
+    """Áudio de um job, já separado dos metadados de transporte."""
+    job_id: str | None
+    audio: bytes
+    codec: str = CODEC_WAV
+    sample_rate: int | None = None
+    # Áudio ao vivo: o job chega em vários pedaços numerados; o último traz stream_end
+    stream_seq: int | None = None
+    stream_end: bool = False
+
+    @property
+    def is_stream(self) -> bool:
+        return self.stream_seq is not None
+
+
+def wav_sample_rate(audio: bytes) -> int | None:
+    """Lê o sample rate do cabeçalho WAV sem decodificar o áudio."""
+    try:
+        with wave.open(io.BytesIO(audio), "rb") as wf:
+            return wf.getframerate()
+    except (wave.Error, EOFError):
+        return None
+
+
+def build_audio_headers(
+    job_id: str,
+    codec: str = CODEC_WAV,
+    sample_rate: int | None = None,
+    stream_seq: int | None = None,
+    stream_end: bool = False,
+) -> dict[str, Any]:
+    """Monta os headers AMQP de uma mensagem de áudio binária."""
+    headers: dict[str, Any] = {"job_id": job_id, "codec": codec}
+    if sample_rate:
+        headers["sample_rate"] = sample_rate
+    if stream_seq is not None:
+        headers["stream_seq"] = stream_seq
+        headers["stream_end"] = stream_end
+    return headers
+
+
+def parse_audio_message(body: bytes, content_type: str | None, headers: dict | None) -> AudioMessage:
+    """
+    Extrai o áudio de uma mensagem, aceitando o formato binário (áudio no body,
+    metadados nos headers) e o formato legado (JSON com ``audio_bytes`` em base64).
+    """
+    headers = headers or {}
+    if content_type == AUDIO_CONTENT_TYPE or (headers.get("job_id") and content_type != JSON_CONTENT_TYPE):
+        sample_rate = headers.get("sample_rate")
+        stream_seq = headers.get("stream_seq")
+        return AudioMessage(
+            job_id=headers.get("job_id"),
+            audio=body,
+            codec=headers.get("codec", CODEC_WAV),
+            sample_rate=int(sample_rate) if sample_rate else None,
+            stream_seq=int(stream_seq) if stream_seq is not None else None,
+            stream_end=bool(headers.get("stream_end", False)),
+        )
+
+    payload = json.loads(body)
+    audio = payload.get("audio_bytes")
+    if isinstance(audio, str):
+        audio = base64.b64decode(audio)
+    return AudioMessage(
+        job_id=payload.get("job_id"),
+        audio=audio or b"",
+        codec=payload.get("codec", CODEC_WAV),
+        sample_rate=payload.get("sample_rate"),
+    )
@@ -6,6 +6,17 @@ import time # Adicionar este import
 from loguru import logger # Adicionar este import
 
 load_dotenv()
+
+
+def reply_routing_key(event, reply_to=None):
+    """
+    Routing key de um evento de conclusão. Se o job veio com ``reply_to`` (a
+    réplica do orquestrador que detém o WebSocket), o evento é endereçado a
+    ela: ex. 'tts.completed.<réplica>'. Sem ``reply_to``, usa a chave genérica.
+    """
+    return f"{event}.{reply_to}" if reply_to else event
+
+
 class MQClient:
     def __init__(self):
         self.url = os.getenv("RABBITMQ_URL")
@@ -70,10 +81,25 @@ class MQClient:
             properties=pika.BasicProperties(delivery_mode=2)
         )
 
-    def start_worker(self, queue_name, callback):
-        """Starts a worker to consume messages from a queue."""
-        self.channel.basic_qos(prefetch_count=1)
-        self.channel.basic_consume(queue=queue_name, on_message_callback=callback)
+    def publish_event(self, routing_key, body, headers=None):
+        """Publica um evento na exchange de tópicos 'jarvis_events'."""
+        self.channel.basic_publish(
+            exchange='jarvis_events',
+            routing_key=routing_key,
+            body=body,
+            properties=pika.BasicProperties(headers=headers)
+        )
+
+    def declare_private_queue(self, queue_name):
+        """Fila só desta conexão, apagada quando o processo desconecta."""
+        self.channel.queue_declare(queue=queue_name, exclusive=True, auto_delete=True)
+
+    def start_worker(self, queue_name, callback, prefetch_count=1, extra_queues=()):
+        """Starts a worker to consume messages from a queue (and, optionally, from extra queues)."""
+        # global_qos: o prefetch vale para o canal, somando todas as filas consumidas
+        self.channel.basic_qos(prefetch_count=prefetch_count, global_qos=bool(extra_queues))
+        for name in (queue_name, *extra_queues):
+            self.channel.basic_consume(queue=name, on_message_callback=callback)
         
         print(f"[*] Worker started for queue '{queue_name}'. To exit press CTRL+C")
         try:
@@ -0,0 +1,49 @@
+"""Contexto de rastreamento de latência propagado nos headers AMQP.
+
+Quem publica um pedido marca o instante de envio (``stamp``); o serviço que
+consome calcula quanto tempo a mensagem esperou na fila e, ao responder,
+devolve nos headers o span da sua etapa (espera na fila + tempo de serviço).
+O orquestrador junta os spans de cada job.
+"""
+from __future__ import annotations
+
+import json
+import time
+from typing import Any
+
+SENT_AT_HEADER = "x-trace-sent-at"
+SPANS_HEADER = "x-trace-spans"
+
+
+def stamp(headers: dict[str, Any] | None = None) -> dict[str, Any]:
+    """Retorna os headers com o instante de envio (epoch, em segundos)."""
+    headers = dict(headers or {})
+    headers[SENT_AT_HEADER] = time.time()
+    return headers
+
+
+def queue_wait_ms(headers: dict[str, Any] | None) -> float:
+    """Tempo (ms) desde o envio da mensagem; 0 se ela não veio marcada."""
+    sent_at = (headers or {}).get(SENT_AT_HEADER)
+    if sent_at is None:
+        return 0.0
+    return max(0.0, (time.time() - float(sent_at)) * 1000)
+
+
+def make_span(stage: str, queue_ms: float, service_ms: float) -> dict[str, Any]:
+    return {"stage": stage, "queue_ms": round(queue_ms, 1), "service_ms": round(service_ms, 1)}
+
+
+def attach_spans(headers: dict[str, Any], spans: list[dict[str, Any]]) -> dict[str, Any]:
+    """Adiciona spans aos headers de uma resposta (serializados em JSON)."""
+    headers[SPANS_HEADER] = json.dumps(spans)
+    return headers
+
+
+def read_spans(headers: dict[str, Any] | None) -> list[dict[str, Any]]:
+    raw = (headers or {}).get(SPANS_HEADER)
+    if not raw:
+        return []
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf-8")
+    return json.loads(raw)
@@ -0,0 +1,189 @@
+"""Pool de backends de inferência (hosts Ollama) do serviço LLM."""
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Iterable
+
+import httpx
+from loguru import logger
+
+
+class NoBackendAvailable(Exception):
+    """Nenhum backend saudável atende o modelo pedido."""
+
+
+def is_backend_failure(exc: BaseException) -> bool:
+    """Falhas do host (rede, timeout, 5xx) contam para a ejeção; erros 4xx são da requisição."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+def chat_url(base_url: str) -> str:
+    """URL de chat do backend. Ollama: POST /api/chat; OpenAI: POST /v1/chat/completions."""
+    base_url = base_url.rstrip("/")
+    # Detecta caminho por heurística simples
+    if "openai.com" in base_url or base_url.endswith("/v1/chat/completions"):
+        return base_url
+    return f"{base_url}/api/chat"
+
+
+# Parâmetros de amostragem que o Ollama só lê dentro de "options" (no topo, são ignorados)
+OLLAMA_OPTIONS = ("temperature", "seed")
+
+
+def shape_payload(payload: dict[str, Any], ollama: bool) -> dict[str, Any]:
+    """
+    Adapta a requisição neutra (parâmetros de amostragem no topo, como na API
+    da OpenAI) ao backend que vai atendê-la: no Ollama, eles vão para ``options``.
+    """
+    if not ollama:
+        return payload
+    shaped = {k: v for k, v in payload.items() if k not in OLLAMA_OPTIONS}
+    options = {k: payload[k] for k in OLLAMA_OPTIONS if payload.get(k) is not None}
+    if options:
+        shaped["options"] = {**payload.get("options", {}), **options}
+    return shaped
+
+
+@dataclass
+class Backend:
+    url: str
+    # Modelos que o host atende (vazio = qualquer um)
+    models: set[str] = field(default_factory=set)
+    outstanding: int = 0
+    healthy: bool = True
+    ejected_until: float = 0.0
+    consecutive_failures: int = 0
+    # Média móvel da latência das respostas (ms)
+    latency_ms: float = 0.0
+    # Modelos já carregados na memória do host (afinidade: evita recarregar o modelo)
+    warm_models: set[str] = field(default_factory=set)
+
+    @property
+    def is_ollama(self) -> bool:
+        return chat_url(self.url).endswith("/api/chat")
+
+    def payload(self, payload: dict[str, Any]) -> dict[str, Any]:
+        """A requisição no formato que este backend lê (ver ``shape_payload``)."""
+        return shape_payload(payload, self.is_ollama)
+
+    def available(self, now: float) -> bool:
+        return self.healthy and self.ejected_until <= now
+
+    def supports(self, model: str) -> bool:
+        return not self.models or model in self.models
+
+
+class BackendPool:
+    """
+    Escolhe o backend de cada requisição.
+
+    Entre os backends disponíveis que atendem o modelo, vence o com menos
+    requisições em andamento (empate: menor latência média). Hosts com o
+    modelo já carregado têm preferência enquanto não estiverem mais de
+    ``affinity_slack`` requisições acima do menos ocupado. Um backend que
+    falha ``failure_threshold`` vezes seguidas é ejetado por ``eject_seconds``
+    e depois volta a receber requisições; o health check periódico tira do
+    pool os hosts que não respondem e atualiza os modelos carregados.
+    """
+
+    def __init__(
+        self,
+        backends: Iterable[Backend],
+        failure_threshold: int = 3,
+        eject_seconds: float = 30.0,
+        affinity_slack: int = 2,
+    ):
+        self.backends = list(backends)
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        self.affinity_slack = affinity_slack
+
+    def choose(self, model: str, exclude: Iterable[Backend] = ()) -> Backend:
+        now = time.monotonic()
+        excluded = {id(b) for b in exclude}
+        candidates = [
+            b for b in self.backends if id(b) not in excluded and b.available(now) and b.supports(model)
+        ]
+        if not candidates:
+            raise NoBackendAvailable(f"Nenhum backend disponível para o modelo '{model}'.")
+
+        least_busy = min(b.outstanding for b in candidates)
+        warm = [b for b in candidates if model in b.warm_models and b.outstanding <= least_busy + self.affinity_slack]
+        return min(warm or candidates, key=lambda b: (b.outstanding, b.latency_ms))
+
+    @asynccontextmanager
+    async def acquire(self, model: str, exclude: Iterable[Backend] = ()) -> AsyncIterator[Backend]:
+        """Reserva um backend para uma requisição e registra sucesso/falha ao final."""
+        backend = self.choose(model, exclude)
+        backend.outstanding += 1
+        started_at = time.perf_counter()
+        try:
+            yield backend
+        except Exception as e:
+            if is_backend_failure(e):
+                self.record_failure(backend)
+            raise
+        else:
+            self.record_success(backend, model, (time.perf_counter() - started_at) * 1000)
+        finally:
+            backend.outstanding -= 1
+
+    def record_success(self, backend: Backend, model: str, latency_ms: float) -> None:
+        backend.consecutive_failures = 0
+        backend.warm_models.add(model)
+        backend.latency_ms = latency_ms if not backend.latency_ms else 0.8 * backend.latency_ms + 0.2 * latency_ms
+
+    def record_failure(self, backend: Backend) -> None:
+        backend.consecutive_failures += 1
+        if backend.consecutive_failures >= self.failure_threshold:
+            backend.ejected_until = time.monotonic() + self.eject_seconds
+            logger.warning(
+                f"Backend {backend.url} ejetado por {self.eject_seconds:g}s após "
+                f"{backend.consecutive_failures} falhas seguidas."
+            )
+
+    async def check_health(self, client: httpx.AsyncClient) -> None:
+        """Consulta cada backend; no Ollama, /api/ps também informa os modelos carregados."""
+        for backend in self.backends:
+            try:
+                if backend.is_ollama:
+                    resp = await client.get(f"{backend.url.rstrip('/')}/api/ps", timeout=5)
+                    resp.raise_for_status()
+                    backend.warm_models = {m.get("name") for m in resp.json().get("models", [])}
+                else:
+                    # APIs compatíveis com OpenAI: basta o host responder
+                    await client.get(backend.url, timeout=5)
+            except (httpx.HTTPError, ValueError):
+                if backend.healthy:
+                    logger.warning(f"Health check do backend {backend.url} falhou.")
+                backend.healthy = False
+                continue
+            if not backend.healthy:
+                logger.info(f"Backend {backend.url} voltou a responder ao health check.")
+            # Um backend ejetado só volta ao fim do período de ejeção
+            backend.healthy = True
+
+    async def run_health_checks(self, client: httpx.AsyncClient, interval_seconds: float) -> None:
+        while True:
+            await self.check_health(client)
+            await asyncio.sleep(interval_seconds)
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                "url": b.url,
+                "available": b.available(now),
+                "healthy": b.healthy,
+                "ejected_for_seconds": round(max(0.0, b.ejected_until - now), 1),
+                "outstanding": b.outstanding,
+                "latency_ms": round(b.latency_ms, 1),
+                "warm_models": sorted(m for m in b.warm_models if m),
+            }
+            for b in self.backends
+        ]
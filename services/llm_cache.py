@@ -0,0 +1,147 @@
+"""Cache de respostas e coalescência de requisições idênticas do serviço LLM."""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from loguru import logger
+
+# Status informado ao cliente no header X-Cache
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_SHARED = "shared"
+
+
+def request_fingerprint(endpoint: str, payload: dict[str, Any]) -> str:
+    """
+    Hash da requisição (endpoint, modelo, mensagens, ferramentas e parâmetros).
+    Não inclui o host: a mesma requisição tem o mesmo fingerprint em qualquer backend do pool.
+    """
+    canonical = json.dumps({"endpoint": endpoint, "payload": payload}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(payload: dict[str, Any]) -> bool:
+    """
+    A requisição sempre gera a mesma resposta: temperatura 0 ou seed fixo.
+    Lê os parâmetros onde o backend os lê: no topo (OpenAI) ou em ``options`` (Ollama).
+    """
+    sampling = {**payload, **(payload.get("options") or {})}
+    return sampling.get("temperature") == 0 or sampling.get("seed") is not None
+
+
+class ResponseCache:
+    """
+    Respostas do backend por fingerprint da requisição.
+
+    Requisições idênticas simultâneas compartilham uma única chamada ao
+    backend. Respostas de requisições determinísticas (``is_deterministic``) são
+    guardadas num LRU com TTL; com ``directory``, cada entrada também é gravada
+    em disco e recarregada na inicialização. O disco espelha o LRU: a entrada
+    despejada da memória é apagada do disco.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, directory: str | Path | None = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.directory = Path(directory) if directory else None
+        # Expiração em epoch (e não monotonic) para valer também depois de reiniciar
+        self._entries: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        if self.directory:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._load_from_disk()
+
+    async def get_or_fetch(
+        self, key: str, fetch: Callable[[], Awaitable[dict[str, Any]]], cacheable: bool
+    ) -> tuple[dict[str, Any], str]:
+        """Retorna (resposta, status), chamando ``fetch`` só se não houver resposta guardada ou em andamento."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], CACHE_HIT
+            self._remove(key)
+
+        execution = self._inflight.get(key)
+        if execution is not None:
+            self.shared += 1
+            return await asyncio.shield(execution), CACHE_SHARED
+
+        self.misses += 1
+        execution = asyncio.ensure_future(fetch())
+        self._inflight[key] = execution
+        try:
+            data = await asyncio.shield(execution)
+        finally:
+            if execution.done():
+                self._inflight.pop(key, None)
+            else:
+                # O chamador foi cancelado: a chamada continua para quem a compartilha
+                execution.add_done_callback(lambda _: self._inflight.pop(key, None))
+        if cacheable:
+            self._put(key, data)
+        return data, CACHE_MISS
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+        }
+
+    def _put(self, key: str, data: dict[str, Any]) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        self._entries[key] = (expires_at, data)
+        self._entries.move_to_end(key)
+        if self.directory:
+            self._write_to_disk(key, expires_at, data)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self.directory:
+            try:
+                (self.directory / f"{key}.json").unlink()
+            except FileNotFoundError:
+                pass
+
+    def _write_to_disk(self, key: str, expires_at: float, data: dict[str, Any]) -> None:
+        path = self.directory / f"{key}.json"
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            tmp_path.write_text(json.dumps({"expires_at": expires_at, "data": data}, ensure_ascii=False))
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception(f"Falha ao gravar a resposta em cache no disco: {path}")
+
+    def _load_from_disk(self) -> None:
+        """Carrega as entradas ainda válidas, das mais antigas para as mais recentes."""
+        now = time.time()
+        files = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            try:
+                stored = json.loads(path.read_text())
+            except (OSError, ValueError):
+                path.unlink(missing_ok=True)
+                continue
+            if stored.get("expires_at", 0) <= now:
+                path.unlink(missing_ok=True)
+                continue
+            self._entries[path.stem] = (stored["expires_at"], stored["data"])
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        logger.info(f"Cache de respostas do LLM: {len(self._entries)} entradas carregadas do disco.")
@@ -0,0 +1,179 @@
+"""Métricas de inferência do serviço LLM, expostas no formato texto do Prometheus."""
+from __future__ import annotations
+
+import bisect
+from typing import Any
+
+# Limites superiores dos buckets
+LATENCY_BUCKETS_SECONDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 40, 80, 160, 320, 640, 1280, 2560)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, **extra: str) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...]):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        # Por série: contagem em cada bucket (não cumulativa; o último é o +Inf), soma e total
+        self._series: dict[LabelKey, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, totals = series
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(_label_key(labels))
+        return int(series[1][1]) if series else 0
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, (total, count)) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(key, le=_format_number(bound))} {cumulative}")
+            lines.append(f'{self.name}_bucket{_format_labels(key, le="+Inf")} {int(count)}')
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {int(count)}")
+        return lines
+
+
+class InferenceMetrics:
+    """
+    Contadores e histogramas das chamadas ao backend, por modelo e chamador.
+
+    As estatísticas vêm da própria resposta do Ollama (``prompt_eval_count``,
+    ``eval_count`` e as durações, em nanossegundos). O tempo na fila é o que
+    sobra do tempo de parede da chamada depois de descontar carga do modelo,
+    avaliação do prompt e geração: espera por conexão, rede e fila do backend.
+    Uma chamada com ``load_duration`` acima de ``model_load_threshold_ms``
+    conta como troca/carga de modelo.
+    """
+
+    def __init__(self, model_load_threshold_ms: float = 500.0):
+        self.model_load_threshold_ms = model_load_threshold_ms
+        self.requests = Counter("llm_requests_total", "Requisições recebidas, por endpoint e status do cache.")
+        self.backend_errors = Counter("llm_backend_errors_total", "Chamadas ao backend que falharam.")
+        self.prompt_tokens = Counter("llm_prompt_tokens_total", "Tokens de prompt avaliados pelo backend.")
+        self.generation_tokens = Counter("llm_generation_tokens_total", "Tokens gerados pelo backend.")
+        self.model_loads = Counter("llm_model_loads_total", "Chamadas em que o backend precisou carregar o modelo.")
+        self.time_to_first_token = Histogram(
+            "llm_time_to_first_token_seconds", "Tempo até o primeiro token gerado.", LATENCY_BUCKETS_SECONDS
+        )
+        self.prompt_tokens_per_second = Histogram(
+            "llm_prompt_tokens_per_second", "Velocidade de avaliação do prompt.", TOKENS_PER_SECOND_BUCKETS
+        )
+        self.generation_tokens_per_second = Histogram(
+            "llm_generation_tokens_per_second", "Velocidade de geração.", TOKENS_PER_SECOND_BUCKETS
+        )
+        self.model_load_seconds = Histogram(
+            "llm_model_load_seconds", "Tempo de carga do modelo, quando houve carga.", LATENCY_BUCKETS_SECONDS
+        )
+        self.queue_seconds = Histogram(
+            "llm_queue_seconds", "Tempo da chamada fora da inferência (fila, conexão, rede).", LATENCY_BUCKETS_SECONDS
+        )
+
+    def observe_inference(
+        self,
+        model: str,
+        caller: str,
+        raw: dict[str, Any],
+        wall_ms: float,
+        ttft_ms: float | None = None,
+    ) -> None:
+        """
+        Registra uma chamada concluída. ``raw`` é a resposta (ou o último
+        objeto do stream) do backend; ``ttft_ms`` é o tempo até o primeiro
+        token medido no streaming. Sem ele, é estimado como o tempo de parede
+        menos a duração da geração.
+        """
+        labels = {"model": model, "caller": caller}
+        load_ns = raw.get("load_duration") or 0
+        prompt_ns = raw.get("prompt_eval_duration") or 0
+        eval_ns = raw.get("eval_duration") or 0
+        # APIs compatíveis com OpenAI só informam as contagens, em "usage"
+        usage = raw.get("usage") or {}
+        prompt_count = raw.get("prompt_eval_count") or usage.get("prompt_tokens") or 0
+        eval_count = raw.get("eval_count") or usage.get("completion_tokens") or 0
+
+        self.prompt_tokens.inc(prompt_count, **labels)
+        self.generation_tokens.inc(eval_count, **labels)
+        if prompt_ns and prompt_count:
+            self.prompt_tokens_per_second.observe(prompt_count / (prompt_ns / 1e9), **labels)
+        if eval_ns and eval_count:
+            self.generation_tokens_per_second.observe(eval_count / (eval_ns / 1e9), **labels)
+        if load_ns / 1e6 >= self.model_load_threshold_ms:
+            self.model_loads.inc(**labels)
+            self.model_load_seconds.observe(load_ns / 1e9, **labels)
+
+        if ttft_ms is None and eval_ns:
+            ttft_ms = max(0.0, wall_ms - eval_ns / 1e6)
+        if ttft_ms is not None:
+            self.time_to_first_token.observe(ttft_ms / 1000, **labels)
+        compute_ms = (load_ns + prompt_ns + eval_ns) / 1e6
+        if compute_ms:
+            self.queue_seconds.observe(max(0.0, wall_ms - compute_ms) / 1000, **labels)
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in (
+            self.requests,
+            self.backend_errors,
+            self.prompt_tokens,
+            self.generation_tokens,
+            self.model_loads,
+            self.time_to_first_token,
+            self.prompt_tokens_per_second,
+            self.generation_tokens_per_second,
+            self.model_load_seconds,
+            self.queue_seconds,
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
@@ -1,13 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import json
+import time
 from typing import Any, Dict, List, Optional
 
 import httpx
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from loguru import logger
 
-from config.settings import settings
+from config.settings import settings, ROOT_DIR, LLMBackendConfig
+from services.llm_backends import Backend, BackendPool, NoBackendAvailable, chat_url, is_backend_failure
+from services.llm_cache import ResponseCache, is_deterministic, request_fingerprint
+from services.llm_metrics import InferenceMetrics
 
 class ChatMessage(BaseModel):
 	role: str
@@ -19,6 +26,8 @@ class ChatRequest(BaseModel):
 	model: Optional[str] = None
 	tools: Optional[List[Dict[str, Any]]] = None
 	temperature: Optional[float] = 0.2
+	# Seed fixo torna a amostragem reproduzível (e a resposta cacheável)
+	seed: Optional[int] = None
 
 
 class ChatResponse(BaseModel):
@@ -28,40 +37,204 @@ class ChatResponse(BaseModel):
 
 app = FastAPI(title="LLM Service", version="1.0")
 
+# Cliente HTTP único do serviço: as conexões com o backend são reaproveitadas
+http_client: Optional[httpx.AsyncClient] = None
+# Contadores das requisições ao backend (expostos em /health)
+backend_stats = {"requests": 0, "in_flight": 0, "errors": 0}
+# Hosts de inferência; cada requisição vai para o menos ocupado que atende o modelo
+backend_pool: Optional[BackendPool] = None
+health_check_task: Optional[asyncio.Task] = None
+# Requisições idênticas compartilham a chamada ao backend; as determinísticas ficam em cache
+response_cache: Optional[ResponseCache] = None
+# Header que faz a requisição ignorar o cache e a coalescência (ex: "X-Cache-Bypass: true")
+CACHE_BYPASS_HEADER = "x-cache-bypass"
+# Header com o nome de quem chama (ex: "X-Caller: orchestrator"), usado como label nas métricas
+CALLER_HEADER = "x-caller"
+# Tokens, velocidades, cargas de modelo e fila por modelo e chamador (expostos em /metrics)
+inference_metrics = InferenceMetrics(settings.llm_service.metrics_model_load_threshold_ms)
+
+
+def create_http_client() -> httpx.AsyncClient:
+	"""Cria o cliente com pool limitado, keep-alive e timeouts de conexão e leitura separados."""
+	cfg = settings.llm_service
+	http2 = cfg.http2
+	if http2:
+		try:
+			import h2  # noqa: F401
+		except ImportError:
+			logger.warning("HTTP/2 habilitado, mas o pacote 'h2' não está instalado. Usando HTTP/1.1.")
+			http2 = False
+	return httpx.AsyncClient(
+		http2=http2,
+		limits=httpx.Limits(
+			max_connections=cfg.max_connections,
+			max_keepalive_connections=cfg.max_keepalive_connections,
+			keepalive_expiry=cfg.keepalive_expiry_seconds,
+		),
+		timeout=httpx.Timeout(
+			connect=cfg.connect_timeout_seconds,
+			read=cfg.read_timeout_seconds,
+			write=cfg.connect_timeout_seconds,
+			pool=cfg.pool_timeout_seconds,
+		),
+	)
+
+
+def pool_stats() -> Dict[str, Any]:
+	"""Estado do pool de conexões com o backend."""
+	stats: Dict[str, Any] = dict(backend_stats)
+	# O httpx não expõe o pool publicamente: lê o do httpcore quando disponível
+	pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+	connections = getattr(pool, "connections", None)
+	if connections is not None:
+		idle = sum(1 for conn in connections if conn.is_idle())
+		stats.update({"connections": len(connections), "idle_connections": idle})
+	return stats
+
+
+def create_backend_pool() -> BackendPool:
+	"""Monta o pool com os backends configurados (ou só com ``settings.llm.base_url``)."""
+	cfg = settings.llm_service
+	configured = cfg.backends or [LLMBackendConfig(url=str(settings.llm.base_url))]
+	backends = [Backend(url=b.url, models=set(b.models)) for b in configured]
+	logger.info(f"Pool de backends do LLM: {', '.join(b.url for b in backends)}")
+	return BackendPool(
+		backends,
+		failure_threshold=cfg.backend_failure_threshold,
+		eject_seconds=cfg.backend_eject_seconds,
+		affinity_slack=cfg.backend_affinity_slack,
+	)
+
+
+@app.on_event("startup")
+async def startup_event() -> None:
+	global http_client, response_cache, backend_pool, health_check_task
+	http_client = create_http_client()
+	backend_pool = create_backend_pool()
+	cfg = settings.llm_service
+	health_check_task = asyncio.create_task(
+		backend_pool.run_health_checks(http_client, cfg.health_check_interval_seconds)
+	)
+	if cfg.cache_enabled:
+		response_cache = ResponseCache(
+			max_entries=cfg.cache_max_entries,
+			ttl_seconds=cfg.cache_ttl_seconds,
+			directory=ROOT_DIR / cfg.cache_dir if cfg.cache_dir else None,
+		)
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+	if health_check_task is not None:
+		health_check_task.cancel()
+	if http_client is not None:
+		await http_client.aclose()
+
 
 @app.get("/health")
-async def health() -> Dict[str, str]:
-	return {"status": "ok"}
+async def health() -> Dict[str, Any]:
+	return {
+		"status": "ok",
+		"backend_pool": pool_stats(),
+		"backends": backend_pool.stats() if backend_pool else [],
+		"response_cache": response_cache.stats() if response_cache else None,
+	}
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest) -> ChatResponse:
-	base_url = str(settings.llm.base_url).rstrip("/")
-	# Proxy para API compatível (Ollama chat/openai-like)
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+	"""Métricas de inferência no formato texto do Prometheus."""
+	return PlainTextResponse(inference_metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def caller_label(request: Request) -> str:
+	return request.headers.get(CALLER_HEADER) or "unknown"
+
+
+def build_payload(req: ChatRequest, stream: bool) -> Dict[str, Any]:
+	"""
+	Requisição neutra, com os parâmetros de amostragem no topo. Ela é a base do
+	fingerprint do cache; cada backend recebe a sua versão (``Backend.payload``).
+	"""
 	payload = {
 		"model": req.model or settings.llm.model,
 		"messages": [m.model_dump() for m in req.messages],
-		"temperature": req.temperature or settings.llm.temperature,
+		"temperature": req.temperature if req.temperature is not None else settings.llm.temperature,
+		# O Ollama faz streaming por padrão: o /chat precisa pedir a resposta inteira
+		"stream": stream,
 	}
 	if req.tools:
 		payload["tools"] = req.tools
+	if req.seed is not None:
+		payload["seed"] = req.seed
+	return payload
 
-	logger.debug(f"Enviando para LLM backend {base_url}: {payload.keys()}")
-	try:
-		async with httpx.AsyncClient(timeout=120) as client:
-			# Ollama: POST /api/chat
-			# OpenAI:  POST /v1/chat/completions
-			# Detecta caminho por heurística simples
-			if "openai.com" in base_url or base_url.endswith("/v1/chat/completions"):
-				url = base_url
-			else:
-				url = f"{base_url}/api/chat"
-			resp = await client.post(url, json=payload)
-			resp.raise_for_status()
-			data = resp.json()
-	except httpx.HTTPError as e:
-		logger.exception("Erro ao contatar LLM backend")
-		raise HTTPException(status_code=502, detail=str(e))
+
+async def fetch_completion(payload: Dict[str, Any], caller: str = "unknown") -> Dict[str, Any]:
+	"""
+	Faz a chamada (sem streaming) a um backend do pool e retorna o JSON da
+	resposta. Se o backend falhar (rede, timeout, 5xx), tenta outro.
+	"""
+	tried: List[Backend] = []
+	last_error: Optional[httpx.HTTPError] = None
+	max_attempts = settings.llm_service.backend_max_attempts
+	for attempt in range(1, max_attempts + 1):
+		backend_stats["requests"] += 1
+		backend_stats["in_flight"] += 1
+		try:
+			async with backend_pool.acquire(payload["model"], exclude=tried) as backend:
+				tried.append(backend)
+				url = chat_url(backend.url)
+				logger.debug(f"Enviando para LLM backend {url}: {payload.keys()}")
+				started_at = time.perf_counter()
+				resp = await http_client.post(url, json=backend.payload(payload))
+				resp.raise_for_status()
+				data = resp.json()
+			inference_metrics.observe_inference(
+				payload["model"], caller, data, wall_ms=(time.perf_counter() - started_at) * 1000
+			)
+			return data
+		except NoBackendAvailable as e:
+			# Sem outro backend para tentar: a falha anterior é o erro a devolver
+			if last_error is not None:
+				raise HTTPException(status_code=502, detail=str(last_error))
+			raise HTTPException(status_code=503, detail=str(e))
+		except httpx.HTTPError as e:
+			backend_stats["errors"] += 1
+			inference_metrics.backend_errors.inc(model=payload["model"], caller=caller)
+			last_error = e
+			if is_backend_failure(e) and attempt < max_attempts:
+				logger.warning(f"Backend {tried[-1].url} falhou ({e}); tentando outro.")
+				continue
+			logger.exception("Erro ao contatar LLM backend")
+			raise HTTPException(status_code=502, detail=str(e))
+		finally:
+			backend_stats["in_flight"] -= 1
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest, request: Request, response: Response) -> ChatResponse:
+	payload = build_payload(req, stream=False)
+	caller = caller_label(request)
+
+	bypass = request.headers.get(CACHE_BYPASS_HEADER, "").lower() in ("1", "true", "yes")
+	if response_cache is None or bypass:
+		data = await fetch_completion(payload, caller)
+		response.headers["X-Cache"] = "bypass"
+	else:
+		# Só respostas determinísticas são reaproveitadas depois de prontas: repetir
+		# uma amostra aleatória para todas as requisições iguais mudaria o comportamento.
+		# A decisão olha o que os backends do pool de fato recebem.
+		cacheable = all(is_deterministic(b.payload(payload)) for b in backend_pool.backends)
+		data, status = await response_cache.get_or_fetch(
+			request_fingerprint("chat", payload),
+			lambda: fetch_completion(payload, caller),
+			cacheable=cacheable,
+		)
+		response.headers["X-Cache"] = status
+	inference_metrics.requests.inc(
+		endpoint="chat", cache=response.headers["X-Cache"], model=payload["model"], caller=caller
+	)
 
 	# Normalização simples de resposta
 	content: str = ""
@@ -75,4 +248,149 @@ async def chat(req: ChatRequest) -> ChatResponse:
 	return ChatResponse(content=content, raw=data)
 
 
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+	return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def parse_stream_line(line: str) -> Optional[Dict[str, Any]]:
+	"""
+	Normaliza uma linha do stream do backend em ``{"content", "tool_calls", "done", "raw"}``.
+	Ollama envia NDJSON; APIs compatíveis com OpenAI enviam SSE (``data: {...}``).
+	Retorna None para linhas sem conteúdo (keep-alive, comentários).
+	"""
+	line = line.strip()
+	if not line or line.startswith(":"):
+		return None
+	if line.startswith("data:"):
+		body = line[len("data:"):].strip()
+		if body == "[DONE]":
+			return {"content": "", "tool_calls": [], "done": True, "raw": {}}
+		data = json.loads(body)
+		choice = (data.get("choices") or [{}])[0]
+		delta = choice.get("delta") or {}
+		tool_calls = [
+			{
+				"index": call.get("index", 0),
+				"id": call.get("id"),
+				"name": (call.get("function") or {}).get("name"),
+				# Na API OpenAI os argumentos chegam em pedaços de JSON
+				"arguments": (call.get("function") or {}).get("arguments"),
+			}
+			for call in delta.get("tool_calls") or []
+		]
+		return {
+			"content": delta.get("content") or "",
+			"tool_calls": tool_calls,
+			"done": choice.get("finish_reason") is not None,
+			"raw": data,
+		}
+
+	data = json.loads(line)
+	message = data.get("message") or {}
+	tool_calls = [
+		{
+			"index": index,
+			"id": call.get("id"),
+			"name": (call.get("function") or {}).get("name"),
+			# O Ollama entrega cada chamada completa, com os argumentos já como objeto
+			"arguments": json.dumps((call.get("function") or {}).get("arguments") or {}, ensure_ascii=False),
+		}
+		for index, call in enumerate(message.get("tool_calls") or [])
+	]
+	return {
+		"content": message.get("content") or "",
+		"tool_calls": tool_calls,
+		"done": bool(data.get("done")),
+		"raw": data,
+	}
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, request: Request) -> StreamingResponse:
+	"""
+	Versão em streaming do /chat, em Server-Sent Events.
+
+	Eventos: ``delta`` (``{"content"}`` e/ou ``{"tool_calls"}`` incrementais),
+	``done`` (texto completo, tempo até o primeiro token e estatísticas do
+	backend) e ``error``. Se o cliente desconectar, a requisição ao backend é
+	encerrada, o que interrompe a geração.
+	"""
+	payload = build_payload(req, stream=True)
+	caller = caller_label(request)
+	inference_metrics.requests.inc(endpoint="chat_stream", cache="bypass", model=payload["model"], caller=caller)
+
+	async def events():
+		started_at = time.perf_counter()
+		first_token_ms: Optional[float] = None
+		content_parts: List[str] = []
+		last_raw: Dict[str, Any] = {}
+		tried: List[Backend] = []
+		last_error: Optional[Exception] = None
+		max_attempts = settings.llm_service.backend_max_attempts
+		for attempt in range(1, max_attempts + 1):
+			backend_stats["requests"] += 1
+			backend_stats["in_flight"] += 1
+			try:
+				async with backend_pool.acquire(payload["model"], exclude=tried) as backend:
+					tried.append(backend)
+					attempt_started_at = time.perf_counter()
+					async with http_client.stream("POST", chat_url(backend.url), json=backend.payload(payload)) as resp:
+						resp.raise_for_status()
+						async for line in resp.aiter_lines():
+							if await request.is_disconnected():
+								logger.info("Cliente desconectou; cancelando o stream do backend.")
+								return
+							chunk = parse_stream_line(line)
+							if chunk is None:
+								continue
+							delta: Dict[str, Any] = {}
+							if chunk["content"]:
+								delta["content"] = chunk["content"]
+								content_parts.append(chunk["content"])
+							if chunk["tool_calls"]:
+								delta["tool_calls"] = chunk["tool_calls"]
+							if delta:
+								if first_token_ms is None:
+									first_token_ms = (time.perf_counter() - started_at) * 1000
+								yield sse_event("delta", delta)
+							if chunk["raw"]:
+								last_raw = chunk["raw"]
+							if chunk["done"]:
+								break
+				# Ollama: contagens de tokens e durações vêm no último objeto do stream
+				usage = {k: v for k, v in last_raw.items() if k.endswith(("_count", "_duration")) or k == "usage"}
+				inference_metrics.observe_inference(
+					payload["model"],
+					caller,
+					last_raw,
+					wall_ms=(time.perf_counter() - attempt_started_at) * 1000,
+					ttft_ms=first_token_ms,
+				)
+				yield sse_event("done", {
+					"content": "".join(content_parts),
+					"ttft_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+					"total_ms": round((time.perf_counter() - started_at) * 1000, 1),
+					"usage": usage,
+				})
+				return
+			except NoBackendAvailable as e:
+				yield sse_event("error", {"detail": str(last_error or e)})
+				return
+			except (httpx.HTTPError, ValueError) as e:
+				backend_stats["errors"] += 1
+				inference_metrics.backend_errors.inc(model=payload["model"], caller=caller)
+				last_error = e
+				# Só dá para trocar de backend antes de o cliente receber algum token
+				if first_token_ms is None and is_backend_failure(e) and attempt < max_attempts:
+					logger.warning(f"Backend {tried[-1].url} falhou ({e}); tentando outro.")
+					continue
+				logger.exception("Erro no stream do LLM backend")
+				yield sse_event("error", {"detail": str(e)})
+				return
+			finally:
+				backend_stats["in_flight"] -= 1
+
+	return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
 # Execução local com: uvicorn services.llm_service:app --reload --port 8002
@@ -18,6 +18,10 @@ from config.prompts import SUMMARIZE_PROMPT
 from config.settings import settings
 from database.connection import SessionLocal  # Importar a fábrica de sessões diretamente
 from database.models import ConversationMessage as ConversationHistory, ConversationSession, User
+from services.common.mq_client import MQClient
+
+# Evento consumido pelo orquestrador para invalidar o system prompt em cache
+USER_PREFERENCES_UPDATED = "user.preferences.updated"
 
 
 def get_unsummarized_sessions(db: Session) -> list[ConversationSession]:
@@ -61,11 +65,14 @@ def summarize_conversation(llm, conversation_text: str) -> str:
         return ""
 
 
-def update_user_preferences(db: Session, session: ConversationSession, summary: str):
-    """Atualiza o campo de preferências do usuário com os novos fatos extraídos."""
+def update_user_preferences(db: Session, session: ConversationSession, summary: str) -> str | None:
+    """
+    Atualiza o campo de preferências do usuário com os novos fatos extraídos.
+    Retorna o username cujas preferências mudaram, ou None.
+    """
     if "Nenhum fato relevante encontrado" in summary:
         logger.info(f"Nenhum fato novo para a sessão {session.session_id}.")
-        return
+        return None
 
     user: User | None = session.user
     if not user:
@@ -86,6 +93,28 @@ def update_user_preferences(db: Session, session: ConversationSession, summary:
     
     user.preferences = updated_preferences
     logger.success(f"Preferências do usuário '{user.username}' atualizadas com {len(new_facts)} novos fatos.")
+    return user.username
+
+
+def publish_preferences_updated(usernames: set[str]) -> None:
+    """
+    Avisa o orquestrador que as preferências mudaram, para que ele invalide o
+    system prompt em cache. Falhas aqui não interrompem o worker: o cache do
+    orquestrador expira sozinho pelo TTL.
+    """
+    try:
+        # Conexão por ciclo: entre ciclos o worker dorme mais que o heartbeat do RabbitMQ
+        mq_client = MQClient()
+        try:
+            for username in usernames:
+                mq_client.publish_event(
+                    USER_PREFERENCES_UPDATED, json.dumps({"username": username}).encode("utf-8")
+                )
+        finally:
+            mq_client.close()
+        logger.info(f"Evento '{USER_PREFERENCES_UPDATED}' publicado para {len(usernames)} usuário(s).")
+    except Exception:
+        logger.exception("Falha ao publicar a invalidação do system prompt.")
 
 
 def run_summarizer_worker():
@@ -102,16 +131,23 @@ def run_summarizer_worker():
                     logger.info("Nenhuma sessão nova para sumarizar. Aguardando...")
                 else:
                     logger.info(f"Encontradas {len(sessions_to_process)} sessões para sumarizar.")
-                    for session in sessions_to_process:
-                        conversation_text = format_conversation(session.history)
-                        summary = summarize_conversation(llm, conversation_text)
-
-                        if summary:
-                            update_user_preferences(db, session, summary)
-
-                        session.is_summarized = True
-                        db.commit()  # Commit por sessão processada
-                        logger.info(f"Sessão {session.session_id} processada e marcada como sumarizada.")
+                    updated_users: set[str] = set()
+                    try:
+                        for session in sessions_to_process:
+                            conversation_text = format_conversation(session.history)
+                            summary = summarize_conversation(llm, conversation_text)
+
+                            username = update_user_preferences(db, session, summary) if summary else None
+
+                            session.is_summarized = True
+                            db.commit()  # Commit por sessão processada
+                            if username:
+                                updated_users.add(username)
+                            logger.info(f"Sessão {session.session_id} processada e marcada como sumarizada.")
+                    finally:
+                        # Só avisa sobre o que já foi commitado
+                        if updated_users:
+                            publish_preferences_updated(updated_users)
 
         except Exception as e:
             # O 'with' statement já lida com o rollback e fechamento da sessão
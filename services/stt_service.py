@@ -1,15 +1,36 @@
 from __future__ import annotations
 
+import functools
 import json
+import os
+import queue
+import socket
+import threading
+import time
 import wave
 import io
+from typing import Callable
 import pika # Adicionado para pika.BasicProperties
 
 from loguru import logger
 from vosk import Model, KaldiRecognizer
 
 from config.settings import settings, ROOT_DIR
-from services.common.mq_client import MQClient
+from services.common.audio_message import AudioMessage, CODEC_PCM_S16LE, CODEC_WAV, parse_audio_message
+from services.common.mq_client import MQClient, reply_routing_key
+from services.common.tracing import attach_spans, make_span, queue_wait_ms
+
+# Recebe (seq, texto parcial acumulado) durante a decodificação
+PartialCallback = Callable[[int, str], None]
+# Publica (routing key, propriedades, body) na exchange 'jarvis_events'
+PublishFn = Callable[[str, pika.BasicProperties | None, bytes], None]
+
+# Fila exclusiva desta instância. Quem recebe o primeiro pedaço de um stream ao
+# vivo assume o reconhecimento e avisa o orquestrador (stt.live_claimed), que
+# manda o resto do stream direto para cá: com vários consumidores na fila
+# compartilhada, os pedaços não se espalham entre instâncias.
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}".replace(".", "_")
+LIVE_QUEUE = f"stt_live.{INSTANCE_ID}"
 
 def load_model():
     """Carrega o modelo Vosk e retorna a instância."""
@@ -28,81 +49,325 @@ def load_model():
         logger.exception("Falha crítica ao carregar o modelo Vosk.")
         return None
 
-def process_audio_bytes(model: Model, audio_bytes: bytes) -> str:
+def process_audio_bytes(
+    model: Model,
+    audio_bytes: bytes,
+    codec: str = CODEC_WAV,
+    sample_rate: int | None = None,
+    on_partial: PartialCallback | None = None,
+) -> str:
     """Processa os bytes de áudio e retorna o texto transcrito."""
     try:
+        if codec == CODEC_PCM_S16LE:
+            if not sample_rate:
+                logger.error("Áudio PCM cru recebido sem sample_rate.")
+                return ""
+            return _recognize_pcm(model, sample_rate, _iter_pcm_chunks(audio_bytes), on_partial)
+
         with io.BytesIO(audio_bytes) as audio_stream:
             with wave.open(audio_stream, "rb") as wf:
                 if wf.getnchannels() != 1 or wf.getsampwidth() != 2 or wf.getcomptype() != "NONE":
                     logger.error("Formato de áudio inválido. Requerido: WAV, 16kHz, 16-bit, mono PCM.")
                     return ""
-                
-                rec = KaldiRecognizer(model, wf.getframerate())
-                rec.SetWords(True)
-
-                full_text = ""
-                while True:
-                    data = wf.readframes(4000)
-                    if len(data) == 0:
-                        break
-                    if rec.AcceptWaveform(data):
-                        result = json.loads(rec.Result())
-                        full_text += result.get("text", "") + " "
-
-                final_result = json.loads(rec.FinalResult())
-                full_text += final_result.get("text", "")
-                
-                return full_text.strip()
+                return _recognize_pcm(model, wf.getframerate(), iter(lambda: wf.readframes(4000), b""), on_partial)
     except Exception:
         logger.exception("Erro durante a transcrição do áudio.")
         return ""
 
-def stt_worker_callback(ch, method, props, body):
-    """Função de callback para processar mensagens da fila STT."""
+def _iter_pcm_chunks(audio_bytes: bytes, chunk_size: int = 8000):
+    """Percorre o PCM cru em fatias sem copiar o buffer inteiro."""
+    view = memoryview(audio_bytes)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size].tobytes()
+
+class LiveRecognition:
+    """
+    Reconhecimento incremental de um job: o áudio é entregue em pedaços à
+    medida que chega, e o texto final fica pronto logo após o último pedaço.
+    Com ``on_partial``, a transcrição acumulada até o momento (trechos já
+    finalizados + ``PartialResult`` do trecho atual) é entregue enquanto a
+    decodificação avança, numerada e no máximo uma vez por ``partial_interval_seconds``.
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        sample_rate: int,
+        on_partial: PartialCallback | None = None,
+        partial_interval_seconds: float = 0.0,
+    ):
+        self.recognizer = KaldiRecognizer(model, sample_rate)
+        self.recognizer.SetWords(True)
+        self.next_seq = 0
+        self.last_activity = time.monotonic()
+        self._parts: list[str] = []
+        self.on_partial = on_partial
+        self.partial_interval_seconds = partial_interval_seconds
+        self.partial_seq = 0
+        self._last_partial_at = 0.0
+        self._last_partial_text = ""
+
+    def accept(self, pcm: bytes) -> None:
+        """Alimenta o reconhecedor com PCM 16-bit mono."""
+        self.last_activity = time.monotonic()
+        if self.recognizer.AcceptWaveform(pcm):
+            result = json.loads(self.recognizer.Result())
+            self._parts.append(result.get("text", ""))
+            partial = ""
+        elif self.on_partial is None:
+            return
+        else:
+            partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        self._emit_partial(partial)
+
+    def _emit_partial(self, partial: str) -> None:
+        if self.on_partial is None:
+            return
+        now = time.monotonic()
+        if now - self._last_partial_at < self.partial_interval_seconds:
+            return
+        text = " ".join(part for part in [*self._parts, partial] if part).strip()
+        if not text or text == self._last_partial_text:
+            return
+        self._last_partial_at = now
+        self._last_partial_text = text
+        self.partial_seq += 1
+        self.on_partial(self.partial_seq, text)
+
+    def finish(self) -> str:
+        """Encerra o reconhecimento e retorna o texto completo."""
+        final_result = json.loads(self.recognizer.FinalResult())
+        self._parts.append(final_result.get("text", ""))
+        return " ".join(part for part in self._parts if part).strip()
+
+def _recognize_pcm(model: Model, sample_rate: int, chunks, on_partial: PartialCallback | None = None) -> str:
+    """Alimenta o reconhecedor com chunks de PCM 16-bit mono e retorna o texto."""
+    recognition = LiveRecognition(model, sample_rate, on_partial, settings.stt.partial_interval_seconds)
+    for data in chunks:
+        recognition.accept(data)
+    return recognition.finish()
+
+# Reconhecimentos em andamento de jobs com áudio ao vivo, por job_id. Com várias
+# threads de reconhecimento, cada stream é de uma thread só, mas o mapa é compartilhado.
+live_sessions: dict[str, LiveRecognition] = {}
+live_sessions_lock = threading.Lock()
+
+def _purge_idle_sessions() -> None:
+    """Descarta reconhecimentos ao vivo cujo cliente parou de enviar áudio."""
+    now = time.monotonic()
+    timeout = settings.stt.stream_idle_timeout_seconds
+    with live_sessions_lock:
+        idle = [j for j, s in live_sessions.items() if now - s.last_activity > timeout]
+        for job_id in idle:
+            live_sessions.pop(job_id, None)
+    for job_id in idle:
+        logger.warning(f"[{job_id}] Stream de áudio inativo por mais de {timeout}s. Descartado.")
+
+def process_stream_chunk(
+    model: Model, message: AudioMessage, on_partial: PartialCallback | None = None
+) -> str | None:
+    """
+    Processa um pedaço de áudio ao vivo. Retorna o texto transcrito quando o
+    pedaço é o último do stream, ou None enquanto o stream continua.
+    ``on_partial`` só é usado no primeiro pedaço, que cria o reconhecimento.
+    """
+    _purge_idle_sessions()
+    with live_sessions_lock:
+        recognition = live_sessions.get(message.job_id)
+    if recognition is None:
+        if message.stream_seq:
+            # Sessão descartada por inatividade (ou de outra instância): o texto
+            # sairia truncado, então o job falha em vez de "concluir"
+            raise ValueError(
+                f"Pedaço {message.stream_seq} de um stream sem reconhecimento em andamento."
+            )
+        if not message.sample_rate:
+            raise ValueError("Stream de áudio iniciado sem sample_rate.")
+        recognition = LiveRecognition(model, message.sample_rate, on_partial, settings.stt.partial_interval_seconds)
+        with live_sessions_lock:
+            live_sessions[message.job_id] = recognition
+        logger.info(f"[{message.job_id}] Reconhecimento ao vivo iniciado ({message.sample_rate} Hz).")
+
+    if message.stream_seq != recognition.next_seq:
+        logger.warning(
+            f"[{message.job_id}] Pedaço de áudio fora de ordem: esperado {recognition.next_seq}, "
+            f"recebido {message.stream_seq}."
+        )
+    recognition.next_seq = message.stream_seq + 1
+    if message.audio:
+        recognition.accept(message.audio)
+
+    if not message.stream_end:
+        return None
+    with live_sessions_lock:
+        live_sessions.pop(message.job_id, None)
+    return recognition.finish()
+
+def partial_publisher(job_id: str | None, reply_to: str | None, publish: PublishFn | None) -> PartialCallback | None:
+    """Callback que transforma as transcrições parciais de um job em eventos ``stt.partial``."""
+    if publish is None or not job_id or not settings.stt.partial_results:
+        return None
+
+    def on_partial(seq: int, text: str) -> None:
+        body = json.dumps({"job_id": job_id, "seq": seq, "text": text}).encode('utf-8')
+        properties = pika.BasicProperties(headers={"job_id": job_id, "seq": seq})
+        publish(reply_routing_key('stt.partial', reply_to), properties, body)
+
+    return on_partial
+
+def live_claim(job_id: str, reply_to: str | None) -> tuple[str, pika.BasicProperties, bytes]:
+    """Evento que informa ao orquestrador a fila para onde mandar o resto do stream."""
+    body = json.dumps({"job_id": job_id, "queue": LIVE_QUEUE}).encode('utf-8')
+    return reply_routing_key('stt.live_claimed', reply_to), pika.BasicProperties(headers={"job_id": job_id}), body
+
+def handle_stt_message(
+    props, body, publish: PublishFn | None = None
+) -> tuple[str, pika.BasicProperties | None, bytes] | None:
+    """
+    Processa uma mensagem da fila STT e retorna o evento a publicar
+    (routing key, propriedades, body), ou None enquanto um stream ao vivo
+    ainda não terminou. O resultado final não é publicado aqui: quem chama
+    publica na thread da conexão. Os eventos intermediários (``stt.partial`` e
+    ``stt.live_claimed``) saem por ``publish``, que precisa ser seguro na thread atual.
+    """
+    job_id = None
+    # Espera na fila e tempo de serviço desta etapa, devolvidos ao orquestrador.
+    # No áudio ao vivo, contam só o último pedaço: é a latência depois que o usuário parou de falar.
+    queue_ms = queue_wait_ms(props.headers)
+    started_at = time.perf_counter()
     try:
-        # Espera-se que o body seja um JSON com 'job_id' e 'audio_bytes'
-        payload = json.loads(body)
-        job_id = payload.get('job_id')
-        audio_bytes = payload.get('audio_bytes')
-        logger.info(f"Recebida requisição STT para job_id: {job_id}")
-        if not job_id or not audio_bytes:
-            raise ValueError("Payload inválido: job_id ou audio_bytes ausentes.")
-        # Decodifica audio_bytes se vier como base64
-        if isinstance(audio_bytes, str):
-            import base64
-            audio_bytes = base64.b64decode(audio_bytes)
-        transcribed_text = process_audio_bytes(vosk_model, audio_bytes)
+        # Formato binário (áudio no body, metadados nos headers) ou JSON legado com base64
+        message = parse_audio_message(body, props.content_type, props.headers)
+        job_id = message.job_id
+        on_partial = partial_publisher(job_id, props.reply_to, publish)
+        if message.is_stream:
+            if not job_id:
+                raise ValueError("Payload inválido: job_id ausente.")
+            transcribed_text = process_stream_chunk(vosk_model, message, on_partial)
+            if transcribed_text is None:
+                if message.stream_seq == 0 and publish is not None:
+                    publish(*live_claim(job_id, props.reply_to))
+                return None
+        else:
+            logger.info(f"Recebida requisição STT para job_id: {job_id} ({message.codec}, {len(message.audio)} bytes)")
+            if not job_id or not message.audio:
+                raise ValueError("Payload inválido: job_id ou áudio ausentes.")
+            transcribed_text = process_audio_bytes(
+                vosk_model, message.audio, message.codec, message.sample_rate, on_partial
+            )
         response_payload = json.dumps({"job_id": job_id, "text": transcribed_text}).encode('utf-8')
-        ch.basic_publish(
-            exchange='jarvis_events',
-            routing_key='stt.completed',
-            body=response_payload
-        )
+        span = make_span("stt", queue_ms, (time.perf_counter() - started_at) * 1000)
         logger.info(f"STT concluído para job_id {job_id}.")
+        return (
+            reply_routing_key('stt.completed', props.reply_to),
+            pika.BasicProperties(headers=attach_spans({"job_id": job_id}, [span])),
+            response_payload,
+        )
     except Exception as e:
         logger.exception("Erro no processamento STT.")
-        # Tenta extrair job_id do payload, se possível
-        job_id = None
-        try:
-            job_id = json.loads(body).get('job_id')
-        except Exception:
-            pass
+        if job_id:
+            with live_sessions_lock:
+                live_sessions.pop(job_id, None)
         error_payload = json.dumps({"job_id": job_id, "error": str(e)}).encode('utf-8')
-        ch.basic_publish(
-            exchange='jarvis_events',
-            routing_key='stt.failed',
-            body=error_payload
-        )
+        return reply_routing_key('stt.failed', props.reply_to), None, error_payload
+
+def stt_worker_callback(ch, method, props, body):
+    """Função de callback para processar mensagens da fila STT (uma por vez, na thread da conexão)."""
+    def publish(routing_key, properties, payload):
+        ch.basic_publish(exchange='jarvis_events', routing_key=routing_key, properties=properties, body=payload)
+
+    try:
+        reply = handle_stt_message(props, body, publish)
+        if reply is not None:
+            publish(*reply)
     finally:
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
+class RecognitionPool:
+    """
+    Threads de reconhecimento que compartilham o modelo Vosk já carregado.
+
+    O callback do pika só distribui as mensagens: cada thread decodifica com
+    os seus próprios ``KaldiRecognizer`` (a decodificação roda em C e libera
+    o GIL), e a publicação do resultado e o ack voltam para a thread da
+    conexão com ``add_callback_threadsafe``, porque o canal do pika não é
+    thread-safe. Jobs avulsos vão para a thread menos ocupada; os pedaços de
+    um stream ao vivo vão sempre para a mesma thread, na ordem de chegada.
+    """
+
+    def __init__(self, connection, workers: int, stream_idle_timeout_seconds: float):
+        self.connection = connection
+        self.stream_idle_timeout_seconds = stream_idle_timeout_seconds
+        self._tasks = [queue.Queue() for _ in range(workers)]
+        # Mensagens entregues a cada thread e ainda sem ack (só mexidas na thread da conexão)
+        self._pending = [0] * workers
+        # Stream ao vivo -> (thread dona, último pedaço recebido)
+        self._stream_owner: dict[str, tuple[int, float]] = {}
+        for index in range(workers):
+            threading.Thread(target=self._run, args=(index,), name=f"stt-worker-{index}", daemon=True).start()
+
+    def on_message(self, ch, method, props, body) -> None:
+        """Callback do pika: escolhe a thread e enfileira a mensagem."""
+        index = self._pick_worker(props.headers or {})
+        self._pending[index] += 1
+        self._tasks[index].put((ch, method, props, body))
+
+    def _pick_worker(self, headers: dict) -> int:
+        least_busy = min(range(len(self._pending)), key=self._pending.__getitem__)
+        job_id = headers.get("job_id")
+        if not job_id or headers.get("stream_seq") is None:
+            return least_busy
+        now = time.monotonic()
+        # Streams abandonados não seguram a thread para sempre
+        for stale in [j for j, (_, seen) in self._stream_owner.items() if now - seen > self.stream_idle_timeout_seconds]:
+            del self._stream_owner[stale]
+        index = self._stream_owner.get(job_id, (least_busy, now))[0]
+        self._stream_owner[job_id] = (index, now)
+        return index
+
+    def _run(self, index: int) -> None:
+        tasks = self._tasks[index]
+        while True:
+            ch, method, props, body = tasks.get()
+
+            def publish(routing_key, properties, payload, ch=ch):
+                self.connection.add_callback_threadsafe(functools.partial(
+                    ch.basic_publish, exchange='jarvis_events', routing_key=routing_key,
+                    properties=properties, body=payload,
+                ))
+
+            reply = handle_stt_message(props, body, publish)
+            self.connection.add_callback_threadsafe(
+                functools.partial(self._complete, index, ch, method, props, reply)
+            )
+
+    def _complete(self, index: int, ch, method, props, reply) -> None:
+        """Roda na thread da conexão: publica o resultado e confirma a mensagem."""
+        self._pending[index] -= 1
+        try:
+            if reply is not None:
+                routing_key, properties, payload = reply
+                ch.basic_publish(exchange='jarvis_events', routing_key=routing_key, properties=properties, body=payload)
+                # Resposta de um stream (resultado final ou falha): ele terminou
+                self._stream_owner.pop((props.headers or {}).get("job_id"), None)
+        finally:
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+
 if __name__ == "__main__":
     vosk_model = load_model()
     if vosk_model:
         mq_client = MQClient()
         mq_client.declare_queue("stt_requests")
+        mq_client.declare_private_queue(LIVE_QUEUE)
+        workers = settings.stt.workers or os.cpu_count() or 1
         # O método start_worker agora é bloqueante e gerencia o consumo
-        mq_client.start_worker("stt_requests", stt_worker_callback)
+        if workers > 1:
+            logger.info(f"Reconhecimento com {workers} threads compartilhando o modelo.")
+            pool = RecognitionPool(mq_client.connection, workers, settings.stt.stream_idle_timeout_seconds)
+            # Uma mensagem por thread: o broker não entrega mais do que dá para decodificar
+            mq_client.start_worker("stt_requests", pool.on_message, prefetch_count=workers, extra_queues=[LIVE_QUEUE])
+        else:
+            mq_client.start_worker("stt_requests", stt_worker_callback, extra_queues=[LIVE_QUEUE])
     else:
         logger.error("Serviço STT não pôde ser iniciado pois o modelo não foi carregado.")
 
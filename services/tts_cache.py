@@ -0,0 +1,157 @@
+"""Cache do áudio sintetizado pelo TTS, endereçado pelo conteúdo.
+
+A chave é o hash de (texto, língua, speaker, modelo): a mesma frase com a mesma
+voz sempre gera o mesmo áudio, então pode ser reaproveitada. Há dois níveis:
+um LRU em memória e um diretório em disco (que sobrevive a reinícios), ambos
+limitados em bytes.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+from loguru import logger
+
+
+def cache_key(text: str, language: str, speaker: str | None, model_name: str) -> str:
+    """Hash SHA-256 dos parâmetros que determinam o áudio gerado."""
+    parts = [text.strip(), language, speaker or "", model_name]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def speaker_fingerprint(speaker_wav: str | None) -> str | None:
+    """
+    Identifica a voz clonada pelo conteúdo do arquivo de referência, para que
+    trocar o WAV (mantendo o mesmo caminho) não sirva áudio da voz antiga.
+    """
+    if not speaker_wav:
+        return None
+    with open(speaker_wav, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class AudioCache:
+    """
+    Cache em dois níveis do áudio sintetizado.
+
+    A memória guarda os itens usados mais recentemente até ``memory_max_bytes``.
+    O disco guarda até ``disk_max_bytes``; ao passar do limite, os arquivos
+    acessados há mais tempo (mtime, atualizado a cada acerto) são apagados.
+    """
+
+    def __init__(self, directory: str | Path, memory_max_bytes: int, disk_max_bytes: int):
+        self.directory = Path(directory)
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self.memory_bytes = 0
+        # Índice dos arquivos em disco: chave -> tamanho, do menos para o mais recente
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self.disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._scan_disk()
+
+    def get(self, key: str) -> bytes | None:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return audio
+
+        if key in self._disk:
+            path = self._path(key)
+            try:
+                audio = path.read_bytes()
+                os.utime(path)
+            except OSError:
+                logger.warning(f"Arquivo do cache de áudio ilegível ou removido: {path}")
+                self._forget_disk(key)
+            else:
+                self._disk.move_to_end(key)
+                self._put_memory(key, audio)
+                self.disk_hits += 1
+                return audio
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, audio: bytes) -> None:
+        if not audio:
+            return
+        self._put_memory(key, audio)
+        self._put_disk(key, audio)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self.memory_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self.disk_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.wav"
+
+    def _scan_disk(self) -> None:
+        """Reconstrói o índice do disco a partir dos arquivos existentes, por mtime."""
+        files = []
+        for path in self.directory.glob("*/*.wav"):
+            stat = path.stat()
+            files.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk[key] = size
+            self.disk_bytes += size
+        self._evict_disk()
+
+    def _put_memory(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.memory_max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= len(previous)
+        self._memory[key] = audio
+        self.memory_bytes += len(audio)
+        while self.memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def _put_disk(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.disk_max_bytes:
+            return
+        path = self._path(key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            # Escreve num arquivo temporário e renomeia: nunca fica um WAV pela metade
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_bytes(audio)
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception(f"Falha ao gravar o áudio no cache em disco: {path}")
+            return
+        self._forget_disk(key, delete=False)
+        self._disk[key] = len(audio)
+        self.disk_bytes += len(audio)
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        while self.disk_bytes > self.disk_max_bytes and self._disk:
+            self._forget_disk(next(iter(self._disk)))
+
+    def _forget_disk(self, key: str, delete: bool = True) -> None:
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self.disk_bytes -= size
+        if delete:
+            try:
+                self._path(key).unlink()
+            except FileNotFoundError:
+                pass
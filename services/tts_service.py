@@ -2,13 +2,16 @@ from __future__ import annotations
 
 import io
 import json
+import time
 import pika
 import torch
 from loguru import logger
 from TTS.api import TTS
 
 from config.settings import settings, ROOT_DIR
-from services.common.mq_client import MQClient
+from services.common.mq_client import MQClient, reply_routing_key
+from services.common.tracing import attach_spans, make_span, queue_wait_ms
+from services.tts_cache import AudioCache, cache_key, speaker_fingerprint
 
 def load_model():
     """Carrega o modelo Coqui TTS e retorna a instância e o speaker."""
@@ -49,36 +52,79 @@ def synthesize_text(model: TTS, text: str, language: str, speaker: str | None) -
         logger.exception("Falha inesperada durante a síntese de voz.")
         return None
 
+def load_audio_cache() -> tuple[AudioCache | None, str | None]:
+    """Abre o cache de áudio (se habilitado) e calcula a identidade da voz usada."""
+    if not settings.tts.cache_enabled:
+        return None, None
+    cache = AudioCache(
+        ROOT_DIR / settings.tts.cache_dir,
+        memory_max_bytes=settings.tts.cache_memory_max_bytes,
+        disk_max_bytes=settings.tts.cache_disk_max_bytes,
+    )
+    logger.info(f"Cache de áudio do TTS em {cache.directory}: {cache.stats()}")
+    return cache, speaker_fingerprint(speaker_to_clone)
+
+def synthesize_cached(text: str, language: str) -> bytes | None:
+    """Sintetiza o texto, reaproveitando o áudio do cache quando a frase já foi gerada."""
+    if audio_cache is None:
+        return synthesize_text(tts_model, text, language, speaker_to_clone)
+
+    key = cache_key(text, language, speaker_id, settings.tts.model_name)
+    audio = audio_cache.get(key)
+    if audio is not None:
+        logger.info(f"Áudio servido pelo cache ({len(audio)} bytes).")
+        return audio
+    audio = synthesize_text(tts_model, text, language, speaker_to_clone)
+    if audio:
+        audio_cache.put(key, audio)
+    return audio
+
+def prewarm_cache():
+    """Garante que as frases fixas (fallback, feedback de ferramentas) já estejam no cache."""
+    for phrase in settings.tts.prewarm_phrases:
+        synthesize_cached(phrase, settings.tts.prewarm_language)
+    logger.info(f"Cache de áudio pré-aquecido com {len(settings.tts.prewarm_phrases)} frases: {audio_cache.stats()}")
+
 def tts_worker_callback(ch, method, props, body):
     """Função de callback para processar mensagens da fila TTS."""
+    queue_ms = queue_wait_ms(props.headers)
+    started_at = time.perf_counter()
     try:
         payload = json.loads(body)
         job_id = payload.get("job_id")
         text_to_synthesize = payload.get("text")
         language = payload.get("language", "pt")
+        # Em modo streaming cada frase é um chunk numerado; o seq volta no header
+        seq = payload.get("seq")
         if not job_id or not text_to_synthesize:
             raise ValueError("Payload inválido: job_id ou text ausentes.")
-        audio_bytes = synthesize_text(tts_model, text_to_synthesize, language, speaker_to_clone) or b''
-        response_payload = json.dumps({"job_id": job_id}).encode('utf-8')
-        # Envia o áudio como body binário, job_id no header
+        audio_bytes = synthesize_cached(text_to_synthesize, language) or b''
+        headers = {"job_id": job_id}
+        if seq is not None:
+            headers["seq"] = seq
+        attach_spans(headers, [make_span("tts", queue_ms, (time.perf_counter() - started_at) * 1000)])
+        # Envia o áudio como body binário, job_id (e seq) no header
         ch.basic_publish(
             exchange='jarvis_events',
-            routing_key='tts.completed',
-            properties=pika.BasicProperties(headers={"job_id": job_id}),
+            routing_key=reply_routing_key('tts.completed', props.reply_to),
+            properties=pika.BasicProperties(headers=headers),
             body=audio_bytes
         )
-        logger.info(f"TTS concluído para job_id {job_id}.")
+        logger.info(f"TTS concluído para job_id {job_id} (chunk {seq}).")
     except Exception as e:
         logger.exception("Erro no processamento TTS.")
         job_id = None
+        seq = None
         try:
-            job_id = json.loads(body).get('job_id')
+            request = json.loads(body)
+            job_id = request.get('job_id')
+            seq = request.get('seq')
         except Exception:
             pass
-        error_payload = json.dumps({"job_id": job_id, "error": str(e)}).encode('utf-8')
+        error_payload = json.dumps({"job_id": job_id, "seq": seq, "error": str(e)}).encode('utf-8')
         ch.basic_publish(
             exchange='jarvis_events',
-            routing_key='tts.failed',
+            routing_key=reply_routing_key('tts.failed', props.reply_to),
             body=error_payload
         )
     finally:
@@ -87,6 +133,9 @@ def tts_worker_callback(ch, method, props, body):
 if __name__ == "__main__":
     tts_model, speaker_to_clone = load_model()
     if tts_model:
+        audio_cache, speaker_id = load_audio_cache()
+        if audio_cache is not None:
+            prewarm_cache()
         mq_client = MQClient()
         mq_client.declare_queue("tts_requests")
         mq_client.start_worker("tts_requests", tts_worker_callback)
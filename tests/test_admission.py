@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import pytest
+
+from assistant.admission import AdmissionController, AdmissionRejected
+
+
+def test_rejects_when_queue_is_full():
+	async def scenario():
+		admission = AdmissionController(max_concurrent=1, max_queue=0, max_wait_seconds=1)
+		async with admission.slot():
+			with pytest.raises(AdmissionRejected):
+				async with admission.slot():
+					pass
+		assert admission.stats()["rejected"] == 1
+
+	asyncio.run(scenario())
+
+
+def test_rejects_when_wait_deadline_expires():
+	async def scenario():
+		admission = AdmissionController(max_concurrent=1, max_queue=1, max_wait_seconds=0.01)
+		async with admission.slot():
+			with pytest.raises(AdmissionRejected):
+				async with admission.slot():
+					pass
+		async with admission.slot():
+			assert admission.stats()["running"] == 1
+		assert admission.stats()["admitted"] == 2
+
+	asyncio.run(scenario())
+
+
+def test_permit_handed_over_at_cancellation_is_not_lost():
+	async def scenario():
+		admission = AdmissionController(max_concurrent=1, max_queue=1, max_wait_seconds=5)
+
+		async def wait_for_slot():
+			async with admission.slot():
+				pass
+
+		async with admission.slot():
+			waiter = asyncio.create_task(wait_for_slot())
+			await asyncio.sleep(0.01)
+			assert admission.stats()["waiting"] == 1
+		# A vaga acabou de ser entregue ao waiter, que é cancelado antes de acordar
+		waiter.cancel()
+		with pytest.raises(asyncio.CancelledError):
+			await waiter
+
+		assert admission.stats()["waiting"] == 0
+		assert not admission._semaphore.locked()
+
+	asyncio.run(scenario())
+
+
+def test_permit_released_at_the_timeout_is_not_lost():
+	async def scenario():
+		admission = AdmissionController(max_concurrent=1, max_queue=1, max_wait_seconds=5)
+		loop = asyncio.get_running_loop()
+		# Um job ocupa a vaga e a libera no mesmo instante em que o prazo do waiter expira
+		await admission._semaphore.acquire()
+		deadline = time.monotonic() + 0.05
+		loop.call_at(deadline, admission._semaphore.release)
+		try:
+			async with admission.slot(deadline=deadline):
+				assert admission._semaphore.locked()
+		except AdmissionRejected:
+			pass
+
+		# Admitido ou rejeitado, a vaga volta ao semáforo
+		assert not admission._semaphore.locked()
+		assert admission.stats()["running"] == 0
+
+	asyncio.run(scenario())
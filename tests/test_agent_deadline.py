@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from assistant.admission import AdmissionController
+from assistant.agent_graph import DEADLINE_REPLY, DeadlineExceeded, ainvoke_until_deadline
+
+
+class SlowGraph:
+	"""Grafo falso: transmite alguns tokens e depois trava até ser cancelado."""
+
+	def __init__(self, tokens, error=None):
+		self.tokens = tokens
+		self.error = error
+		self.cancelled = False
+
+	async def ainvoke(self, graph_input, config):
+		on_token = config["configurable"]["on_token"]
+		for token in self.tokens:
+			await on_token(token)
+		if self.error:
+			raise self.error
+		try:
+			await asyncio.sleep(10)
+		except asyncio.CancelledError:
+			self.cancelled = True
+			raise
+		return {"messages": graph_input["messages"] + ["nunca chega"]}
+
+
+def test_deadline_returns_streamed_partial_and_releases_slot():
+	async def scenario():
+		admission = AdmissionController(max_concurrent=1, max_queue=0, max_wait_seconds=1)
+		graph = SlowGraph(["Vou verificar", " a agenda."])
+		streamed = []
+
+		async def on_token(token):
+			streamed.append(token)
+
+		started = time.monotonic()
+		async with admission.slot():
+			final_state, exceeded = await ainvoke_until_deadline(
+				graph, {"messages": []}, {}, deadline=started + 0.1, on_token=on_token
+			)
+		assert time.monotonic() - started < 1
+		assert exceeded
+		assert graph.cancelled
+		assert final_state["messages"][-1].content == f"Vou verificar a agenda. {DEADLINE_REPLY}"
+		assert "".join(streamed) == f"Vou verificar a agenda. {DEADLINE_REPLY}"
+		# A vaga do job foi liberada: um novo job é admitido na hora
+		assert admission.stats()["running"] == 0
+		async with admission.slot():
+			pass
+
+	asyncio.run(scenario())
+
+
+def test_deadline_checked_by_a_node_gives_only_the_deadline_reply():
+	async def scenario():
+		graph = SlowGraph([], error=DeadlineExceeded("prazo"))
+		final_state, exceeded = await ainvoke_until_deadline(
+			graph, {"messages": []}, {}, deadline=time.monotonic() + 5
+		)
+		assert exceeded
+		assert final_state["messages"][-1].content == DEADLINE_REPLY
+
+	asyncio.run(scenario())
+
+
+def test_graph_within_deadline_is_returned_unchanged():
+	async def scenario():
+		graph = SlowGraph([])
+		graph.ainvoke = lambda graph_input, config: asyncio.sleep(0, {"messages": ["pronto"]})
+		final_state, exceeded = await ainvoke_until_deadline(
+			graph, {"messages": []}, {}, deadline=time.monotonic() + 5
+		)
+		assert not exceeded
+		assert final_state == {"messages": ["pronto"]}
+
+	asyncio.run(scenario())
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from langchain_core.messages import AIMessageChunk, HumanMessage  # noqa: E402
+from langchain_core.tools import StructuredTool  # noqa: E402
+
+from assistant import agent_graph  # noqa: E402
+from tools import __all_tools__ as registry  # noqa: E402
+
+
+async def lookup_weather(query: str) -> str:
+	return "ensolarado, 25 graus"
+
+
+class ScriptedLLM:
+	"""LLM falso: cada chamada ao astream transmite o próximo turno do roteiro."""
+
+	def __init__(self, turns):
+		self.turns = list(turns)
+
+	def bind(self, **kwargs):
+		return self
+
+	async def astream(self, messages, config=None):
+		for chunk in self.turns.pop(0):
+			yield chunk
+
+
+def test_text_of_tool_calling_turn_is_not_streamed(monkeypatch):
+	tool = StructuredTool.from_function(coroutine=lookup_weather, name="lookup_weather", description="Clima atual.")
+	monkeypatch.setitem(registry.TOOLS_BY_NAME, tool.name, tool)
+	llm = ScriptedLLM([
+		# Turno 1: preâmbulo seguido de uma chamada de ferramenta
+		[
+			AIMessageChunk(content="Deixa eu pensar... "),
+			AIMessageChunk(content="vou consultar o clima."),
+			AIMessageChunk(
+				content="",
+				tool_call_chunks=[{"name": "lookup_weather", "args": '{"query": "hoje"}', "id": "c1", "index": 0}],
+			),
+		],
+		# Turno 2: a resposta final, com o resultado da ferramenta
+		[AIMessageChunk(content="Hoje está ensolarado, "), AIMessageChunk(content="com 25 graus.")],
+	])
+	monkeypatch.setattr(agent_graph, "get_llm", lambda: llm)
+	graph = agent_graph.create_graph_workflow([tool])
+	spoken = []
+
+	async def on_token(token):
+		spoken.append(token)
+
+	async def scenario():
+		return await graph.ainvoke(
+			{"messages": [HumanMessage(content="Como está o tempo?")]},
+			{"recursion_limit": 10, "configurable": {"on_token": on_token}},
+		)
+
+	final_state = asyncio.run(scenario())
+
+	assert "".join(spoken) == "Hoje está ensolarado, com 25 graus."
+	assert final_state["messages"][-1].content == "Hoje está ensolarado, com 25 graus."
+	assert final_state["messages"][-2].content == "ensolarado, 25 graus"
@@ -0,0 +1,38 @@
+import base64
+import io
+import json
+import wave
+
+from services.common.audio_message import (
+	AUDIO_CONTENT_TYPE,
+	build_audio_headers,
+	parse_audio_message,
+	wav_sample_rate,
+)
+
+
+def _wav(sample_rate: int = 16000) -> bytes:
+	buffer = io.BytesIO()
+	with wave.open(buffer, "wb") as wf:
+		wf.setnchannels(1)
+		wf.setsampwidth(2)
+		wf.setframerate(sample_rate)
+		wf.writeframes(b"\x00\x00" * 160)
+	return buffer.getvalue()
+
+
+def test_binary_audio_message():
+	audio = _wav()
+	headers = build_audio_headers("job-1", sample_rate=wav_sample_rate(audio))
+	message = parse_audio_message(audio, AUDIO_CONTENT_TYPE, headers)
+	assert message.job_id == "job-1"
+	assert message.audio is audio
+	assert message.sample_rate == 16000
+
+
+def test_legacy_json_audio_message():
+	audio = _wav()
+	body = json.dumps({"job_id": "job-2", "audio_bytes": base64.b64encode(audio).decode()}).encode()
+	message = parse_audio_message(body, None, None)
+	assert message.job_id == "job-2"
+	assert message.audio == audio
@@ -0,0 +1,82 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from assistant.context_window import ContextWindow, fold_into_summary, turn_context
+
+
+def test_split_keeps_recent_turns_within_budget():
+	window = ContextWindow(max_tokens=40, chars_per_token=1.0)
+	history = [
+		HumanMessage(content="a" * 10),
+		AIMessage(content="b" * 10),
+		HumanMessage(content="c" * 10),
+		AIMessage(content="d" * 10),
+	]
+	older, recent = window.split(history)
+	assert older == history[:2]
+	assert recent == history[2:]
+
+
+def test_split_always_keeps_last_message():
+	window = ContextWindow(max_tokens=1, chars_per_token=1.0)
+	history = [HumanMessage(content="x" * 50)]
+	assert window.split(history) == ([], history)
+
+
+class StoredConversation:
+	"""Uma sessão como no banco: mensagens numeradas, resumo e até qual mensagem ele cobre."""
+
+	def __init__(self):
+		self.rows = []
+		self.summary = None
+		self.summarized_until = 0
+
+	def load(self):
+		# Como PGConversationMemory.load: só as mensagens que ainda não entraram no resumo
+		return [(message_id, m) for message_id, m in self.rows if message_id > self.summarized_until]
+
+	def save(self, message):
+		self.rows.append((len(self.rows) + 1, message))
+
+
+class EchoSummaryLLM:
+	"""LLM de resumo falso: o "resumo" são as mensagens novas que ele recebeu."""
+
+	async def ainvoke(self, prompt):
+		return AIMessage(content=prompt.split("NOVAS MENSAGENS:")[1].split("NOVO RESUMO:")[0].strip())
+
+
+def run_turn(conversation, window, user_text, reply):
+	"""Um turno como o invoke_agent_graph: carrega, monta o contexto, responde e resume o que saiu da janela."""
+	loaded = conversation.load()
+	conversation.save(HumanMessage(content=user_text))
+	history = [m for _, m in loaded] + [HumanMessage(content=user_text)]
+	messages, older = turn_context(window, "sys", conversation.summary, history)
+	conversation.save(AIMessage(content=reply))
+	if older:
+		conversation.summary = asyncio.run(fold_into_summary(EchoSummaryLLM(), conversation.summary, older))
+		conversation.summarized_until = loaded[len(older) - 1][0]
+	return messages, older
+
+
+def test_older_turns_of_the_same_conversation_move_into_the_summary():
+	window = ContextWindow(max_tokens=40, chars_per_token=1.0)
+	conversation = StoredConversation()
+
+	messages, older = run_turn(conversation, window, "Meu nome é", "Prazer, Ana")
+	assert older == []
+	assert [m.content for m in messages] == ["sys", "Meu nome é"]
+
+	# O segundo turno não cabe junto com o primeiro: o primeiro vai para o resumo
+	messages, older = run_turn(conversation, window, "Como estou?", "Tudo certo")
+	assert [m.content for m in older] == ["Meu nome é", "Prazer, Ana"]
+	assert [m.content for m in messages] == ["sys", "Como estou?"]
+	assert "Jarvis: Prazer, Ana" in conversation.summary
+	assert conversation.summarized_until == 2
+
+	# O terceiro turno recebe o resumo e só as mensagens que ainda não foram resumidas
+	messages, _ = run_turn(conversation, window, "E agora?", "Ainda bem")
+	assert messages[1].content.startswith("Resumo da conversa até aqui:")
+	assert "Prazer, Ana" in messages[1].content
+	assert all(m.content != "Meu nome é" for m in messages)
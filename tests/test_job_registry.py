@@ -0,0 +1,72 @@
+import asyncio
+
+from assistant.job_registry import JobEvent, JobRegistry
+
+
+def test_events_before_attach_are_buffered():
+	async def scenario():
+		registry = JobRegistry(ttl_seconds=60, max_buffered_bytes=1024)
+		registry.open("job")
+		registry.publish("job", JobEvent(audio=b"abc", final=True))
+		assert registry.stats()["buffered_bytes"] == 3
+		queue = registry.attach("job")
+		event = await asyncio.wait_for(queue.get(), timeout=1)
+		assert event.audio == b"abc" and event.final
+		assert registry.stats()["buffered_bytes"] == 0
+
+	asyncio.run(scenario())
+
+
+def test_memory_cap_evicts_oldest_unattached_job():
+	async def scenario():
+		registry = JobRegistry(ttl_seconds=60, max_buffered_bytes=4)
+		registry.open("old")
+		registry.open("new")
+		registry.publish("old", JobEvent(audio=b"123"))
+		registry.publish("new", JobEvent(audio=b"456"))
+		assert registry.stats() == {"jobs": 1, "attached": 0, "buffered_bytes": 3}
+
+	asyncio.run(scenario())
+
+
+def test_expired_jobs_are_purged():
+	async def scenario():
+		registry = JobRegistry(ttl_seconds=0, max_buffered_bytes=1024)
+		registry.open("job")
+		registry.publish("job", JobEvent(message={"status": "done"}, final=True))
+		await asyncio.sleep(0.01)
+		assert registry.purge_expired() == 1
+
+	asyncio.run(scenario())
+
+
+def test_events_after_release_are_dropped():
+	async def scenario():
+		registry = JobRegistry(ttl_seconds=60, max_buffered_bytes=1024)
+		registry.open("job")
+		registry.attach("job")
+		registry.release("job")
+
+		# Chunk de TTS atrasado depois de o cliente desconectar
+		assert not registry.publish("job", JobEvent(audio=b"abc"))
+		assert not registry.has("job")
+		assert registry.stats() == {"jobs": 0, "attached": 0, "buffered_bytes": 0}
+
+	asyncio.run(scenario())
+
+
+def test_events_of_unknown_jobs_are_not_buffered():
+	async def scenario():
+		registry = JobRegistry(ttl_seconds=60, max_buffered_bytes=1024)
+		assert not registry.publish("outro", JobEvent(audio=b"abc"))
+		assert registry.stats() == {"jobs": 0, "attached": 0, "buffered_bytes": 0}
+
+	asyncio.run(scenario())
+
+
+def test_job_keeps_the_context_given_at_open():
+	registry = JobRegistry(ttl_seconds=60, max_buffered_bytes=1024)
+	registry.open("job", context={"session_id": 7})
+	assert registry.context("job") == {"session_id": 7}
+	registry.release("job")
+	assert registry.context("job") is None
@@ -0,0 +1,33 @@
+from assistant.latency import LatencyTracker
+from services.common.tracing import attach_spans, make_span, queue_wait_ms, read_spans, stamp
+
+
+def test_spans_round_trip_through_headers():
+	headers = stamp({"job_id": "j1"})
+	assert queue_wait_ms(headers) >= 0.0
+	assert queue_wait_ms({}) == 0.0
+	attach_spans(headers, [make_span("tts", 12.34, 56.78)])
+	assert read_spans(headers) == [{"stage": "tts", "queue_ms": 12.3, "service_ms": 56.8}]
+
+
+def test_job_breakdown_and_stage_histograms():
+	tracker = LatencyTracker(max_jobs=1)
+	trace = tracker.start("j1")
+	with trace.span("upload"):
+		pass
+	tracker.record("j1", "stt", service_ms=300.0, queue_ms=20.0)
+	tracker.record(None, "stt", service_ms=100.0)
+
+	breakdown = tracker.finish("j1")
+	assert [span["stage"] for span in breakdown["stages"]] == ["upload", "stt"]
+	assert tracker.finish("j1") is None
+
+	stt = tracker.stats()["stt"]
+	assert stt["count"] == 2
+	assert stt["service_p99_ms"] == 300.0
+	assert stt["histogram_ms"]["100"] == 1 and stt["histogram_ms"]["500"] == 1
+
+	# Só os jobs mais recentes mantêm o detalhamento
+	tracker.start("j2")
+	tracker.start("j3")
+	assert tracker.get("j2") is None
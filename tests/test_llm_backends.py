@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+import pytest
+
+from services.llm_backends import Backend, BackendPool, NoBackendAvailable
+from services.llm_cache import is_deterministic
+
+
+def test_choose_least_outstanding_and_model():
+	busy = Backend(url="http://a", outstanding=3)
+	idle = Backend(url="http://b")
+	other = Backend(url="http://c", models={"outro"})
+	pool = BackendPool([busy, idle, other])
+
+	assert pool.choose("llama3") is idle
+	assert pool.choose("llama3", exclude=[idle]) is busy
+
+
+def test_prefers_warm_backend_within_slack():
+	warm = Backend(url="http://a", outstanding=2, warm_models={"llama3"})
+	cold = Backend(url="http://b")
+	pool = BackendPool([warm, cold], affinity_slack=2)
+
+	assert pool.choose("llama3") is warm
+	warm.outstanding = 3
+	assert pool.choose("llama3") is cold
+
+
+def test_ejects_after_consecutive_failures():
+	backend = Backend(url="http://a")
+	pool = BackendPool([backend], failure_threshold=2, eject_seconds=60)
+
+	async def fail():
+		async with pool.acquire("llama3"):
+			raise httpx.ConnectError("recusado")
+
+	for _ in range(2):
+		with pytest.raises(httpx.ConnectError):
+			asyncio.run(fail())
+	assert backend.outstanding == 0
+	with pytest.raises(NoBackendAvailable):
+		pool.choose("llama3")
+
+
+def test_ollama_receives_sampling_parameters_in_options():
+	payload = {"model": "llama3", "messages": [], "stream": False, "temperature": 0, "seed": 42}
+
+	ollama = Backend(url="http://ollama:11434").payload(payload)
+	assert ollama == {"model": "llama3", "messages": [], "stream": False, "options": {"temperature": 0, "seed": 42}}
+	assert is_deterministic(ollama)
+
+	openai = Backend(url="https://api.openai.com/v1/chat/completions").payload(payload)
+	assert openai == payload
+
+
+def test_ollama_payload_without_seed_keeps_only_temperature():
+	payload = {"model": "llama3", "messages": [], "temperature": 0.2}
+	ollama = Backend(url="http://ollama:11434").payload(payload)
+	assert ollama["options"] == {"temperature": 0.2}
+	assert not is_deterministic(ollama)
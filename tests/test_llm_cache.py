@@ -0,0 +1,50 @@
+import asyncio
+
+from services.llm_cache import ResponseCache, is_deterministic, request_fingerprint
+
+
+def test_concurrent_requests_share_one_call_and_persist(tmp_path):
+	calls = []
+
+	async def fetch():
+		calls.append(1)
+		await asyncio.sleep(0.01)
+		return {"message": {"content": "ok"}}
+
+	async def scenario():
+		cache = ResponseCache(max_entries=10, ttl_seconds=60, directory=tmp_path)
+		key = request_fingerprint("http://llm/api/chat", {"model": "m", "messages": [], "temperature": 0.0})
+		results = await asyncio.gather(*(cache.get_or_fetch(key, fetch, cacheable=True) for _ in range(3)))
+		hit = await cache.get_or_fetch(key, fetch, cacheable=True)
+		return key, [status for _, status in results], hit[1]
+
+	key, statuses, hit_status = asyncio.run(scenario())
+	assert len(calls) == 1
+	assert sorted(statuses) == ["miss", "shared", "shared"]
+	assert hit_status == "hit"
+
+	reloaded = ResponseCache(max_entries=10, ttl_seconds=60, directory=tmp_path)
+	assert reloaded.stats()["entries"] == 1
+	assert asyncio.run(reloaded.get_or_fetch(key, fetch, cacheable=True))[1] == "hit"
+
+
+def test_non_deterministic_responses_are_not_stored():
+	async def fetch():
+		return {"content": "talvez"}
+
+	async def scenario():
+		cache = ResponseCache(max_entries=10, ttl_seconds=60)
+		await cache.get_or_fetch("k", fetch, cacheable=False)
+		return await cache.get_or_fetch("k", fetch, cacheable=False)
+
+	assert asyncio.run(scenario())[1] == "miss"
+
+
+def test_only_greedy_or_seeded_requests_are_deterministic():
+	assert is_deterministic({"temperature": 0})
+	assert is_deterministic({"temperature": 0.7, "seed": 42})
+	assert not is_deterministic({"temperature": 0.2})
+	assert not is_deterministic({"temperature": 0.01})
+	# Formato do Ollama: os parâmetros vão em "options"
+	assert is_deterministic({"options": {"temperature": 0}})
+	assert not is_deterministic({"options": {"temperature": 0.2}})
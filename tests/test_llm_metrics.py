@@ -0,0 +1,30 @@
+from services.llm_metrics import InferenceMetrics
+
+
+def test_observe_ollama_stats():
+	metrics = InferenceMetrics(model_load_threshold_ms=500)
+	raw = {
+		"prompt_eval_count": 100,
+		"prompt_eval_duration": 500_000_000,
+		"eval_count": 50,
+		"eval_duration": 1_000_000_000,
+		"load_duration": 2_000_000_000,
+	}
+	metrics.observe_inference("llama3", "orchestrator", raw, wall_ms=4000)
+
+	labels = {"model": "llama3", "caller": "orchestrator"}
+	assert metrics.prompt_tokens.value(**labels) == 100
+	assert metrics.generation_tokens.value(**labels) == 50
+	assert metrics.model_loads.value(**labels) == 1
+	assert metrics.time_to_first_token.count(**labels) == 1
+	assert metrics.queue_seconds.count(**labels) == 1
+
+
+def test_render_prometheus_text():
+	metrics = InferenceMetrics()
+	metrics.observe_inference("llama3", "orchestrator", {"eval_count": 10, "eval_duration": 500_000_000}, wall_ms=800)
+	text = metrics.render()
+
+	assert 'llm_generation_tokens_per_second_bucket{caller="orchestrator",model="llama3",le="20"} 1' in text
+	assert 'llm_time_to_first_token_seconds_count{caller="orchestrator",model="llama3"} 1' in text
+	assert metrics.model_loads.value(model="llama3", caller="orchestrator") == 0
@@ -0,0 +1,25 @@
+import json
+
+from services.llm_service import parse_stream_line
+
+
+def test_parses_ollama_ndjson_lines():
+	chunk = parse_stream_line(json.dumps({"message": {"role": "assistant", "content": "Olá"}, "done": False}))
+	assert chunk["content"] == "Olá" and not chunk["done"]
+
+	last = parse_stream_line(json.dumps({
+		"message": {"content": "", "tool_calls": [{"function": {"name": "web_search", "arguments": {"query": "x"}}}]},
+		"done": True,
+		"eval_count": 12,
+	}))
+	assert last["done"]
+	assert last["tool_calls"][0]["name"] == "web_search"
+	assert json.loads(last["tool_calls"][0]["arguments"]) == {"query": "x"}
+
+
+def test_parses_openai_sse_lines():
+	delta = {"choices": [{"delta": {"tool_calls": [{"index": 0, "id": "c1", "function": {"name": "web_search", "arguments": "{\"qu"}}]}}]}
+	chunk = parse_stream_line(f"data: {json.dumps(delta)}")
+	assert chunk["tool_calls"][0]["arguments"] == "{\"qu"
+	assert parse_stream_line("data: [DONE]")["done"]
+	assert parse_stream_line(": keep-alive") is None
@@ -0,0 +1,75 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from langchain_core.tools import StructuredTool
+
+from tools import __all_tools__ as registry
+
+
+async def slow_lookup(query: str) -> str:
+	await asyncio.sleep(0.1)
+	return f"lento:{query}"
+
+
+async def fast_lookup(query: str) -> str:
+	return f"rápido:{query}"
+
+
+def blocking_lookup(query: str) -> str:
+	time.sleep(1)
+	return "tarde demais"
+
+
+def broken_lookup(query: str) -> str:
+	raise RuntimeError("serviço fora do ar")
+
+
+@pytest.fixture(autouse=True)
+def fake_tools(monkeypatch):
+	for name, kwargs in {
+		"slow_lookup": {"coroutine": slow_lookup},
+		"fast_lookup": {"coroutine": fast_lookup},
+		"blocking_lookup": {"func": blocking_lookup},
+		"broken_lookup": {"func": broken_lookup},
+	}.items():
+		monkeypatch.setitem(registry.TOOLS_BY_NAME, name, StructuredTool.from_function(name=name, description=name, **kwargs))
+
+
+def tool_call(name, call_id):
+	return {"name": name, "args": {"query": "x"}, "id": call_id}
+
+
+def run_parallel(calls, timeout=5.0):
+	"""Executa as chamadas como o tool_node do agent_graph: todas ao mesmo tempo, via gather."""
+	executor = ThreadPoolExecutor(max_workers=2)
+
+	async def scenario():
+		return await asyncio.gather(*(registry.acall_tool(call, executor, timeout) for call in calls))
+
+	try:
+		return asyncio.run(scenario())
+	finally:
+		executor.shutdown(wait=False)
+
+
+def test_results_follow_call_order_when_tools_finish_out_of_order():
+	results = run_parallel([tool_call("slow_lookup", "1"), tool_call("fast_lookup", "2")])
+
+	assert [r.tool_call_id for r in results] == ["1", "2"]
+	assert [r.content for r in results] == ["lento:x", "rápido:x"]
+
+
+def test_timeout_and_exception_become_tool_errors_without_failing_the_turn():
+	started_at = time.monotonic()
+	results = run_parallel(
+		[tool_call("blocking_lookup", "1"), tool_call("broken_lookup", "2"), tool_call("fast_lookup", "3")],
+		timeout=0.2,
+	)
+
+	assert time.monotonic() - started_at < 0.9
+	timed_out, failed, ok = results
+	assert timed_out.status == "error" and "não respondeu" in timed_out.content
+	assert failed.status == "error" and "serviço fora do ar" in failed.content
+	assert ok.status == "success" and ok.content == "rápido:x"
@@ -0,0 +1,38 @@
+from assistant.prompt_cache import SystemPromptCache, render_system_prompt
+from config.prompts import SYSTEM_PROMPT
+
+
+def test_render_is_stable_regardless_of_fact_order():
+	assert render_system_prompt(None) == SYSTEM_PROMPT
+	assert render_system_prompt(["b", "a"]) == render_system_prompt(["a", "b"])
+
+
+def test_cache_invalidation_and_ttl():
+	cache = SystemPromptCache(ttl_seconds=60)
+	cache.set("igor", "prompt")
+	assert cache.get("igor") == "prompt"
+	cache.invalidate("igor")
+	assert cache.get("igor") is None
+
+	expired = SystemPromptCache(ttl_seconds=-1)
+	expired.set("igor", "prompt")
+	assert expired.get("igor") is None
+
+
+def test_invalidation_during_a_miss_discards_the_stale_prompt():
+	cache = SystemPromptCache(ttl_seconds=60)
+	assert cache.get("igor") is None
+	generation = cache.generation("igor")
+	# As preferências mudam enquanto o banco ainda está sendo consultado
+	cache.invalidate("igor")
+	assert not cache.set("igor", "prompt velho", generation)
+	assert cache.get("igor") is None
+
+	generation = cache.generation("igor")
+	cache.invalidate("outro")
+	assert cache.set("igor", "prompt novo", generation)
+	assert cache.get("igor") == "prompt novo"
+
+	generation = cache.generation("igor")
+	cache.invalidate()
+	assert not cache.set("igor", "prompt velho", generation)
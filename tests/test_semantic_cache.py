@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+from assistant import semantic_cache
+from assistant.semantic_cache import SemanticResponseCache, normalize_query
+
+
+async def fake_embed(text):
+	# "luz" e "lampada" caem no mesmo eixo: perguntas equivalentes
+	return [1.0 if ("luz" in text or "lampada" in text) else 0.0, 1.0 if "hora" in text else 0.0, 0.1]
+
+
+def make_cache(**kwargs):
+	options = dict(threshold=0.9, ttl_seconds=60, max_entries=10, max_bytes=1 << 20, uncacheable_tools=["open_application"])
+	options.update(kwargs)
+	return SemanticResponseCache(fake_embed, **options)
+
+
+def test_normalize_query():
+	assert normalize_query("  Que HORAS são? ") == "que horas sao"
+
+
+def test_similar_question_hits_and_side_effects_are_skipped():
+	async def scenario():
+		cache = make_cache()
+		assert await cache.lookup("Acende a luz") is None
+		assert await cache.store("Acende a luz", "Pronto.")
+		assert await cache.lookup("acende a lâmpada") == "Pronto."
+		assert await cache.lookup("que horas são") is None
+		assert not await cache.store("abre o firefox", "Abrindo.", tools_used={"open_application"})
+		return cache.stats()
+
+	stats = asyncio.run(scenario())
+	assert stats["hits"] == 1 and stats["skipped"] == 1
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+	clock = SimpleNamespace(now=0.0)
+	monkeypatch.setattr(semantic_cache, "time", SimpleNamespace(monotonic=lambda: clock.now))
+
+	async def scenario():
+		cache = make_cache(max_entries=1)
+		await cache.store("acende a luz", "Pronto.", ttl_seconds=10)
+		clock.now = 10
+		assert await cache.lookup("acende a luz") is None
+		await cache.store("acende a luz", "Pronto.")
+		await cache.store("que horas sao", "Meio-dia.")
+		assert await cache.lookup("acende a luz") is None
+		return cache.stats()
+
+	stats = asyncio.run(scenario())
+	assert stats["entries"] == 1 and stats["evictions"] == 1 and stats["expirations"] == 1
+
+
+def test_entries_are_scoped_by_user():
+	async def scenario():
+		cache = make_cache()
+		assert await cache.store("qual é meu compromisso", "Dentista às 15h.", scope="igor")
+		assert await cache.lookup("qual é meu compromisso", scope="ana") is None
+		assert await cache.lookup("qual é meu compromisso", scope="igor") == "Dentista às 15h."
+
+	asyncio.run(scenario())
+
+
+def test_context_dependent_turns_are_not_stored():
+	async def scenario():
+		cache = make_cache()
+		assert not await cache.store("e a luz da sala", "Já está acesa.", context_dependent=True)
+		assert await cache.lookup("e a luz da sala") is None
+		return cache.stats()
+
+	assert asyncio.run(scenario())["skipped"] == 1
+
+
+def test_ttl_follows_the_tools_used_and_time_dependent_questions():
+	cache = make_cache(
+		ttl_seconds=3600, tool_ttls={"web_search": 300}, volatile_terms=["hoje", "horas"], volatile_ttl_seconds=0
+	)
+	assert cache.ttl_for("acende a luz") == 3600
+	assert cache.ttl_for("quem escreveu dom casmurro", {"web_search"}) == 300
+	assert cache.ttl_for("Que horas são?") == 0
+	assert cache.ttl_for("clima hoje", {"web_search"}) == 0
+
+	async def scenario():
+		assert not await cache.store("Que horas são?", "Meio-dia.")
+		assert await cache.lookup("que horas sao") is None
+
+	asyncio.run(scenario())
@@ -0,0 +1,45 @@
+from assistant.streaming import ChunkSequencer, PartialSequencer, SentenceSegmenter
+
+
+def test_segmenter_emits_complete_sentences():
+	segmenter = SentenceSegmenter(min_chars=10)
+	sentences = []
+	for token in ["Claro, vou abrir", " o navegador agora. ", "Mais alguma", " coisa?"]:
+		sentences.extend(segmenter.feed(token))
+	assert sentences == ["Claro, vou abrir o navegador agora."]
+	assert segmenter.flush() == "Mais alguma coisa?"
+	assert segmenter.flush() is None
+
+
+def test_segmenter_groups_short_sentences():
+	segmenter = SentenceSegmenter(min_chars=10)
+	assert segmenter.feed("Sim. ") == []
+	assert segmenter.feed("Está tudo pronto. ") == ["Sim. Está tudo pronto."]
+
+
+def test_sequencer_reorders_and_skips_failed_chunks():
+	sequencer = ChunkSequencer()
+	assert sequencer.push(1, b"b") == []
+	assert sequencer.push(0, b"a") == [b"a", b"b"]
+	assert sequencer.push(2, None) == []
+	sequencer.close(3)
+	assert sequencer.done
+
+
+def test_partial_sequencer_drops_stale_and_duplicate_partials():
+	partials = PartialSequencer()
+	assert partials.accept("job", 1)
+	assert partials.accept("job", 3)
+	assert not partials.accept("job", 3)
+	assert not partials.accept("job", 2)
+	# Outro job tem a própria sequência
+	assert partials.accept("outro", 1)
+
+
+def test_partial_sequencer_drops_partials_after_final_text():
+	partials = PartialSequencer()
+	assert partials.accept("job", 1)
+	partials.close("job")
+	assert not partials.accept("job", 2)
+	partials.forget("job")
+	assert len(partials) == 0
@@ -0,0 +1,181 @@
+import json
+import queue
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("vosk")
+pytest.importorskip("pika")
+
+from services import stt_service  # noqa: E402
+from services.common.audio_message import AUDIO_CONTENT_TYPE, CODEC_PCM_S16LE, build_audio_headers  # noqa: E402
+
+
+class FakeRecognizer:
+	"""Reconhecedor que "transcreve" cada pedaço como o próprio texto e fecha um trecho a cada 2 pedaços."""
+
+	def __init__(self, model, sample_rate):
+		self.words = []
+		self.accepted = 0
+
+	def SetWords(self, enabled):
+		pass
+
+	def AcceptWaveform(self, pcm):
+		self.words.append(pcm.decode())
+		self.accepted += 1
+		return self.accepted % 2 == 0
+
+	def Result(self):
+		text, self.words = " ".join(self.words), []
+		return json.dumps({"text": text})
+
+	def PartialResult(self):
+		return json.dumps({"partial": " ".join(self.words)})
+
+	def FinalResult(self):
+		return self.Result()
+
+
+@pytest.fixture(autouse=True)
+def fake_vosk(monkeypatch):
+	monkeypatch.setattr(stt_service, "KaldiRecognizer", FakeRecognizer)
+	monkeypatch.setattr(stt_service, "vosk_model", object(), raising=False)
+	stt_service.live_sessions.clear()
+
+
+def live_chunk(job_id, seq, text, end=False, reply_to="r1"):
+	headers = build_audio_headers(job_id, CODEC_PCM_S16LE, 16000, stream_seq=seq, stream_end=end)
+	props = SimpleNamespace(headers=headers, content_type=AUDIO_CONTENT_TYPE, reply_to=reply_to)
+	return props, text.encode()
+
+
+def test_live_stream_is_claimed_then_completed_on_end():
+	published = []
+	publish = lambda routing_key, properties, body: published.append((routing_key, json.loads(body)))
+
+	replies = [
+		stt_service.handle_stt_message(*live_chunk("job", seq, word, end=seq == 2), publish)
+		for seq, word in enumerate(["ola", "tudo", "bem"])
+	]
+
+	assert replies[:2] == [None, None]
+	routing_key, _, body = replies[2]
+	assert routing_key == "stt.completed.r1"
+	assert json.loads(body) == {"job_id": "job", "text": "ola tudo bem"}
+	# Só o primeiro pedaço anuncia a fila desta instância ao orquestrador
+	claims = [payload for key, payload in published if key == "stt.live_claimed.r1"]
+	assert claims == [{"job_id": "job", "queue": stt_service.LIVE_QUEUE}]
+	assert "job" not in stt_service.live_sessions
+
+
+def test_live_stream_without_sample_rate_fails():
+	props, body = live_chunk("job", 0, "ola")
+	del props.headers["sample_rate"]
+
+	routing_key, _, payload = stt_service.handle_stt_message(props, body)
+
+	assert routing_key == "stt.failed.r1"
+	assert json.loads(payload)["job_id"] == "job"
+
+
+def test_partials_are_numbered_and_skip_repeated_text():
+	partials = []
+	recognition = stt_service.LiveRecognition(object(), 16000, lambda seq, text: partials.append((seq, text)))
+
+	# O último pedaço (silêncio) fecha o trecho sem mudar o texto: nenhuma parcial nova
+	for word in ["ola", "tudo", "bem", ""]:
+		recognition.accept(word.encode())
+
+	assert partials == [(1, "ola"), (2, "ola tudo"), (3, "ola tudo bem")]
+	assert recognition.finish() == "ola tudo bem"
+
+
+def test_partials_are_rate_limited(monkeypatch):
+	clock = SimpleNamespace(now=1.0)
+	monkeypatch.setattr(stt_service, "time", SimpleNamespace(monotonic=lambda: clock.now))
+	partials = []
+	recognition = stt_service.LiveRecognition(
+		object(), 16000, lambda seq, text: partials.append((seq, text)), partial_interval_seconds=0.3
+	)
+
+	for now, word in [(1.0, "ola"), (1.1, "tudo"), (1.5, "bem")]:
+		clock.now = now
+		recognition.accept(word.encode())
+
+	# A segunda parcial chega antes do intervalo e é descartada; a numeração não pula
+	assert partials == [(1, "ola"), (2, "ola tudo bem")]
+
+
+class FakeConnection:
+	"""Conexão que guarda os callbacks de add_callback_threadsafe para a "thread da conexão" (a do teste)."""
+
+	def __init__(self):
+		self.callbacks = queue.Queue()
+
+	def add_callback_threadsafe(self, callback):
+		self.callbacks.put(callback)
+
+
+class FakeChannel:
+	def __init__(self):
+		self.calls = []
+
+	def basic_publish(self, exchange, routing_key, properties, body):
+		self.calls.append(("publish", routing_key, threading.current_thread()))
+
+	def basic_ack(self, delivery_tag):
+		self.calls.append(("ack", delivery_tag, threading.current_thread()))
+
+
+def test_pool_acks_on_connection_thread_and_keeps_streams_on_one_thread(monkeypatch):
+	handled = []
+
+	def fake_handle(props, body, publish=None):
+		seq = props.headers.get("stream_seq")
+		handled.append((props.headers["job_id"], seq, threading.current_thread().name))
+		if seq == 0:
+			publish("stt.live_claimed.r1", None, b"{}")
+		if seq is None or props.headers.get("stream_end"):
+			return "stt.completed.r1", None, body
+		return None
+
+	monkeypatch.setattr(stt_service, "handle_stt_message", fake_handle)
+	connection, channel = FakeConnection(), FakeChannel()
+	pool = stt_service.RecognitionPool(connection, workers=3, stream_idle_timeout_seconds=60)
+
+	messages = [live_chunk(job_id, seq, "x", end=seq == 3) for seq in range(4) for job_id in ("a", "b")]
+	messages.append((SimpleNamespace(headers={"job_id": "avulso"}, content_type=None, reply_to="r1"), b"x"))
+	for tag, (props, body) in enumerate(messages):
+		pool.on_message(channel, SimpleNamespace(delivery_tag=tag), props, body)
+
+	# A thread do teste faz o papel da thread da conexão: só ela mexe no canal
+	acks = 0
+	while acks < len(messages):
+		connection.callbacks.get(timeout=5)()
+		acks = sum(1 for call in channel.calls if call[0] == "ack")
+
+	assert all(thread is threading.current_thread() for _, _, thread in channel.calls)
+	assert sorted(tag for kind, tag, _ in channel.calls if kind == "ack") == list(range(len(messages)))
+	published = [key for kind, key, _ in channel.calls if kind == "publish"]
+	assert published.count("stt.live_claimed.r1") == 2
+	assert published.count("stt.completed.r1") == 3
+	for job_id in ("a", "b"):
+		chunks = [(seq, thread) for job, seq, thread in handled if job == job_id]
+		assert [seq for seq, _ in chunks] == [0, 1, 2, 3]
+		assert len({thread for _, thread in chunks}) == 1
+	assert pool._stream_owner == {}
+	assert pool._pending == [0, 0, 0]
+
+
+def test_chunk_of_a_dropped_stream_fails_instead_of_restarting():
+	stt_service.handle_stt_message(*live_chunk("job", 0, "ola"))
+	# O stream ficou inativo e foi descartado antes do próximo pedaço
+	stt_service.live_sessions.clear()
+
+	routing_key, _, payload = stt_service.handle_stt_message(*live_chunk("job", 1, "tudo", end=True))
+
+	assert routing_key == "stt.failed.r1"
+	assert json.loads(payload)["job_id"] == "job"
+	assert "job" not in stt_service.live_sessions
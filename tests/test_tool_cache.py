@@ -0,0 +1,41 @@
+import asyncio
+
+from tools.tool_cache import CachePolicy, ToolResultCache, fold_text_args
+
+
+def test_identical_concurrent_calls_share_one_execution():
+	calls = []
+
+	async def run():
+		calls.append(1)
+		await asyncio.sleep(0.01)
+		return ["resultado"]
+
+	async def scenario():
+		cache = ToolResultCache(max_entries=10)
+		policy = CachePolicy(ttl_seconds=60, normalize=fold_text_args)
+		key = cache.make_key("web_search", {"query": "Clima  hoje"}, policy)
+		assert key == cache.make_key("web_search", {"query": "clima hoje"}, policy)
+		results = await asyncio.gather(*(cache.get_or_run(key, policy, run) for _ in range(3)))
+		await asyncio.sleep(0)
+		assert await cache.get_or_run(key, policy, run) == "['resultado']"
+		return results, cache.stats()
+
+	results, stats = asyncio.run(scenario())
+	assert results == ["['resultado']"] * 3
+	assert len(calls) == 1
+	assert stats["shared"] == 2 and stats["hits"] == 1
+
+
+def test_errors_are_not_cached():
+	async def failing():
+		return "Erro ao consultar a memória do grafo: offline"
+
+	async def scenario():
+		cache = ToolResultCache(max_entries=10)
+		policy = CachePolicy(ttl_seconds=60)
+		await cache.get_or_run("k", policy, failing)
+		await asyncio.sleep(0)
+		return cache.stats()
+
+	assert asyncio.run(scenario())["entries"] == 0
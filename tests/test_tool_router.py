@@ -0,0 +1,46 @@
+import asyncio
+
+from assistant.tool_router import ToolRouter
+
+TOPICS = ["arquivo", "web", "aplicativo", "grafo"]
+
+
+async def embed_query(text):
+	return [1.0 if topic in text else 0.0 for topic in TOPICS]
+
+
+async def embed_documents(texts):
+	return [await embed_query(text) for text in texts]
+
+
+def test_selects_top_k_plus_pinned_in_index_order():
+	async def scenario():
+		router = ToolRouter(embed_documents, embed_query, top_k=1, pinned=["open_application"])
+		assert await router.select("qualquer coisa") is None
+		await router.index({
+			"list_directory_contents": "lista os arquivo de uma pasta",
+			"open_application": "abre um aplicativo",
+			"web_search": "busca na web",
+			"query_knowledge_graph": "consulta o grafo",
+		})
+		return await router.select("pesquise na web")
+
+	assert asyncio.run(scenario()) == ("open_application", "web_search")
+
+
+def test_action_tools_survive_routing_for_unrelated_messages():
+	from tools.__all_tools__ import ACTION_TOOLS
+
+	async def scenario():
+		router = ToolRouter(embed_documents, embed_query, top_k=1, pinned=ACTION_TOOLS)
+		await router.index({
+			"list_directory_contents": "lista os arquivo de uma pasta",
+			"open_application": "abre um programa",
+			"web_search": "busca na web",
+			"query_knowledge_graph": "consulta o grafo",
+		})
+		return await router.select("consulte o grafo"), await router.select("abre o navegador")
+
+	for_graph, for_open = asyncio.run(scenario())
+	assert "open_application" in for_graph and "query_knowledge_graph" in for_graph
+	assert "open_application" in for_open
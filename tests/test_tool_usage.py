@@ -0,0 +1,40 @@
+import asyncio
+
+from langchain_core.messages import ToolMessage
+
+from assistant.tool_usage import ToolUsageWriter
+
+
+class FakeSession:
+	def __init__(self, batches):
+		self.batches = batches
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, *exc):
+		return False
+
+	async def execute(self, statement, rows):
+		self.batches.append(list(rows))
+
+	async def commit(self):
+		pass
+
+
+def test_records_are_written_in_batches_with_status():
+	batches = []
+	writer = ToolUsageWriter(lambda: FakeSession(batches), batch_size=2)
+	writer.set_tool_ids({"web_search": 3})
+
+	ok = ToolMessage(content="resultado", tool_call_id="1")
+	failed = ToolMessage(content="Erro", tool_call_id="2", status="error")
+	writer.record(10, {"name": "web_search", "args": {"q": "a"}}, ok)
+	writer.record(10, {"name": "web_search", "args": {"q": "b"}}, failed)
+	writer.record(10, {"name": "web_search", "args": {"q": "c"}}, ok)
+	writer.record(10, {"name": "desconhecida", "args": {}}, ok)
+
+	asyncio.run(writer.flush())
+	assert [len(batch) for batch in batches] == [2, 1]
+	assert [row["status"] for row in batches[0]] == ["success", "error"]
+	assert writer.stats() == {"pending": 0, "written": 3, "failed": 0, "dropped": 1}
@@ -0,0 +1,24 @@
+from services.tts_cache import AudioCache, cache_key
+
+
+def test_key_depends_on_voice_and_model():
+	base = cache_key("Olá", "pt", None, "xtts_v2")
+	assert base == cache_key(" Olá ", "pt", None, "xtts_v2")
+	assert base != cache_key("Olá", "pt", "outra-voz", "xtts_v2")
+	assert base != cache_key("Olá", "en", None, "xtts_v2")
+
+
+def test_memory_and_disk_tiers(tmp_path):
+	cache = AudioCache(tmp_path, memory_max_bytes=10, disk_max_bytes=10)
+	cache.put("aa1", b"123456")
+	cache.put("bb2", b"abcdef")
+	# Memória e disco só comportam um dos dois; o mais antigo sai
+	assert cache.stats()["memory_entries"] == 1
+	assert cache.stats()["disk_entries"] == 1
+	assert cache.get("aa1") is None
+	assert cache.get("bb2") == b"abcdef"
+
+	# Um novo processo encontra o áudio no disco
+	reopened = AudioCache(tmp_path, memory_max_bytes=10, disk_max_bytes=10)
+	assert reopened.get("bb2") == b"abcdef"
+	assert reopened.stats()["disk_hits"] == 1
@@ -1,11 +1,24 @@
 """Registro de ferramentas disponíveis para o agente."""
 from __future__ import annotations
 
+import asyncio
+from concurrent.futures import Executor
+
 from langchain_core.tools import BaseTool, tool
 from langchain.tools import Tool
 from langchain_core.messages import ToolMessage
 from typing import List
 
+from config.settings import settings
+
+from .tool_cache import (
+    NO_CACHE,
+    CachePolicy,
+    ToolResultCache,
+    fold_text_args,
+    normalize_path_args,
+    strip_text_args,
+)
 from .file_system_tools import list_directory_contents
 from .system_control_tools import open_application
 from .web_search_tools import web_search
@@ -22,6 +35,31 @@ def get_all_tools() -> List:
 		query_knowledge_graph,
 	]
 
+# Mapa nome -> ferramenta, montado uma única vez na importação
+TOOLS_BY_NAME = {t.name: t for t in get_all_tools()}
+
+def get_tool(name: str):
+    """Retorna a ferramenta registrada com esse nome (ou None)."""
+    return TOOLS_BY_NAME.get(name)
+
+# Política de cache de cada ferramenta. Ferramentas fora deste mapa não são
+# memoizadas; as que têm efeito colateral precisam executar sempre.
+TOOL_CACHE_POLICIES: dict[str, CachePolicy] = {
+    "list_directory_contents": CachePolicy(ttl_seconds=30, normalize=normalize_path_args),
+    "web_search": CachePolicy(ttl_seconds=15 * 60, normalize=fold_text_args),
+    # O embedding da busca é sensível a maiúsculas: só os espaços são normalizados
+    "search_knowledge_base": CachePolicy(ttl_seconds=60 * 60, normalize=strip_text_args),
+    "query_knowledge_graph": CachePolicy(ttl_seconds=5 * 60, normalize=fold_text_args),
+    "open_application": NO_CACHE,
+}
+
+# Ferramentas de ação (efeito colateral no sistema do usuário): ficam sempre
+# vinculadas ao LLM, mesmo com o roteamento de ferramentas ligado, para que um
+# pedido como "abre o navegador" nunca perca a ferramenta por similaridade baixa.
+ACTION_TOOLS = frozenset({"open_application"})
+
+tool_result_cache = ToolResultCache(max_entries=settings.orchestrator.tool_cache_max_entries)
+
 def call_tool(tool_call: dict) -> ToolMessage:
     """
     Executa uma ferramenta com base no dicionário de chamada de ferramenta do LangChain.
@@ -32,14 +70,14 @@ def call_tool(tool_call: dict) -> ToolMessage:
     Returns:
         Um ToolMessage com o resultado da execução da ferramenta.
     """
-    all_tools = {t.name: t for t in get_all_tools()}
     tool_name = tool_call.get("name")
-    tool_to_call = all_tools.get(tool_name)
+    tool_to_call = get_tool(tool_name)
 
     if not tool_to_call:
         return ToolMessage(
             content=f"Erro: A ferramenta '{tool_name}' não foi encontrada.",
             tool_call_id=tool_call.get("id"),
+            status="error",
         )
 
     try:
@@ -52,7 +90,64 @@ def call_tool(tool_call: dict) -> ToolMessage:
         return ToolMessage(
             content=f"Erro ao executar a ferramenta '{tool_name}': {e}",
             tool_call_id=tool_call.get("id"),
+            status="error",
+        )
+
+async def acall_tool(
+    tool_call: dict, executor: Executor | None = None, timeout: float | None = None
+) -> ToolMessage:
+    """
+    Versão assíncrona de ``call_tool``, para executar várias chamadas em paralelo.
+
+    Ferramentas com implementação assíncrona rodam no event loop; as síncronas
+    rodam em ``executor`` (um pool limitado de threads). Se a ferramenta não
+    terminar em ``timeout`` segundos, o agente recebe uma mensagem de erro. A
+    thread de uma ferramenta síncrona não pode ser interrompida e continua
+    ocupando o pool até a ferramenta retornar.
+
+    Resultados de ferramentas com ``CachePolicy`` são memoizados em
+    ``tool_result_cache``, e chamadas idênticas simultâneas executam uma vez só.
+    """
+    tool_name = tool_call.get("name")
+    tool_to_call = get_tool(tool_name)
+
+    if not tool_to_call:
+        return ToolMessage(
+            content=f"Erro: A ferramenta '{tool_name}' não foi encontrada.",
+            tool_call_id=tool_call.get("id"),
+            status="error",
+        )
+
+    def run():
+        if getattr(tool_to_call, "coroutine", None) is not None:
+            return tool_to_call.ainvoke(tool_call.get("args"))
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(executor, tool_to_call.invoke, tool_call.get("args"))
+
+    try:
+        policy = TOOL_CACHE_POLICIES.get(tool_name, NO_CACHE)
+        if policy.cacheable:
+            key = tool_result_cache.make_key(tool_name, tool_call.get("args"), policy)
+            pending = tool_result_cache.get_or_run(key, policy, run)
+        else:
+            pending = run()
+        output = await asyncio.wait_for(pending, timeout)
+        return ToolMessage(
+            content=str(output),
+            tool_call_id=tool_call.get("id"),
+        )
+    except asyncio.TimeoutError:
+        return ToolMessage(
+            content=f"Erro: A ferramenta '{tool_name}' não respondeu em {timeout:g} segundos.",
+            tool_call_id=tool_call.get("id"),
+            status="error",
+        )
+    except Exception as e:
+        return ToolMessage(
+            content=f"Erro ao executar a ferramenta '{tool_name}': {e}",
+            tool_call_id=tool_call.get("id"),
+            status="error",
         )
 
 
-__all__ = ["get_all_tools"]
+__all__ = ["get_all_tools", "get_tool", "tool_result_cache"]
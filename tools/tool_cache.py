@@ -0,0 +1,120 @@
+"""Memoização dos resultados das ferramentas, com TTL por ferramenta e execução única."""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+
+def fold_text_args(args: dict[str, Any]) -> dict[str, Any]:
+    """Normaliza argumentos de texto: minúsculas e espaços únicos."""
+    return {k: " ".join(v.lower().split()) if isinstance(v, str) else v for k, v in args.items()}
+
+
+def strip_text_args(args: dict[str, Any]) -> dict[str, Any]:
+    """Normaliza apenas os espaços dos argumentos de texto (preserva maiúsculas)."""
+    return {k: " ".join(v.split()) if isinstance(v, str) else v for k, v in args.items()}
+
+
+def normalize_path_args(args: dict[str, Any]) -> dict[str, Any]:
+    """Normaliza caminhos (``a/./b/`` e ``a/b`` são o mesmo diretório)."""
+    return {k: os.path.normpath(v.strip()) if isinstance(v, str) else v for k, v in args.items()}
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """
+    Como o resultado de uma ferramenta pode ser reaproveitado.
+
+    Ferramentas com efeito colateral (ex: ``open_application``) usam
+    ``NO_CACHE``: cada chamada precisa executar de verdade.
+    """
+    ttl_seconds: float = 0.0
+    normalize: Callable[[dict[str, Any]], dict[str, Any]] | None = None
+    max_entry_bytes: int = 64 * 1024
+    cacheable: bool = True
+
+
+NO_CACHE = CachePolicy(cacheable=False)
+
+
+def _looks_like_error(output: str) -> bool:
+    # As ferramentas devolvem falhas como texto ("Erro ..."), que não deve ser guardado
+    return output.lstrip("['\"").startswith("Erro")
+
+
+class ToolResultCache:
+    """
+    Guarda a saída (texto) das ferramentas por (nome, argumentos normalizados).
+
+    Chamadas idênticas simultâneas compartilham uma única execução: a primeira
+    inicia a execução e as demais aguardam o mesmo resultado. A execução não é
+    cancelada quando um chamador desiste (timeout), e o resultado ainda entra
+    no cache para as próximas chamadas.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    @staticmethod
+    def make_key(tool_name: str, args: dict[str, Any] | None, policy: CachePolicy) -> str:
+        args = args or {}
+        if policy.normalize:
+            args = policy.normalize(args)
+        return f"{tool_name}:{json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)}"
+
+    async def get_or_run(self, key: str, policy: CachePolicy, run: Callable[[], Awaitable[Any]]) -> str:
+        """Retorna a saída guardada ou executa ``run`` (uma única vez por chave em andamento)."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, output = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return output
+            del self._entries[key]
+
+        execution = self._inflight.get(key)
+        if execution is None:
+            self.misses += 1
+            execution = asyncio.ensure_future(self._execute(run))
+            self._inflight[key] = execution
+            execution.add_done_callback(lambda done: self._finish(key, policy, done))
+        else:
+            self.shared += 1
+        # shield: o timeout de um chamador não cancela a execução compartilhada
+        return await asyncio.shield(execution)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+        }
+
+    @staticmethod
+    async def _execute(run: Callable[[], Awaitable[Any]]) -> str:
+        return str(await run())
+
+    def _finish(self, key: str, policy: CachePolicy, execution: asyncio.Future) -> None:
+        self._inflight.pop(key, None)
+        if execution.cancelled() or execution.exception() is not None:
+            return
+        output = execution.result()
+        if len(output.encode("utf-8")) > policy.max_entry_bytes or _looks_like_error(output):
+            return
+        self._entries[key] = (time.monotonic() + policy.ttl_seconds, output)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)